@@ -0,0 +1,92 @@
+"""
+Benchmark response building for recommendation lists
+
+Compares the pydantic path (MovieRecommendation objects validated and
+serialised like FastAPI's response_model) with the pre-serialised catalog
+fragments used by the endpoints. No database is needed.
+
+Usage:
+    python benchmark_responses.py --movies 10000 --size 20 --repeat 2000
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+from typing import List
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from catalog import MovieCatalog, render_rows
+from models import MovieRecommendation, RecommendationRow
+
+
+def build_catalog(n_movies: int) -> MovieCatalog:
+    genres = ["Drama", "Comedy", "Action", "Sci-Fi", "Horror", "Romance", "Thriller", "Animation"]
+    return MovieCatalog(
+        SimpleNamespace(
+            id=movie_id,
+            title=f"Movie {movie_id}",
+            genre=", ".join(random.sample(genres, random.randint(1, 3))),
+            release_year=random.randint(1950, 2024),
+            duration=random.randint(80, 200),
+            description=f"Description of movie {movie_id} " * 4
+        )
+        for movie_id in range(1, n_movies + 1)
+    )
+
+
+def pydantic_response(catalog: MovieCatalog, rows: List[RecommendationRow], adapter: TypeAdapter) -> bytes:
+    """Previous path: build models from records, then validate and serialise against response_model"""
+    recommendations = [
+        MovieRecommendation(
+            **catalog.records[row.movie_id],
+            predicted_rating=row.predicted_rating,
+            similarity_score=row.similarity_score,
+            cluster_id=row.cluster_id
+        )
+        for row in rows
+    ]
+    content = adapter.dump_python(adapter.validate_python(recommendations), mode="json")
+    return JSONResponse(content).body
+
+
+def fast_response(catalog: MovieCatalog, rows: List[RecommendationRow]) -> bytes:
+    """Current path: assemble pre-serialised fragments"""
+    return render_rows(rows, catalog.fragments)
+
+
+def time_per_call(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--movies", type=int, default=10000, help="Catalog size")
+    parser.add_argument("--size", type=int, default=20, help="Recommendations per response")
+    parser.add_argument("--repeat", type=int, default=2000, help="Responses built per path")
+    args = parser.parse_args()
+
+    random.seed(42)
+    catalog = build_catalog(args.movies)
+    adapter = TypeAdapter(List[MovieRecommendation])
+    rows = [
+        RecommendationRow(movie_id, predicted_rating=random.uniform(0, 5))
+        for movie_id in random.sample(range(1, args.movies + 1), args.size)
+    ]
+
+    assert pydantic_response(catalog, rows, adapter) == fast_response(catalog, rows)
+
+    before = time_per_call(lambda: pydantic_response(catalog, rows, adapter), args.repeat)
+    after = time_per_call(lambda: fast_response(catalog, rows), args.repeat)
+    print(f"Top-{args.size} response build time ({args.repeat} runs, {args.movies} movies)")
+    print(f"  pydantic response_model: {before:8.1f} us")
+    print(f"  pre-serialised fragments: {after:8.1f} us")
+    print(f"  speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import math
+import os
+import sqlite3
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Optional
+
+from models import RecommendationRow
+
+# movie_id, predicted_rating, similarity_score, cluster_id (NaN / _NO_CLUSTER for None)
+_ROW = struct.Struct("<iddi")
+_NO_CLUSTER = -2 ** 31
+
+
+def encode_rows(rows: List[RecommendationRow]) -> bytes:
+    """Pack result rows into a compact binary value (24 bytes per row)"""
+    nan = float("nan")
+    return b"".join(
+        _ROW.pack(
+            movie_id,
+            nan if predicted_rating is None else predicted_rating,
+            nan if similarity_score is None else similarity_score,
+            _NO_CLUSTER if cluster_id is None else cluster_id
+        )
+        for movie_id, predicted_rating, similarity_score, cluster_id in rows
+    )
+
+
+def decode_rows(value: bytes) -> List[RecommendationRow]:
+    """Unpack rows packed by encode_rows()"""
+    return [
+        RecommendationRow(
+            movie_id,
+            None if math.isnan(predicted_rating) else predicted_rating,
+            None if math.isnan(similarity_score) else similarity_score,
+            None if cluster_id == _NO_CLUSTER else cluster_id
+        )
+        for movie_id, predicted_rating, similarity_score, cluster_id in _ROW.iter_unpack(value)
+    ]
+
+
+class CacheBackend(ABC):
+    """Byte-valued cache store; keys are strings scoped by the caller (e.g. with a model fingerprint)"""
+    name = "base"
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Stored value, or None on a miss"""
+
+    @abstractmethod
+    def set(self, key: str, value: bytes):
+        """Store a value, replacing any previous one"""
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache"""
+    name = "memory"
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    On-disk cache shared by every local process, surviving restarts
+
+    Uses SQLite in WAL mode so readers in other processes are not blocked by a
+    writer. The oldest entries are pruned once max_entries is exceeded.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int = 100000, prune_every: int = 1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL, stored_at REAL NOT NULL)"
+            " WITHOUT ROWID"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS ix_results_stored_at ON results (stored_at)")
+        connection.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections are not shared across threads)"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        return None if row is None else bytes(row[0])
+
+    def set(self, key, value):
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO results (key, value, stored_at) VALUES (?, ?, ?)", (key, value, time.time())
+        )
+        connection.commit()
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.prune_every == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """Delete the oldest entries beyond max_entries"""
+        connection = self._connection()
+        (count,) = connection.execute("SELECT COUNT(*) FROM results").fetchone()
+        if count > self.max_entries:
+            connection.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY stored_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+            connection.commit()
+
+
+class TwoTierCache:
+    """
+    L1 in-process cache in front of an optional shared L2
+
+    L2 hits are promoted to L1; writes go to both tiers. L2 errors (e.g. a
+    locked or unavailable database file) are counted and treated as misses.
+    Callers may give L2 its own, broader shared_key when the L1 key depends on
+    process state other processes cannot reproduce.
+    """
+
+    def __init__(self, l1: CacheBackend, l2: Optional[CacheBackend] = None):
+        self.l1 = l1
+        self.l2 = l2
+        self._stats = {'l1_hits': 0, 'l2_hits': 0, 'misses': 0, 'sets': 0, 'l2_errors': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key: str, local_only: bool = False, shared_key: Optional[str] = None) -> Optional[bytes]:
+        """
+        Look a key up in L1, then L2
+
+        Args:
+            key: Cache key
+            local_only: Only check L1 (no disk access, safe on the event loop)
+            shared_key: Key to look up in L2 (defaults to key)
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        value = self.l1.get(key)
+        if value is not None:
+            self._count('l1_hits')
+            return value
+        if local_only:
+            return None
+        if self.l2 is not None:
+            try:
+                value = self.l2.get(key if shared_key is None else shared_key)
+            except sqlite3.Error:
+                self._count('l2_errors')
+            if value is not None:
+                self._count('l2_hits')
+                self.l1.set(key, value)
+                return value
+        self._count('misses')
+        return None
+
+    def set(self, key: str, value: bytes, shared_key: Optional[str] = None):
+        """Store a value in L1 under key and in L2 under shared_key (defaults to key)"""
+        self._count('sets')
+        self.l1.set(key, value)
+        if self.l2 is not None:
+            try:
+                self.l2.set(key if shared_key is None else shared_key, value)
+            except sqlite3.Error:
+                self._count('l2_errors')
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['l1'] = self.l1.name
+        stats['l2'] = self.l2.name if self.l2 is not None else None
+        return stats
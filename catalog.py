@@ -0,0 +1,243 @@
+import copy
+import json
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library encoder
+    orjson = None
+
+MOVIE_FIELDS = ('id', 'title', 'genre', 'release_year', 'duration', 'description')
+
+# Field order of a serialised MovieRecommendation (MovieBase fields first, then id)
+FRAGMENT_FIELDS = ('title', 'genre', 'release_year', 'duration', 'description', 'id')
+
+
+def dumps(value) -> bytes:
+    """Encode a value as compact UTF-8 JSON, like FastAPI's JSONResponse"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_fragment(record: dict) -> bytes:
+    """
+    Pre-serialise the movie part of a MovieRecommendation
+
+    Returns:
+        The JSON object without its closing brace, ready for the score fields to be appended
+    """
+    return dumps({field: record[field] for field in FRAGMENT_FIELDS})[:-1]
+
+
+def render_rows(rows, fragments: Dict[int, bytes], extra: Optional[Dict[int, bytes]] = None) -> bytes:
+    """
+    Assemble a JSON array of MovieRecommendation objects from pre-serialised fragments
+
+    Args:
+        rows: RecommendationRow-like tuples (movie_id, predicted_rating, similarity_score, cluster_id)
+        fragments: Movie id to fragment from encode_fragment()
+        extra: Additional fragments for movies not in fragments
+
+    Returns:
+        UTF-8 JSON bytes; rows without a fragment are skipped
+    """
+    parts = []
+    for movie_id, predicted_rating, similarity_score, cluster_id in rows:
+        fragment = fragments.get(movie_id)
+        if fragment is None and extra:
+            fragment = extra.get(movie_id)
+        if fragment is None:
+            continue
+        parts.append(b"".join((
+            fragment,
+            b',"predicted_rating":', dumps(predicted_rating),
+            b',"similarity_score":', dumps(similarity_score),
+            b',"cluster_id":', dumps(cluster_id),
+            b'}'
+        )))
+    return b"[" + b",".join(parts) + b"]"
+
+
+def keyset_page(ids: np.ndarray, after: Optional[int], limit: int) -> Tuple[np.ndarray, Optional[int]]:
+    """
+    Take one page of a sorted id array, starting after a cursor id
+
+    Args:
+        ids: Sorted movie ids
+        after: Cursor (last id of the previous page), None for the first page
+        limit: Page size
+
+    Returns:
+        Tuple of (page ids, cursor for the next page or None on the last page)
+    """
+    start = 0 if after is None else int(np.searchsorted(ids, after, side='right'))
+    page = ids[start:start + limit]
+    next_cursor = int(page[-1]) if start + limit < len(ids) else None
+    return page, next_cursor
+
+
+def parse_genres(genre: str) -> List[str]:
+    """Split a comma-separated genre string"""
+    return [g.strip() for g in genre.split(',') if g.strip()]
+
+
+class MovieCatalog:
+    """
+    In-memory movie catalog with a precomputed attribute index
+
+    Genres are parsed once into one boolean mask per genre, and release years and
+    durations are kept as arrays (plus a year-sorted order), so attribute filters
+    are vectorised mask operations instead of per-movie string parsing.
+    """
+
+    def __init__(self, movies):
+        """
+        Args:
+            movies: Iterable of Movie objects (or anything with the Movie fields as attributes)
+        """
+        self.records: Dict[int, dict] = {}
+        self.fragments: Dict[int, bytes] = {}
+        self.genres: List[str] = []
+        self._genre_lookup: Dict[str, str] = {}
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.years = np.zeros(0, dtype=np.int64)
+        self.durations = np.zeros(0, dtype=np.int64)
+        self.genre_masks: Dict[str, np.ndarray] = {}
+        self._append(movies)
+
+    def _append(self, movies):
+        """Parse and index movies after the existing ones (the arrays are replaced, not written to)"""
+        ids, years, durations, movie_genres = [], [], [], []
+        for movie in movies:
+            record = {field: getattr(movie, field) for field in MOVIE_FIELDS}
+            self.records[record['id']] = record
+            self.fragments[record['id']] = encode_fragment(record)
+            ids.append(record['id'])
+            years.append(record['release_year'])
+            durations.append(record['duration'])
+            genres = parse_genres(record['genre'])
+            for genre in genres:
+                if genre.lower() not in self._genre_lookup:
+                    self._genre_lookup[genre.lower()] = genre
+                    self.genres.append(genre)
+            movie_genres.append(genres)
+
+        # Catalog positions follow the given order; ids are looked up through a sorted copy
+        n_existing = len(self.ids)
+        self.ids = np.concatenate([self.ids, np.array(ids, dtype=np.int64)])
+        self._id_order = np.argsort(self.ids, kind='stable')
+        self._sorted_ids = self.ids[self._id_order]
+        self.years = np.concatenate([self.years, np.array(years, dtype=np.int64)])
+        self.durations = np.concatenate([self.durations, np.array(durations, dtype=np.int64)])
+        self.year_order = np.argsort(self.years, kind='stable')
+        self.sorted_years = self.years[self.year_order]
+
+        genre_masks = {genre: np.zeros(len(self.ids), dtype=bool) for genre in self.genres}
+        for genre, mask in self.genre_masks.items():
+            genre_masks[genre][:n_existing] = mask
+        for position, genres in enumerate(movie_genres, start=n_existing):
+            for genre in genres:
+                genre_masks[self._genre_lookup[genre.lower()]][position] = True
+        self.genre_masks = genre_masks
+
+    def extended(self, movies) -> "MovieCatalog":
+        """
+        New catalog with movies appended; this catalog is left unchanged
+
+        Only the new movies are parsed and serialised. Movies already in the
+        catalog are skipped.
+        """
+        catalog = copy.copy(self)
+        catalog.records = dict(self.records)
+        catalog.fragments = dict(self.fragments)
+        catalog.genres = list(self.genres)
+        catalog._genre_lookup = dict(self._genre_lookup)
+        catalog._append([movie for movie in movies if movie.id not in self.records])
+        return catalog
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def positions(self, movie_ids) -> np.ndarray:
+        """
+        Map movie ids to catalog positions
+
+        Returns:
+            Array of positions, -1 for ids that are not in the catalog
+        """
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        if len(self._sorted_ids) == 0:
+            return np.full(len(movie_ids), -1, dtype=np.int64)
+        found = np.clip(np.searchsorted(self._sorted_ids, movie_ids), 0, len(self._sorted_ids) - 1)
+        positions = self._id_order[found]
+        return np.where(self._sorted_ids[found] == movie_ids, positions, -1)
+
+    def genre_mask(self, genre: str) -> np.ndarray:
+        """Boolean mask of movies having the given genre (case-insensitive)"""
+        name = self._genre_lookup.get(genre.strip().lower())
+        if name is None:
+            return np.zeros(len(self.ids), dtype=bool)
+        return self.genre_masks[name]
+
+    def year_mask(self, year_min: Optional[int] = None, year_max: Optional[int] = None) -> np.ndarray:
+        """Boolean mask of movies released within [year_min, year_max]"""
+        lo = 0 if year_min is None else np.searchsorted(self.sorted_years, year_min, side='left')
+        hi = len(self.sorted_years) if year_max is None else np.searchsorted(self.sorted_years, year_max, side='right')
+        mask = np.zeros(len(self.ids), dtype=bool)
+        mask[self.year_order[lo:hi]] = True
+        return mask
+
+    def mask(self, genre: Optional[str] = None, year_min: Optional[int] = None,
+             year_max: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        Combine attribute filters into a boolean mask over catalog positions
+
+        Returns:
+            Boolean mask, or None when no filter is given
+        """
+        if genre is None and year_min is None and year_max is None:
+            return None
+        mask = np.ones(len(self.ids), dtype=bool)
+        if genre is not None:
+            mask &= self.genre_mask(genre)
+        if year_min is not None or year_max is not None:
+            mask &= self.year_mask(year_min, year_max)
+        return mask
+
+    def render(self, rows) -> bytes:
+        """Serialise result rows of catalog movies as a JSON array (see render_rows)"""
+        return render_rows(rows, self.fragments)
+
+    def render_movies(self, movie_ids) -> bytes:
+        """Serialise catalog movies as a JSON array of MovieResponse objects"""
+        return b"[" + b",".join(self.fragments[movie_id] + b"}" for movie_id in np.asarray(movie_ids).tolist()) + b"]"
+
+    def render_ndjson(self, movie_ids) -> bytes:
+        """Serialise catalog movies as newline-delimited MovieResponse objects"""
+        return b"".join(self.fragments[movie_id] + b"}\n" for movie_id in np.asarray(movie_ids).tolist())
+
+    def render_extended(self, items) -> bytes:
+        """
+        Serialise catalog movies with extra fields appended (e.g. TrendingMovie objects)
+
+        Args:
+            items: (movie_id, dict of extra fields) tuples; movies not in the catalog are skipped
+        """
+        return b"[" + b",".join(
+            self.fragments[movie_id] + b"," + dumps(extra)[1:]
+            for movie_id, extra in items if movie_id in self.fragments
+        ) + b"]"
+
+    @staticmethod
+    def align(mask: Optional[np.ndarray], positions: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Align a catalog mask to other positions (e.g. matrix columns) from positions()
+
+        Movies missing from the catalog never pass a filter.
+        """
+        if mask is None:
+            return None
+        return np.where(positions >= 0, mask[positions], False)
@@ -0,0 +1,132 @@
+import multiprocessing
+import os
+import queue
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.metrics import silhouette_score
+
+
+def _score_k(features: np.ndarray, k: int, random_state: int) -> Tuple[int, float, float, float]:
+    """
+    Fit KMeans with k clusters on the (sampled) features
+
+    Returns:
+        Tuple of (k, silhouette score, inertia, seconds)
+    """
+    start = time.perf_counter()
+    kmeans = KMeans(n_clusters=k, random_state=random_state)
+    labels = kmeans.fit_predict(features)
+    silhouette = silhouette_score(features, labels) if len(set(labels)) > 1 else -1.0
+    return k, float(silhouette), float(kmeans.inertia_), time.perf_counter() - start
+
+
+def elbow(ks: np.ndarray, inertias: np.ndarray) -> int:
+    """
+    Pick the elbow of an inertia curve
+
+    The elbow is the point farthest from the straight line between the first and
+    last points, after scaling both axes to [0, 1].
+    """
+    if len(ks) < 3:
+        return int(ks[0])
+    x = (ks - ks[0]) / (ks[-1] - ks[0])
+    spread = inertias[0] - inertias[-1]
+    y = (inertias - inertias[-1]) / spread if spread > 0 else np.zeros(len(ks))
+    # Distance to the chord from (0, 1) to (1, 0)
+    return int(ks[np.argmax(np.abs(x + y - 1))])
+
+
+class ClusterSearch:
+    """
+    Choose the KMeans cluster count for movie features within a time budget
+
+    Every candidate count is fitted on a random sample of the movies in a
+    process pool, smallest counts first. Counts not finished when the budget
+    runs out are skipped and their workers terminated, so no fit keeps using
+    cores past the budget. Workers are spawned rather than forked, since the
+    search runs inside a threaded server.
+    """
+
+    def __init__(self, k_min: int = 2, k_max: int = 12, metric: str = "silhouette",
+                 sample_size: int = 5000, time_budget: float = 10.0,
+                 n_jobs: Optional[int] = None, random_state: int = 42):
+        """
+        Args:
+            k_min: Smallest cluster count to try
+            k_max: Largest cluster count to try
+            metric: "silhouette" (highest score wins) or "inertia" (elbow of the curve)
+            sample_size: Movies sampled for the search
+            time_budget: Seconds allowed for the whole search
+            n_jobs: Worker processes (defaults to the CPU count)
+            random_state: Seed for sampling and KMeans
+        """
+        if metric not in ("silhouette", "inertia"):
+            raise ValueError(f"Unknown metric: {metric}")
+        self.k_min = k_min
+        self.k_max = k_max
+        self.metric = metric
+        self.sample_size = sample_size
+        self.time_budget = time_budget
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def search(self, features) -> Tuple[Optional[int], dict]:
+        """
+        Evaluate the candidate cluster counts on the features
+
+        Args:
+            features: Scaled feature matrix, one row per movie
+
+        Returns:
+            Tuple of (best cluster count or None if nothing finished in time, search report)
+        """
+        start = time.perf_counter()
+        features = np.asarray(features, dtype=float)
+        if len(features) > self.sample_size:
+            rng = np.random.default_rng(self.random_state)
+            features = features[rng.choice(len(features), self.sample_size, replace=False)]
+        # Silhouette needs at least two clusters and one sample more than clusters
+        ks = list(range(max(self.k_min, 2), min(self.k_max, len(features) - 1) + 1))
+
+        scores = {}
+        if ks:
+            n_jobs = min(self.n_jobs or os.cpu_count() or 1, len(ks))
+            results = queue.Queue()
+            # Leaving the block terminates the pool, killing fits still running past the budget
+            with multiprocessing.get_context("spawn").Pool(processes=n_jobs) as pool:
+                for k in ks:
+                    pool.apply_async(_score_k, (features, k, self.random_state),
+                                     callback=results.put, error_callback=results.put)
+                for _ in ks:
+                    remaining = self.time_budget - (time.perf_counter() - start)
+                    if remaining <= 0:
+                        break
+                    try:
+                        result = results.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if isinstance(result, BaseException):
+                        raise result
+                    k, silhouette, inertia, seconds = result
+                    scores[k] = {'silhouette': silhouette, 'inertia': inertia, 'seconds': seconds}
+
+        best = None
+        if scores:
+            evaluated = np.array(sorted(scores))
+            if self.metric == "silhouette":
+                best = int(max(evaluated, key=lambda k: scores[k]['silhouette']))
+            else:
+                best = elbow(evaluated, np.array([scores[k]['inertia'] for k in evaluated]))
+
+        report = {
+            'metric': self.metric,
+            'sample_size': int(len(features)),
+            'candidates': ks,
+            'scores': {int(k): scores[k] for k in sorted(scores)},
+            'best': best,
+            'seconds': time.perf_counter() - start,
+        }
+        return best, report
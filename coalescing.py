@@ -0,0 +1,94 @@
+import asyncio
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable
+
+from fastapi.concurrency import run_in_threadpool
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical computations into one execution
+
+    The first caller for a key (the leader) runs the computation; callers that
+    arrive while it is in flight wait for the same result, or the same
+    exception, instead of recomputing it. Nothing is cached once the call
+    completes. Sync callers (threadpool endpoints) and async callers share the
+    in-flight table, so a result started on one path also serves the other.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._executed = defaultdict(int)
+        self._coalesced = defaultdict(int)
+
+    def _join(self, name: str, key: Hashable):
+        """
+        Register a caller for a key
+
+        Returns:
+            Tuple of (future, is_leader)
+        """
+        with self._lock:
+            future = self._calls.get((name, key))
+            if future is not None:
+                self._coalesced[name] += 1
+                return future, False
+            future = Future()
+            self._calls[(name, key)] = future
+            self._executed[name] += 1
+            return future, True
+
+    def _finish(self, name: str, key: Hashable, future: Future, fn: Callable):
+        """Run the computation as leader and publish its outcome to the waiting callers"""
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[(name, key)]
+
+    def do(self, name: str, key: Hashable, fn: Callable):
+        """
+        Run fn once for concurrent callers with the same name and key (blocking)
+
+        Args:
+            name: Computation name, used for metrics
+            key: Hashable arguments identifying the result
+            fn: Zero-argument callable computing the result
+
+        Returns:
+            The result of fn, possibly computed by another caller
+        """
+        future, leader = self._join(name, key)
+        if not leader:
+            return future.result()
+        return self._finish(name, key, future, fn)
+
+    async def do_async(self, name: str, key: Hashable, fn: Callable):
+        """
+        Async variant of do(): the leader runs fn in the threadpool, followers await without holding a thread
+        """
+        future, leader = self._join(name, key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        return await run_in_threadpool(self._finish, name, key, future, fn)
+
+    def stats(self) -> dict:
+        """Executed and coalesced call counts per computation name"""
+        with self._lock:
+            return {
+                name: {
+                    'executed': self._executed[name],
+                    'coalesced': self._coalesced[name],
+                    'in_flight': sum(1 for call_name, _ in self._calls if call_name == name),
+                }
+                for name in sorted(set(self._executed) | set(self._coalesced))
+            }
@@ -0,0 +1,175 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from catalog import parse_genres
+
+
+class ContentIndex:
+    """
+    Nearest-neighbour index over scaled movie content features
+
+    Movies are rows of a dense matrix of standardised features (duration,
+    release year and one-hot genres), normalised to unit length, so the cosine
+    similarity of one movie to every other is a single matrix-vector product.
+    Rows live in a buffer with spare capacity; new movies are scaled with the
+    build-time mean and scale and appended without refitting. Genres first seen
+    after the build have no column and are ignored until the next full build.
+    """
+
+    def __init__(self, columns: List[str], mean: np.ndarray, scale: np.ndarray, capacity: int = 1024):
+        """
+        Args:
+            columns: Feature names: 'duration', 'release_year', then one per genre
+            mean: Per-feature mean used for scaling
+            scale: Per-feature standard deviation used for scaling
+            capacity: Initial number of rows to allocate
+        """
+        self.columns = list(columns)
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.where(np.asarray(scale, dtype=float) > 0, scale, 1.0)
+        self._genre_columns: Dict[str, int] = {
+            name.lower(): position for position, name in enumerate(self.columns)
+            if name not in ('duration', 'release_year')
+        }
+        self._year_column = self.columns.index('release_year')
+        self._size = 0
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._raw = np.zeros((capacity, len(self.columns)))
+        self._vectors = np.zeros((capacity, len(self.columns)))
+        self._positions: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, movie_id: int) -> bool:
+        return movie_id in self._positions
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Movie ids in index order"""
+        return self._ids[:self._size]
+
+    def encode(self, genre: str, release_year: int, duration: int) -> np.ndarray:
+        """Raw (unscaled) feature row of a movie, in column order"""
+        row = np.zeros(len(self.columns))
+        row[self.columns.index('duration')] = duration
+        row[self._year_column] = release_year
+        for name in parse_genres(genre):
+            position = self._genre_columns.get(name.lower())
+            if position is not None:
+                row[position] = 1.0
+        return row
+
+    def _grow(self, capacity: int):
+        """Make room for more rows"""
+        grow = capacity - len(self._ids)
+        if grow <= 0:
+            return
+        self._ids = np.pad(self._ids, (0, grow))
+        self._raw = np.pad(self._raw, ((0, grow), (0, 0)))
+        self._vectors = np.pad(self._vectors, ((0, grow), (0, 0)))
+
+    def add(self, movie_ids, raw_features: np.ndarray):
+        """
+        Add or replace movies
+
+        Args:
+            movie_ids: Movie ids
+            raw_features: Unscaled feature rows in column order (see encode())
+        """
+        raw_features = np.atleast_2d(np.asarray(raw_features, dtype=float))
+        vectors = (raw_features - self.mean) / self.scale
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+        with self._lock:
+            for movie_id, raw, vector in zip(np.asarray(movie_ids).tolist(), raw_features, vectors):
+                position = self._positions.get(movie_id)
+                new = position is None
+                if new:
+                    if self._size == len(self._ids):
+                        self._grow(max(2 * len(self._ids), 1))
+                    position = self._size
+                    self._ids[position] = movie_id
+                self._raw[position] = raw
+                self._vectors[position] = vector
+                if new:
+                    # Readers do not take the lock: fill the row, then count it, then publish
+                    # its id, so a reader that finds a position also sees a size past it
+                    self._size += 1
+                    self._positions[movie_id] = position
+
+    def mask(self, genre: Optional[str] = None, year_min: Optional[int] = None,
+             year_max: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        Boolean mask of indexed movies passing the attribute filters
+
+        Returns:
+            Boolean mask in index order, or None when no filter is given
+        """
+        if genre is None and year_min is None and year_max is None:
+            return None
+        size = self._size
+        mask = np.ones(size, dtype=bool)
+        if genre is not None:
+            position = self._genre_columns.get(genre.strip().lower())
+            if position is None:
+                return np.zeros(size, dtype=bool)
+            mask &= self._raw[:size, position] > 0
+        years = self._raw[:size, self._year_column]
+        if year_min is not None:
+            mask &= years >= year_min
+        if year_max is not None:
+            mask &= years <= year_max
+        return mask
+
+    def similarity(self, movie_id: int, other_ids) -> np.ndarray:
+        """
+        Content similarity of a movie to other movies (0 for movies not in the index)
+
+        Raises:
+            ValueError: If the movie is not in the index
+        """
+        position = self._positions.get(movie_id)
+        if position is None:
+            raise ValueError(f"Movie {movie_id} not found in the content index")
+        others = np.array([self._positions.get(other, -1) for other in np.asarray(other_ids).tolist()],
+                          dtype=np.int64)
+        scores = self._vectors[np.maximum(others, 0)] @ self._vectors[position]
+        return np.where(others >= 0, scores, 0.0)
+
+    def neighbors(self, movie_id: int, k: int, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The k movies with the most similar content
+
+        Args:
+            movie_id: Movie to find neighbours for
+            k: Number of neighbours
+            allowed: Boolean mask in index order (from mask()) of movies that may be returned
+
+        Returns:
+            Tuple of (movie ids, cosine similarities), most similar first
+
+        Raises:
+            ValueError: If the movie is not in the index
+        """
+        position = self._positions.get(movie_id)
+        if position is None:
+            raise ValueError(f"Movie {movie_id} not found in the content index")
+        # Read the size after the position and the arrays after the size (see add())
+        size = self._size
+        vectors, ids = self._vectors, self._ids
+        scores = vectors[:size] @ vectors[position]
+        scores[position] = -np.inf  # Skip the movie itself
+        if allowed is not None:
+            # Movies added after the mask was taken are not allowed
+            keep = np.zeros(size, dtype=bool)
+            keep[:min(len(allowed), size)] = allowed[:size]
+            scores[~keep] = -np.inf
+        candidates = np.flatnonzero(np.isfinite(scores))
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        order = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return ids[order].copy(), scores[order]
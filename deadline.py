@@ -0,0 +1,196 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+
+class Deadline:
+    """Latency budget of one request, measured from its creation"""
+
+    def __init__(self, budget_ms: Optional[float]):
+        """
+        Args:
+            budget_ms: Budget in milliseconds (None or <= 0 means unbounded)
+        """
+        self.budget = budget_ms / 1000 if budget_ms and budget_ms > 0 else None
+        self.start = time.perf_counter()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None when unbounded"""
+        if self.budget is None:
+            return None
+        return self.budget - (time.perf_counter() - self.start)
+
+
+class LatencyTracker:
+    """Exponentially weighted moving average of each tier's latency"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self._estimates = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            previous = self._estimates.get(name)
+            self._estimates[name] = seconds if previous is None else (1 - self.alpha) * previous + self.alpha * seconds
+
+    def decay(self, name: str):
+        """Lower a tier's estimate after skipping it, so a recovered tier is tried again"""
+        with self._lock:
+            if name in self._estimates:
+                self._estimates[name] *= 1 - self.alpha
+
+    def estimate(self, name: str) -> Optional[float]:
+        """Expected seconds for the tier, None before its first observation"""
+        return self._estimates.get(name)
+
+
+class StaleResultCache:
+    """
+    Bounded LRU of the last full results, served when a request runs out of budget
+
+    Entries are not invalidated by model updates; a stale result is preferred
+    over a late one.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class OverrunLimit:
+    """
+    Cap on tier calls still running after their request has moved on
+
+    A timed-out tier cannot be cancelled; its thread keeps running until the
+    call returns. While limit calls are overrunning, tiers that could time out
+    are skipped, so overruns cannot take over the threadpool. Used from the
+    event loop only.
+    """
+
+    def __init__(self, limit: int = 8):
+        self.limit = limit
+        self.running = 0
+
+    def full(self) -> bool:
+        return self.running >= self.limit
+
+    def track(self, task: asyncio.Future):
+        """Count a timed-out call that keeps running until its task completes"""
+        self.running += 1
+
+        def finished(task):
+            self.running -= 1
+            if not task.cancelled():
+                # Retrieve the outcome so a late failure is not reported as unhandled
+                task.exception()
+        task.add_done_callback(finished)
+
+
+class Tier:
+    """
+    One way of serving a request, from best to cheapest
+
+    Args:
+        name: Tier name reported to the client
+        fn: Zero-argument callable returning the result, or None when the tier has nothing to serve
+        inline: Run on the event loop without a timeout (for instant lookups)
+        on_late: Called with the result when the tier finishes after its deadline
+    """
+
+    def __init__(self, name: str, fn: Callable, inline: bool = False, on_late: Optional[Callable] = None):
+        self.name = name
+        self.fn = fn
+        self.inline = inline
+        self.on_late = on_late
+
+
+async def serve_within_deadline(tiers: List[Tier], deadline: Deadline,
+                                tracker: Optional[LatencyTracker] = None,
+                                overruns: Optional[OverrunLimit] = None) -> Tuple[str, object]:
+    """
+    Serve from the first tier that answers within the deadline
+
+    A tier is skipped when its expected latency already exceeds the remaining
+    budget, fails, times out or returns None. Each tier's timeout leaves the
+    expected latency of the cheaper tiers after it in reserve. The last tier always runs, without
+    a timeout, so every request gets an answer. A timed-out tier keeps running in
+    its thread; when it completes, its latency is observed and its result handed
+    to on_late. With an overrun limit, tiers that could time out are skipped
+    while the limit is full.
+
+    Returns:
+        Tuple of (name of the tier that served, its result)
+
+    Raises:
+        Whatever the last tier raises
+    """
+    for position, tier in enumerate(tiers):
+        last = position == len(tiers) - 1
+        remaining = deadline.remaining()
+        if remaining is not None and tracker is not None:
+            remaining -= sum(tracker.estimate(later.name) or 0 for later in tiers[position + 1:] if not later.inline)
+        if not last and remaining is not None and not tier.inline:
+            expected = tracker.estimate(tier.name) if tracker is not None else None
+            if remaining <= 0:
+                continue
+            if expected is not None and expected > remaining:
+                tracker.decay(tier.name)
+                continue
+            if overruns is not None and overruns.full():
+                continue
+
+        if tier.inline or last:
+            start = time.perf_counter()
+            result = tier.fn() if tier.inline else await run_in_threadpool(tier.fn)
+            if tracker is not None and not tier.inline:
+                tracker.observe(tier.name, time.perf_counter() - start)
+            if result is not None or last:
+                return tier.name, result
+            continue
+
+        start = time.perf_counter()
+        task = asyncio.ensure_future(run_in_threadpool(tier.fn))
+        done, _ = await asyncio.wait({task}, timeout=remaining)
+        if not done:
+            if overruns is not None:
+                overruns.running += 1
+
+            def finished(task, tier=tier, start=start):
+                if overruns is not None:
+                    overruns.running -= 1
+                if task.cancelled():
+                    return
+                # The overrun is observed once, with its full latency, when it completes
+                if tracker is not None:
+                    tracker.observe(tier.name, time.perf_counter() - start)
+                if task.exception() is None and tier.on_late is not None:
+                    tier.on_late(task.result())
+            task.add_done_callback(finished)
+            continue
+        if task.exception() is not None:
+            print(f"Tier {tier.name} failed: {task.exception()}")
+            continue
+        if tracker is not None:
+            tracker.observe(tier.name, time.perf_counter() - start)
+        if task.result() is not None:
+            return tier.name, task.result()
@@ -0,0 +1,271 @@
+"""
+Offline evaluation of recommendation quality and speed
+
+Builds a leave-last-out split from user_movie_watches (each user's most recently
+watched movies, by watched_at, are held out), trains every configuration on the
+rest and scores the users across a process pool. For each configuration it
+reports precision@k, recall@k, NDCG@k and catalog coverage next to the model
+build time and per-user latency, so performance changes can be judged against
+quality.
+
+Usage:
+    python evaluate.py --k 10 --workers 4
+    python evaluate.py --configs pipeline,exhaustive,pipeline-topk --holdout 2
+"""
+import argparse
+import math
+import os
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import SessionLocal, Base, User, Movie, UserMovieWatch
+from recommender import MovieRecommender
+
+
+def rank_pipeline(recommender: MovieRecommender, user_id: int, k: int) -> List[int]:
+    """Two-stage retrieval and scoring (what /recommendations serves)"""
+    return [movie_id for movie_id, _ in recommender.rank_movies(user_id, k, pipeline=recommender.candidate_pipeline)]
+
+
+def rank_exhaustive(recommender: MovieRecommender, user_id: int, k: int) -> List[int]:
+    """Score every unrated movie"""
+    return [movie_id for movie_id, _ in recommender.rank_movies(user_id, k)]
+
+
+def rank_cluster(recommender: MovieRecommender, user_id: int, k: int) -> List[int]:
+    """Favourite-cluster recommendations (what /cluster-recommendations serves)"""
+    return [movie_id for movie_id, _ in recommender.rank_movies(user_id, k, pipeline=recommender.cluster_pipeline,
+                                                                favourite_cluster_only=True)]
+
+
+def rank_popular(recommender: MovieRecommender, user_id: int, k: int) -> List[int]:
+    """Unrated movies by average rating (baseline)"""
+    matrix = recommender.user_movie_matrix
+    popular = recommender.popular_columns()
+    if user_id in matrix.index:
+        popular = popular[matrix.to_numpy()[matrix.index.get_loc(user_id)][popular] == 0]
+    return [int(movie_id) for movie_id in matrix.columns[popular[:k]]]
+
+
+ENGINES = {
+    'pipeline': rank_pipeline,
+    'exhaustive': rank_exhaustive,
+    'cluster': rank_cluster,
+    'popular': rank_popular,
+}
+
+# Configuration name -> (engine, MovieRecommender options)
+CONFIGS = {
+    'pipeline': ('pipeline', {}),
+    'exhaustive': ('exhaustive', {}),
+    'pipeline-topk': ('pipeline', {'similarity_top_k': 20}),
+    'exhaustive-topk': ('exhaustive', {'similarity_top_k': 20}),
+    'cluster': ('cluster', {}),
+    'popular': ('popular', {}),
+}
+
+
+def leave_last_out(ratings, holdout: int = 1, min_train: int = 1):
+    """
+    Split ratings by holding out each user's most recently watched movies
+
+    Args:
+        ratings: (id, user_id, movie_id, rating, watched_at) rows
+        holdout: Movies held out per user
+        min_train: Ratings a user must keep in the training set to be evaluated
+
+    Returns:
+        Tuple of (training rows, dict of user id to held-out movie ids)
+    """
+    by_user = defaultdict(list)
+    for row in ratings:
+        by_user[row[1]].append(row)
+
+    train, test = [], {}
+    for user_id, rows in by_user.items():
+        if len(rows) < holdout + min_train:
+            train.extend(rows)
+            continue
+        # Missing timestamps sort first; the row id breaks ties in insertion order
+        rows.sort(key=lambda row: (row[4] is not None, row[4] or 0, row[0]))
+        train.extend(rows[:-holdout])
+        test[user_id] = {row[2] for row in rows[-holdout:]}
+    return train, test
+
+
+def write_training_database(path: str, db, train) -> str:
+    """
+    Copy users, movies and the training ratings into a SQLite database
+
+    Returns:
+        SQLAlchemy URL of the training database
+    """
+    url = f"sqlite:///{path}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        users = db.query(User.id, User.username, User.email).all()
+        if users:
+            connection.execute(User.__table__.insert(), [
+                {'id': user_id, 'username': username, 'email': email} for user_id, username, email in users
+            ])
+        movies = db.query(Movie.id, Movie.title, Movie.genre, Movie.release_year, Movie.duration, Movie.description).all()
+        if movies:
+            connection.execute(Movie.__table__.insert(), [row._asdict() for row in movies])
+        if train:
+            connection.execute(UserMovieWatch.__table__.insert(), [
+                {'id': row_id, 'user_id': user_id, 'movie_id': movie_id, 'rating': rating, 'watched_at': watched_at}
+                for row_id, user_id, movie_id, rating, watched_at in train
+            ])
+    engine.dispose()
+    return url
+
+
+def build_recommender(url: str, options: dict) -> MovieRecommender:
+    """Build a recommender on the training database"""
+    return MovieRecommender(db=sessionmaker(bind=create_engine(url))(), **options)
+
+
+# Worker state for the process pool (one model per worker process)
+_worker = None
+
+
+def _init_worker(url: str, engine: str, options: dict):
+    global _worker
+    _worker = (build_recommender(url, options), ENGINES[engine])
+
+
+def _rank_users(user_ids: List[int], k: int) -> List[Tuple[int, List[int], float]]:
+    """Rank movies for a chunk of users, timing each user"""
+    recommender, rank = _worker
+    results = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        movie_ids = rank(recommender, user_id, k)
+        results.append((user_id, movie_ids, time.perf_counter() - start))
+    return results
+
+
+def ranking_metrics(results, test: Dict[int, set], k: int, n_movies: int) -> dict:
+    """
+    Aggregate precision@k, recall@k, NDCG@k and coverage over users
+
+    Args:
+        results: (user_id, recommended movie ids, seconds) tuples
+        test: User id to held-out movie ids
+        k: Cutoff
+        n_movies: Catalog size for coverage
+    """
+    precision, recall, ndcg, latency = [], [], [], []
+    recommended = set()
+    for user_id, movie_ids, seconds in results:
+        relevant = test[user_id]
+        movie_ids = movie_ids[:k]
+        hits = [movie_id in relevant for movie_id in movie_ids]
+        dcg = sum(1 / math.log2(rank + 2) for rank, hit in enumerate(hits) if hit)
+        ideal = sum(1 / math.log2(rank + 2) for rank in range(min(len(relevant), k)))
+        precision.append(sum(hits) / k)
+        recall.append(sum(hits) / len(relevant))
+        ndcg.append(dcg / ideal)
+        latency.append(seconds * 1000)
+        recommended.update(movie_ids)
+
+    latency = np.array(latency) if latency else np.zeros(1)
+    return {
+        'users': len(results),
+        'precision': float(np.mean(precision)) if precision else 0.0,
+        'recall': float(np.mean(recall)) if recall else 0.0,
+        'ndcg': float(np.mean(ndcg)) if ndcg else 0.0,
+        'coverage': len(recommended) / max(n_movies, 1),
+        'latency_mean_ms': float(latency.mean()),
+        'latency_p50_ms': float(np.percentile(latency, 50)),
+        'latency_p95_ms': float(np.percentile(latency, 95)),
+    }
+
+
+def evaluate_config(url: str, engine: str, options: dict, test: Dict[int, set], k: int, workers: int) -> dict:
+    """
+    Build one configuration and score every test user
+
+    Returns:
+        Dict of ranking metrics, build time and latency percentiles
+    """
+    start = time.perf_counter()
+    recommender = build_recommender(url, options)
+    build_seconds = time.perf_counter() - start
+    n_movies = len(recommender.catalog)
+
+    user_ids = sorted(test)
+    if workers <= 1:
+        global _worker
+        _worker = (recommender, ENGINES[engine])
+        results = _rank_users(user_ids, k)
+    else:
+        # Each worker builds its own model once; users are split into one chunk per task
+        chunk = max(1, math.ceil(len(user_ids) / (workers * 4)))
+        chunks = [user_ids[i:i + chunk] for i in range(0, len(user_ids), chunk)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(url, engine, options)) as executor:
+            results = [row for rows in executor.map(_rank_users, chunks, [k] * len(chunks)) for row in rows]
+    recommender.close()
+
+    metrics = ranking_metrics(results, test, k, n_movies)
+    metrics['build_seconds'] = build_seconds
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", default="pipeline,exhaustive,pipeline-topk,cluster,popular",
+                        help=f"Comma-separated configurations ({', '.join(CONFIGS)})")
+    parser.add_argument("--k", type=int, default=10, help="Recommendation list length")
+    parser.add_argument("--holdout", type=int, default=1, help="Most recent ratings held out per user")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Scoring processes")
+    parser.add_argument("--n-clusters", type=int, default=5, help="KMeans clusters for every configuration")
+    parser.add_argument("--max-users", type=int, default=None, help="Evaluate a random sample of users")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the user sample")
+    args = parser.parse_args()
+
+    configs = [name.strip() for name in args.configs.split(",") if name.strip()]
+    unknown = [name for name in configs if name not in CONFIGS]
+    if unknown:
+        parser.error(f"Unknown configurations: {', '.join(unknown)}")
+
+    db = SessionLocal()
+    try:
+        ratings = db.query(
+            UserMovieWatch.id, UserMovieWatch.user_id, UserMovieWatch.movie_id,
+            UserMovieWatch.rating, UserMovieWatch.watched_at
+        ).all()
+        train, test = leave_last_out(ratings, holdout=args.holdout)
+        if args.max_users is not None and len(test) > args.max_users:
+            sample = np.random.default_rng(args.seed).choice(sorted(test), args.max_users, replace=False)
+            test = {int(user_id): test[int(user_id)] for user_id in sample}
+        if not test:
+            parser.error("No user has enough ratings for a leave-last-out split")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            url = write_training_database(os.path.join(tmp_dir, "train.db"), db, train)
+            print(f"Leave-last-out split: {len(train)} training ratings, {len(test)} users x {args.holdout} held out")
+            print(f"{'config':<18}{'P@' + str(args.k):>8}{'R@' + str(args.k):>8}{'NDCG':>8}{'cover':>8}"
+                  f"{'build s':>9}{'mean ms':>9}{'p50 ms':>9}{'p95 ms':>9}")
+            for name in configs:
+                engine, options = CONFIGS[name]
+                metrics = evaluate_config(url, engine, {'n_clusters': args.n_clusters, **options},
+                                          test, args.k, args.workers)
+                print(f"{name:<18}{metrics['precision']:>8.4f}{metrics['recall']:>8.4f}{metrics['ndcg']:>8.4f}"
+                      f"{metrics['coverage']:>8.3f}{metrics['build_seconds']:>9.3f}{metrics['latency_mean_ms']:>9.3f}"
+                      f"{metrics['latency_p50_ms']:>9.3f}{metrics['latency_p95_ms']:>9.3f}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
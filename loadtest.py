@@ -0,0 +1,275 @@
+"""
+Load generator for the recommendation API
+
+Replays a weighted mix of recommendation, similar-movie, popular, cluster and
+rating requests at a target rate (open loop: requests are started on schedule
+whether or not earlier ones finished) and reports throughput, latency
+percentiles and error rates per request kind. The app is driven in-process
+through an ASGI transport, or over HTTP when --url is given.
+
+Usage:
+    python loadtest.py --rate 200 --duration 30
+    python loadtest.py --url http://localhost:8000 --mix recommendations=50,similar=30,rate=20
+    python loadtest.py --rate 100 --fail-p99-ms 250 --fail-error-rate 0.01
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import httpx
+import numpy as np
+
+DEFAULT_MIX = "recommendations=35,similar=25,popular=15,cluster=10,clusters=5,rate=10"
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Parse "kind=weight,..." into a dict of kind to weight"""
+    weights = {}
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in REQUESTS:
+            raise ValueError(f"Unknown request kind: {kind} (choose from {', '.join(REQUESTS)})")
+        weights[kind] = float(weight or 1)
+    return weights
+
+
+def parse_range(value: str) -> List[int]:
+    """Parse "1-20" or "1,5,9" into a list of ids"""
+    if "-" in value:
+        start, end = value.split("-")
+        return list(range(int(start), int(end) + 1))
+    return [int(part) for part in value.split(",")]
+
+
+class Picker:
+    """Draw ids uniformly, or Zipf-skewed so a few hot ids get most of the traffic"""
+
+    def __init__(self, ids: List[int], skew: float, rng: random.Random):
+        self.ids = ids
+        self.rng = rng
+        self.weights = None
+        if skew > 0:
+            self.weights = list(np.cumsum(1 / np.arange(1, len(ids) + 1) ** skew))
+
+    def __call__(self) -> int:
+        if self.weights is None:
+            return self.rng.choice(self.ids)
+        return self.rng.choices(self.ids, cum_weights=self.weights)[0]
+
+
+# Request kind -> builder returning (method, path, JSON body)
+REQUESTS = {
+    'recommendations': lambda pick: ("GET", f"/recommendations/{pick.user()}", None),
+    'similar': lambda pick: ("GET", f"/movies/{pick.movie()}/similar", None),
+    'popular': lambda pick: ("GET", "/popular-movies", None),
+    'cluster': lambda pick: ("GET", f"/cluster-recommendations/{pick.user()}", None),
+    'clusters': lambda pick: ("GET", "/clusters/", None),
+    'rate': lambda pick: ("POST", f"/users/{pick.user()}/rate-movie",
+                          {"movie_id": pick.movie(), "rating": float(pick.rng.randint(1, 10)) / 2}),
+}
+
+
+async def discover_movie_ids(client: httpx.AsyncClient) -> List[int]:
+    """Walk the paginated catalog listing for every movie id"""
+    movie_ids, cursor = [], None
+    while True:
+        params = {"limit": 1000}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = await client.get("/movies/", params=params)
+        response.raise_for_status()
+        movie_ids.extend(movie["id"] for movie in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return movie_ids
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float, interval: float = 0.1):
+    """Poll GET /readyz until the model is loaded (the app loads it in the background)"""
+    deadline = time.perf_counter() + timeout
+    while True:
+        response = await client.get("/readyz")
+        if response.status_code == 200:
+            return
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"Server not ready after {timeout}s: {response.text}")
+        await asyncio.sleep(interval)
+
+
+async def run_load(client: httpx.AsyncClient, weights: Dict[str, float], rate: float, duration: float,
+                   concurrency: int, picker, warmup: float = 0.0) -> Tuple[dict, float, float]:
+    """
+    Send requests at the target rate and collect results
+
+    Returns:
+        Tuple of (kind -> list of (status or None, seconds), measured wall time, worst schedule lag)
+    """
+    kinds = list(weights)
+    cum_weights = list(np.cumsum([weights[kind] for kind in kinds]))
+    results = defaultdict(list)
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = []
+    max_lag = 0.0
+
+    async def send(kind: str, record: bool):
+        method, path, body = REQUESTS[kind](picker)
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                status = response.status_code
+            except Exception:
+                status = None
+            elapsed = time.perf_counter() - start
+        if record:
+            results[kind].append((status, elapsed))
+
+    interval = 1 / rate
+    start = time.perf_counter()
+    measure_start = start + warmup
+    end = measure_start + duration
+    sent = 0
+    while True:
+        scheduled = start + sent * interval
+        if scheduled >= end:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            max_lag = max(max_lag, -delay)
+        kind = picker.rng.choices(kinds, cum_weights=cum_weights)[0]
+        tasks.append(asyncio.ensure_future(send(kind, scheduled >= measure_start)))
+        sent += 1
+    await asyncio.gather(*tasks)
+    return results, time.perf_counter() - measure_start, max_lag
+
+
+def summarise(results: dict, wall_seconds: float) -> dict:
+    """Throughput, error rate and latency percentiles per kind and overall"""
+    def stats(samples):
+        latencies = np.array([seconds for _, seconds in samples]) * 1000
+        errors = sum(1 for status, _ in samples if status is None or status >= 500)
+        client_errors = sum(1 for status, _ in samples if status is not None and 400 <= status < 500)
+        return {
+            'requests': len(samples),
+            'throughput': len(samples) / wall_seconds,
+            'error_rate': errors / len(samples),
+            'client_error_rate': client_errors / len(samples),
+            'mean_ms': float(latencies.mean()),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p90_ms': float(np.percentile(latencies, 90)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'max_ms': float(latencies.max()),
+        }
+
+    summary = {kind: stats(samples) for kind, samples in sorted(results.items()) if samples}
+    everything = [sample for samples in results.values() for sample in samples]
+    if everything:
+        summary['total'] = stats(everything)
+    return summary
+
+
+def print_summary(summary: dict, target_rate: float, max_lag: float):
+    print(f"{'kind':<16}{'reqs':>7}{'req/s':>9}{'err %':>8}{'4xx %':>8}"
+          f"{'mean':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  (ms)")
+    for kind, row in summary.items():
+        print(f"{kind:<16}{row['requests']:>7}{row['throughput']:>9.1f}{row['error_rate'] * 100:>8.2f}"
+              f"{row['client_error_rate'] * 100:>8.2f}{row['mean_ms']:>9.2f}{row['p50_ms']:>9.2f}"
+              f"{row['p90_ms']:>9.2f}{row['p99_ms']:>9.2f}{row['max_ms']:>9.2f}")
+    print(f"Target rate {target_rate:.1f} req/s, worst schedule lag {max_lag * 1000:.1f} ms")
+
+
+async def main_async(args) -> dict:
+    weights = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        lifespan = None
+    else:
+        # In-process: import the app here so --url runs need no database configuration
+        from main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest",
+                                   timeout=args.timeout)
+        lifespan = app.router.lifespan_context(app)
+
+    with contextlib.ExitStack() as stack:
+        if lifespan is not None:
+            # The app logs with print(); keep its output out of the report
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+            await lifespan.__aenter__()
+        try:
+            async with client:
+                await wait_until_ready(client, args.ready_timeout)
+                movie_ids = parse_range(args.movies) if args.movies else await discover_movie_ids(client)
+                picker = argparse.Namespace(
+                    user=Picker(parse_range(args.users), args.skew, rng),
+                    movie=Picker(movie_ids, args.skew, rng),
+                    rng=rng
+                )
+                results, wall_seconds, max_lag = await run_load(
+                    client, weights, args.rate, args.duration, args.concurrency, picker, args.warmup
+                )
+        finally:
+            if lifespan is not None:
+                await lifespan.__aexit__(None, None, None)
+
+    summary = summarise(results, wall_seconds)
+    summary['schedule'] = {'target_rate': args.rate, 'max_lag_ms': max_lag * 1000}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="Base URL of a running server (default: drive main.app in-process)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weighted request kinds ({', '.join(REQUESTS)})")
+    parser.add_argument("--rate", type=float, default=50, help="Target requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=0, help="Seconds of unmeasured traffic first")
+    parser.add_argument("--concurrency", type=int, default=100, help="Maximum requests in flight")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds")
+    parser.add_argument("--ready-timeout", type=float, default=300,
+                        help="Seconds to wait for GET /readyz before sending traffic")
+    parser.add_argument("--users", default="1-20", help="User ids, as a range (1-20) or list (1,2,3)")
+    parser.add_argument("--movies", default=None, help="Movie ids (default: every movie from GET /movies/)")
+    parser.add_argument("--skew", type=float, default=0, help="Zipf exponent for picking ids (0 = uniform)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    parser.add_argument("--fail-p99-ms", type=float, default=None, help="Exit with 1 if the overall p99 exceeds this")
+    parser.add_argument("--fail-error-rate", type=float, default=None,
+                        help="Exit with 1 if the overall 5xx/transport error rate exceeds this")
+    args = parser.parse_args()
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    summary = asyncio.run(main_async(args))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary({kind: row for kind, row in summary.items() if kind != 'schedule'},
+                      args.rate, summary['schedule']['max_lag_ms'] / 1000)
+
+    total = summary.get('total')
+    failed = total is None
+    if total is not None and args.fail_p99_ms is not None and total['p99_ms'] > args.fail_p99_ms:
+        print(f"FAIL: p99 {total['p99_ms']:.1f} ms > {args.fail_p99_ms} ms", file=sys.stderr)
+        failed = True
+    if total is not None and args.fail_error_rate is not None and total['error_rate'] > args.fail_error_rate:
+        print(f"FAIL: error rate {total['error_rate']:.4f} > {args.fail_error_rate}", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,30 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from pydantic import BaseModel, Field, validator
-from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from typing import TYPE_CHECKING, List, Optional, Tuple
+from pydantic import BaseModel, Field, validator, ValidationError
+from datetime import datetime, timedelta
+import asyncio
+import csv
+import json
+import os
+import time
 
-from database import get_db, User, Movie, UserMovieWatch, create_tables
-from recommender import MovieRecommender
-from models import MovieBase, MovieResponse, MovieRecommendation
+from database import get_db, SessionLocal, User, Movie, UserMovieWatch, create_tables, upsert_rating, upsert_ratings
+from retrieval import server_timing_header
+from catalog import keyset_page
+from coalescing import SingleFlight
+from cache import MemoryCache, SQLiteCache, TwoTierCache, encode_rows, decode_rows
+from trending import TrendingEngine
+from deadline import Deadline, LatencyTracker, OverrunLimit, StaleResultCache, Tier, serve_within_deadline
+from models import MovieBase, MovieResponse, MovieRecommendation, TrendingMovie
+
+if TYPE_CHECKING:
+    # pandas/sklearn/scipy yüklemesi ağırdır; model arka planda yüklenirken içe aktarılır
+    from recommender import MovieRecommender
+    from clustering import ClusterSearch
 
 app = FastAPI(
     title="Netflix Recommendation System",
@@ -36,18 +54,281 @@ class MovieRating(BaseModel):
     movie_id: int
     rating: float = Field(..., ge=0.0, le=5.0)
 
+class BulkRating(MovieRating):
+    user_id: int
+
+class BulkBatchResult(BaseModel):
+    batch: int
+    received: int
+    accepted: int
+    rejected: int
+
+class BulkRowError(BaseModel):
+    line: int
+    error: str
+
+class BulkRatingResult(BaseModel):
+    batches: List[BulkBatchResult]
+    accepted: int
+    rejected: int
+    errors: List[BulkRowError]
+
+class RawJSONResponse(Response):
+    """Önceden serileştirilmiş JSON gövdesini doğrulama yapmadan döndürür"""
+    media_type = "application/json"
+
 class ClusterInfo(BaseModel):
     cluster_id: int
     movie_count: int
     average_rating: float
     genres: List[str]
 
-# Öneri sistemi instance'ı
-recommender = MovieRecommender(n_clusters=5)
+# KMeans küme sayısı; N_CLUSTERS_SEARCH="2-12" verilirse her tam model oluşturmada
+# bu aralıkta (örneklenmiş veride, süre bütçesi içinde) aranır
+N_CLUSTERS = int(os.getenv("N_CLUSTERS", "5"))
+N_CLUSTERS_SEARCH = os.getenv("N_CLUSTERS_SEARCH", "")
+N_CLUSTERS_SEARCH_METRIC = os.getenv("N_CLUSTERS_SEARCH_METRIC", "silhouette")
+N_CLUSTERS_SEARCH_BUDGET = float(os.getenv("N_CLUSTERS_SEARCH_BUDGET", "10"))
+
+def _cluster_search() -> Optional["ClusterSearch"]:
+    """Ortam değişkenlerinden küme sayısı aramasını oluşturur (kapalıysa None)"""
+    if not N_CLUSTERS_SEARCH:
+        return None
+    from clustering import ClusterSearch
+    k_min, k_max = (int(k) for k in N_CLUSTERS_SEARCH.split("-"))
+    return ClusterSearch(k_min=k_min, k_max=k_max, metric=N_CLUSTERS_SEARCH_METRIC,
+                         time_budget=N_CLUSTERS_SEARCH_BUDGET)
+
+# Kullanıcı benzerlikleri: SIMILARITY_TOP_K verilirse her kullanıcı için yalnızca en yakın k kullanıcı,
+# SIMILARITY_MEMORY_MB'lık parçalar halinde (tam n_users² matris oluşturulmadan) hesaplanır (0 = tam matris)
+SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", "0"))
+SIMILARITY_MEMORY_MB = float(os.getenv("SIMILARITY_MEMORY_MB", "256"))
+SIMILARITY_N_JOBS = int(os.getenv("SIMILARITY_N_JOBS", "0"))
+SIMILARITY_BACKEND = os.getenv("SIMILARITY_BACKEND", "thread")
+SIMILARITY_SPILL_DIR = os.getenv("SIMILARITY_SPILL_DIR", "")
+
+# Öneri sistemi instance'ı; uygulama portu hemen dinlerken arka planda yüklenir (bkz. _load_model)
+recommender: Optional["MovieRecommender"] = None
+
+# Yükleme durumu: /readyz yalnızca model yüklenip ısınma bittikten sonra 200 döner
+model_state = {"status": "loading", "error": None, "attempts": 0, "load_seconds": None, "warmed_up": 0}
+
+# Yüklemeden sonra en popüler/trend N film için benzer film sonuçları önceden hesaplanır (0 = kapalı)
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", "0"))
+
+def require_model():
+    """Model hazır değilse 503 döndüren bağımlılık"""
+    if recommender is None:
+        raise HTTPException(status_code=503, detail="Öneri modeli yükleniyor", headers={"Retry-After": "5"})
+
+# Aynı anda gelen özdeş hesaplamaları tek çalıştırmada birleştirir
+coalescer = SingleFlight()
+
+# Öneri ve benzer film sonuçları için iki katmanlı önbellek: süreç içi L1 ve
+# RESULT_CACHE_PATH verilirse yerel süreçler arasında paylaşılan, yeniden başlatmalarda korunan SQLite L2.
+# Anahtarlar model parmak iziyle kapsamlanır; model değişince eski sonuçlar kullanılmaz.
+# L1 anahtarı son tam kurulumdan beri uygulanan puanlama gruplarını da kapsar; L2 anahtarı
+# yalnızca başka süreçlerin yeniden kurarak elde edebileceği puanlara ve seçeneklere dayanır.
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "10000"))
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "")
+result_cache = TwoTierCache(
+    MemoryCache(RESULT_CACHE_SIZE),
+    SQLiteCache(RESULT_CACHE_PATH) if RESULT_CACHE_PATH else None
+)
+
+def _result_key(name: str, *args) -> Tuple[str, str]:
+    """Model parmak iziyle kapsamlanmış (L1 anahtarı, paylaşılan L2 anahtarı) ikilisi"""
+    suffix = [name] + [str(arg) for arg in args]
+    return (":".join([recommender.model_fingerprint()] + suffix),
+            ":".join([recommender.model_fingerprint(shared=True)] + suffix))
+
+def _cached_rows(key: Tuple[str, str], compute, local_only: bool = False) -> Tuple[Optional[bytes], bool]:
+    """
+    Önbellekteki sonucu JSON olarak döndürür; yoksa compute ile hesaplayıp önbelleğe yazar
+    
+    (gövde, önbellekten geldi mi) ikilisi döner. local_only=True ile yalnızca L1'e
+    bakılır (olay döngüsünde diske erişmeden) ve ıskalamada gövde None olur.
+    """
+    local_key, shared_key = key
+    value = result_cache.get(local_key, local_only=local_only, shared_key=shared_key)
+    if value is not None:
+        return recommender.render_json(decode_rows(value)), True
+    if local_only:
+        return None, False
+    rows = compute()
+    result_cache.set(local_key, encode_rows(rows), shared_key=shared_key)
+    return recommender.render_json(rows), False
+
+# Öneri isteği gecikme bütçesi (milisaniye, 0 = sınırsız); X-Latency-Budget-Ms başlığı ile istek başına değiştirilebilir
+RECOMMENDATION_BUDGET_MS = float(os.getenv("RECOMMENDATION_BUDGET_MS", "0"))
+latency_tracker = LatencyTracker()
+stale_results = StaleResultCache()
+# Süresi dolduktan sonra threadpool'da çalışmaya devam eden katman çağrılarının üst sınırı
+tier_overruns = OverrunLimit(int(os.getenv("MAX_OVERRUNNING_TIERS", "8")))
+
+def _user_exists(user_id: int) -> bool:
+    """Kullanıcının veritabanında olup olmadığını kontrol eder (threadpool'da çalışır)"""
+    db = SessionLocal()
+    try:
+        return db.query(User.id).filter(User.id == user_id).first() is not None
+    finally:
+        db.close()
+
+# Saatlik ve günlük pencerelerde trend filmler (başlangıçta watched_at'tan doldurulur)
+trending = TrendingEngine.default()
+
+def _seed_trending(until: datetime):
+    """
+    Trend sayaçlarını en uzun penceredeki, until anından önceki izlemelerle doldurur
+    
+    until'den sonraki puanlamalar istek sırasında trending.record ile zaten sayıldığı
+    için tohumlamaya alınmaz.
+    """
+    db = SessionLocal()
+    try:
+        since = until - timedelta(seconds=trending.span_seconds)
+        trending.seed(db.query(UserMovieWatch.movie_id, UserMovieWatch.rating, UserMovieWatch.watched_at).filter(
+            UserMovieWatch.watched_at >= since, UserMovieWatch.watched_at < until
+        ).all())
+    finally:
+        db.close()
+
+# Yeni puanlamalar istekte kuyruğa alınır ve bu aralıkla (saniye) toplu olarak modele uygulanır;
+# 0 ile canlı uygulama kapanır ve puanlamalar modele yalnızca yenileme ile girer
+RATING_APPLY_INTERVAL = float(os.getenv("RATING_APPLY_INTERVAL", "1"))
+
+async def _apply_queued_ratings():
+    """Kuyruktaki puanlamaları belirli aralıklarla tek bir toplu güncellemeyle modele uygular"""
+    while True:
+        await asyncio.sleep(RATING_APPLY_INTERVAL)
+        try:
+            await run_in_threadpool(recommender.apply_queued)
+        except Exception as e:
+            print(f"Error applying ratings: {str(e)}")
+
+def _queue_ratings(ratings: List[tuple]):
+    """Puanlamaları modele uygulanmak üzere kuyruğa alır (model yükleniyorsa veya canlı uygulama kapalıysa atlanır)"""
+    # Yükleme sırasında yazılanlar yükleme sonundaki refresh ile modele girer
+    if recommender is not None and RATING_APPLY_INTERVAL > 0:
+        recommender.queue_ratings(ratings)
+
+# Artımlı model yenileme aralığı (saniye, 0 = kapalı) ve tam yeniden oluşturma eşiği
+MODEL_REFRESH_INTERVAL = float(os.getenv("MODEL_REFRESH_INTERVAL", "0"))
+MODEL_REFRESH_MAX_CHURN = float(os.getenv("MODEL_REFRESH_MAX_CHURN", "0.2"))
+
+async def _periodic_refresh():
+    """Modeli belirli aralıklarla yalnızca değişen puanlamalarla günceller"""
+    while True:
+        await asyncio.sleep(MODEL_REFRESH_INTERVAL)
+        try:
+            result = await run_in_threadpool(recommender.refresh, MODEL_REFRESH_MAX_CHURN)
+            if result["mode"] != "none":
+                print(f"Model refreshed ({result['mode']}): {result['rows']} rows in {result['seconds']:.3f}s")
+        except Exception as e:
+            print(f"Error refreshing model: {str(e)}")
+
+def _prepare_database(seed_until: datetime):
+    """Tabloları oluşturur ve trend sayaçlarını doldurur (threadpool'da çalışır)"""
+    create_tables()
+    _seed_trending(seed_until)
+
+def _build_model() -> "MovieRecommender":
+    """Öneri modelini kurar (threadpool'da çalışır)"""
+    from recommender import MovieRecommender
+    return MovieRecommender(n_clusters=N_CLUSTERS, refresh_max_churn=MODEL_REFRESH_MAX_CHURN,
+                            cluster_search=_cluster_search(),
+                            similarity_top_k=SIMILARITY_TOP_K or None,
+                            similarity_memory_mb=SIMILARITY_MEMORY_MB,
+                            similarity_n_jobs=SIMILARITY_N_JOBS or None,
+                            similarity_backend=SIMILARITY_BACKEND,
+                            similarity_spill_dir=SIMILARITY_SPILL_DIR or None)
+
+def _warm_up(model: "MovieRecommender") -> int:
+    """Türetilmiş yapıları ve en sıcak filmlerin benzer film sonuçlarını önceden hesaplar"""
+    model.popular_columns()
+    model.cluster_popular_columns()
+    model.column_clusters()
+    if WARMUP_TOP_N <= 0:
+        return 0
+    hottest = [movie_id for movie_id, *_ in trending.top("day", WARMUP_TOP_N)]
+    if len(hottest) < WARMUP_TOP_N:
+        popular = model.user_movie_matrix.columns[model.popular_columns()]
+        hottest += [int(movie_id) for movie_id in popular if movie_id not in hottest][:WARMUP_TOP_N - len(hottest)]
+    warmed = 0
+    for movie_id in hottest:
+        # /movies/{movie_id}/similar varsayılan parametreleriyle aynı anahtar
+        key = _result_key("similar", movie_id, 5, None, None, None, "collaborative")
+        try:
+            _cached_rows(key, lambda: model.similar_movie_rows(movie_id, 5))
+            warmed += 1
+        except ValueError:
+            # Henüz modelde olmayan film
+            continue
+    return warmed
+
+async def _retrying(fn, *args):
+    """fn'i threadpool'da başarılı olana kadar artan aralıklarla yeniden dener"""
+    while True:
+        model_state["attempts"] += 1
+        try:
+            return await run_in_threadpool(fn, *args)
+        except Exception as e:
+            model_state["error"] = str(e)
+            print(f"Error loading model (attempt {model_state['attempts']}): {str(e)}")
+            await asyncio.sleep(min(2 ** model_state["attempts"], 60))
+
+async def _load_model(seed_until: datetime):
+    """
+    Modeli arka planda yükler; veritabanı hazır değilse artan aralıklarla yeniden dener
+
+    Trend sayaçları model kurulumunun yeniden denemelerinden ayrı olarak bir kez
+    doldurulur; seed_until'den sonraki puanlamalar istek sırasında sayılır.
+    """
+    global recommender
+    start = time.perf_counter()
+    await _retrying(_prepare_database, seed_until)
+    model = await _retrying(_build_model)
+
+    recommender = model
+    model_state["status"] = "warming_up"
+    # Yükleme sırasında yazılan (modele uygulanmamış) puanlamaları da al; başarısız olursa
+    # model yine hazır sayılır ve bu puanlamalar sonraki yenilemeyle modele girer
+    try:
+        await run_in_threadpool(model.refresh, MODEL_REFRESH_MAX_CHURN)
+    except Exception as e:
+        print(f"Error refreshing model after load: {str(e)}")
+    try:
+        model_state["warmed_up"] = await run_in_threadpool(_warm_up, model)
+    except Exception as e:
+        print(f"Error warming up: {str(e)}")
+    model_state.update(status="ready", error=None, load_seconds=time.perf_counter() - start)
+
+    if RATING_APPLY_INTERVAL > 0:
+        asyncio.create_task(_apply_queued_ratings())
+    if MODEL_REFRESH_INTERVAL > 0:
+        asyncio.create_task(_periodic_refresh())
 
 @app.on_event("startup")
 async def startup_event():
-    create_tables()
+    # Port hemen dinlenir; model ve ağır kütüphaneler arka planda yüklenir.
+    # Bu andan sonraki puanlamalar trend sayaçlarına istek sırasında eklenir.
+    app.state.model_loader = asyncio.create_task(_load_model(datetime.utcnow()))
+
+# Sağlık kontrolleri
+@app.get("/healthz")
+def healthz():
+    """Süreç ayakta mı (model durumundan bağımsız)"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    """Model yüklenip ısındıysa 200, aksi halde 503"""
+    body = dict(model_state)
+    if recommender is not None:
+        body["model_version"] = recommender.model_version
+    if model_state["status"] != "ready":
+        return Response(json.dumps(body), status_code=503, media_type="application/json")
+    return body
 
 # Kullanıcı endpoint'leri
 @app.post("/users/", response_model=UserResponse, status_code=201)
@@ -78,6 +359,10 @@ def create_movie(movie: MovieCreate, db: Session = Depends(get_db)):
     db.add(db_movie)
     db.commit()
     db.refresh(db_movie)
+    # Yeni film kataloğa ve içerik dizinine eklenir; tam yeniden kurulum beklemeden
+    # listelenir ve benzer filmleri puanlama beklemeden bulunur
+    if recommender is not None:
+        recommender.add_movie(db_movie)
     return db_movie
 
 @app.get("/movies/{movie_id}", response_model=MovieResponse)
@@ -87,60 +372,301 @@ def get_movie(movie_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Film bulunamadı")
     return movie
 
+# Film listeleme endpoint'leri
+def _listing_response(catalog, ids, cursor: Optional[int], limit: int, format: str) -> Response:
+    """
+    Bellekteki sıralı id dizisinden sayfalı (keyset) film listesi döndürür
+    
+    Katalog ve id dizisi aynı model durumundan gelir (recommender.listing);
+    akış sırasında model yenilense bile aynı katalog kullanılır. JSON modunda
+    bir sonraki sayfanın imleci X-Next-Cursor başlığında döner; NDJSON modunda
+    imleçten sonraki tüm filmler sayfa sayfa akıtılır.
+    """
+    if format == "ndjson":
+        def stream():
+            after = cursor
+            while True:
+                page, after = keyset_page(ids, after, limit)
+                if len(page):
+                    yield catalog.render_ndjson(page)
+                if after is None:
+                    break
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+    
+    page, next_cursor = keyset_page(ids, cursor, limit)
+    headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else {}
+    return RawJSONResponse(catalog.render_movies(page), headers=headers)
+
+@app.get("/movies/", response_model=List[MovieResponse], dependencies=[Depends(require_model)])
+def list_movies(
+    cursor: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """Katalogdaki filmleri id sırasıyla, imleç tabanlı sayfalama ile döndürür"""
+    return _listing_response(*recommender.listing(), cursor, limit, format)
+
 # Film izleme ve puanlama endpoint'i
 @app.post("/users/{user_id}/rate-movie", status_code=201)
 def rate_movie(user_id: int, rating: MovieRating, db: Session = Depends(get_db)):
-    # Kullanıcı ve film kontrolü
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
-    
-    movie = db.query(Movie).filter(Movie.id == rating.movie_id).first()
-    if not movie:
+    # Puanlamayı tek bir INSERT ... ON CONFLICT ifadesiyle yaz
+    try:
+        upsert_rating(db, user_id, rating.movie_id, rating.rating)
+        db.commit()
+    except IntegrityError:
+        # Yabancı anahtar ihlali: kullanıcı veya film yok
+        db.rollback()
+        if not db.query(User).filter(User.id == user_id).first():
+            raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
         raise HTTPException(status_code=404, detail="Film bulunamadı")
     
-    # Puanlama kaydı oluştur veya güncelle
-    watch_record = db.query(UserMovieWatch).filter(
-        UserMovieWatch.user_id == user_id,
-        UserMovieWatch.movie_id == rating.movie_id
-    ).first()
+    _queue_ratings([(user_id, rating.movie_id, rating.rating)])
+    trending.record(rating.movie_id, rating.rating)
+    return {"message": "Film başarıyla puanlandı"}
+
+# Toplu puanlama
+BULK_MAX_ERRORS = 100
+
+async def _iter_body_lines(request: Request):
+    """İstek gövdesini akış halinde okuyup satır satır döndürür"""
+    # Yalnızca yeni parça taranır ve kuyruk kesilir; uzun satırlar doğrusal sürede birleşir
+    buffer = bytearray()
+    async for chunk in request.stream():
+        searched = len(buffer)
+        buffer += chunk
+        end = buffer.rfind(b"\n", searched)
+        if end < 0:
+            continue
+        for line in bytes(buffer[:end]).split(b"\n"):
+            yield line
+        del buffer[:end + 1]
+    if buffer:
+        yield bytes(buffer)
+
+def _ingest_bulk_batch(db: Session, rows: List[tuple]) -> tuple:
+    """
+    Bir grup puanlamayı doğrulayıp tek bir upsert ile yazar
     
-    if watch_record:
-        watch_record.rating = rating.rating
-    else:
-        watch_record = UserMovieWatch(
-            user_id=user_id,
-            movie_id=rating.movie_id,
-            rating=rating.rating
-        )
-        db.add(watch_record)
+    Returns:
+        (accepted, rejected) - kabul edilen (user_id, movie_id, rating) listesi ve (line, error) listesi
+    """
+    user_ids = {rating.user_id for _, rating in rows}
+    movie_ids = {rating.movie_id for _, rating in rows}
+    known_users = {user_id for (user_id,) in db.query(User.id).filter(User.id.in_(user_ids))}
+    known_movies = {movie_id for (movie_id,) in db.query(Movie.id).filter(Movie.id.in_(movie_ids))}
+    
+    accepted, rejected = [], []
+    for line_number, rating in rows:
+        if rating.user_id not in known_users:
+            rejected.append((line_number, "Kullanıcı bulunamadı"))
+        elif rating.movie_id not in known_movies:
+            rejected.append((line_number, "Film bulunamadı"))
+        else:
+            accepted.append((rating.user_id, rating.movie_id, rating.rating))
     
+    # Aynı (user_id, movie_id) bir ifadede iki kez olamaz; son satır kazanır
+    latest = {(user_id, movie_id): value for user_id, movie_id, value in accepted}
+    upsert_ratings(db, [
+        {"user_id": user_id, "movie_id": movie_id, "rating": value}
+        for (user_id, movie_id), value in latest.items()
+    ])
     db.commit()
-    return {"message": "Film başarıyla puanlandı"}
+    return accepted, rejected
+
+@app.post("/ratings/bulk", response_model=BulkRatingResult)
+async def bulk_rate_movies(
+    request: Request,
+    batch_size: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_db)
+):
+    """
+    NDJSON (varsayılan) veya CSV (Content-Type: text/csv) formatında toplu puanlama
+    
+    Her satır user_id, movie_id ve rating içerir. Satırlar akış halinde okunur,
+    gruplar halinde doğrulanır ve yazılır; kabul edilen puanlar öneri sistemine toplu olarak aktarılır.
+    """
+    is_csv = request.headers.get("content-type", "").startswith("text/csv")
+    header = None
+    batches, errors = [], []
+    accepted_total, rejected_total = 0, 0
+    pending, invalid = [], []
+    
+    async def flush():
+        nonlocal pending, invalid, accepted_total, rejected_total
+        accepted, rejected = await run_in_threadpool(_ingest_bulk_batch, db, pending) if pending else ([], [])
+        rejected += invalid
+        batches.append(BulkBatchResult(
+            batch=len(batches) + 1,
+            received=len(pending) + len(invalid),
+            accepted=len(accepted),
+            rejected=len(rejected)
+        ))
+        # Kabul edilen puanlar kuyruğa alınır; bir sonraki toplu güncellemede modele girer
+        _queue_ratings(accepted)
+        for _, movie_id, rating in accepted:
+            trending.record(movie_id, rating)
+        accepted_total += len(accepted)
+        rejected_total += len(rejected)
+        for line_number, error in sorted(rejected):
+            if len(errors) < BULK_MAX_ERRORS:
+                errors.append(BulkRowError(line=line_number, error=error))
+        pending, invalid = [], []
+    
+    line_number = 0
+    async for raw_line in _iter_body_lines(request):
+        line_number += 1
+        try:
+            line = raw_line.decode("utf-8").strip()
+            if not line:
+                continue
+            if is_csv:
+                values = next(csv.reader([line]))
+                if header is None:
+                    header = [name.strip() for name in values]
+                    continue
+                row = dict(zip(header, values))
+            else:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError("Satır bir JSON nesnesi olmalı")
+            pending.append((line_number, BulkRating(**row)))
+        except (ValueError, ValidationError) as e:
+            invalid.append((line_number, str(e)))
+        
+        if len(pending) + len(invalid) >= batch_size:
+            await flush()
+    
+    if pending or invalid:
+        await flush()
+    
+    return BulkRatingResult(
+        batches=batches,
+        accepted=accepted_total,
+        rejected=rejected_total,
+        errors=errors
+    )
+
+# Model yenileme
+@app.post("/model/refresh", dependencies=[Depends(require_model)])
+def refresh_model(full: bool = False):
+    """Son yüklemeden bu yana değişen puanlamaları modele uygular (full=true ile tamamen yeniden oluşturur)"""
+    if full:
+        recommender.rebuild()
+        return {"mode": "full", "model_version": recommender.model_version}
+    result = recommender.refresh(MODEL_REFRESH_MAX_CHURN)
+    result["model_version"] = recommender.model_version
+    return result
+
+@app.get("/model/build-report", dependencies=[Depends(require_model)])
+def get_build_report():
+    """Son tam model oluşturmanın aşama sürelerini ve küme sayısı arama sonuçlarını döndürür"""
+    return recommender.build_report
+
+@app.get("/metrics/cache")
+def get_cache_metrics():
+    """Sonuç önbelleği isabet ve ıskalama sayılarını döndürür"""
+    return result_cache.stats()
+
+@app.get("/metrics/coalescing")
+def get_coalescing_metrics():
+    """Birleştirilen ve çalıştırılan hesaplama sayılarını döndürür"""
+    return coalescer.stats()
 
 # Öneri endpoint'leri
-@app.get("/recommendations/{user_id}", response_model=List[MovieRecommendation])
-async def get_recommendations(user_id: int, n_recommendations: int = 5, db: Session = Depends(get_db)):
+@app.get("/recommendations/{user_id}", response_model=List[MovieRecommendation], dependencies=[Depends(require_model)])
+async def get_recommendations(
+    user_id: int,
+    n_recommendations: int = 5,
+    genre: Optional[str] = None,
+    year_min: Optional[int] = None,
+    year_max: Optional[int] = None,
+    x_latency_budget_ms: Optional[float] = Header(None)
+):
     """
     Get movie recommendations for a user
+    
+    Candidate-set size and per-source timings are reported in the
+    X-Candidate-Count and Server-Timing response headers. Users not yet in the
+    model get cold-start results; the fallback used is reported in X-Cold-Start.
+    
+    With a latency budget (RECOMMENDATION_BUDGET_MS or the X-Latency-Budget-Ms
+    request header) the request degrades from the full scorer to the last cached
+    result, the neighbour/cluster approximation and finally popular movies. The
+    tier that served is reported in X-Serving-Tier.
     """
+    deadline = Deadline(x_latency_budget_ms if x_latency_budget_ms is not None else RECOMMENDATION_BUDGET_MS)
     try:
-        # Check if user exists
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Get user's ratings
-        user_ratings = db.query(UserMovieWatch).filter(UserMovieWatch.user_id == user_id).all()
-        print(f"User {user_id} has {len(user_ratings)} ratings")
+        # Check if user exists: users in the model need no database read; others are
+        # looked up off the event loop, within the budget. When the lookup does not
+        # finish in time or fails it is skipped and the tiers below answer. A lookup
+        # still running counts as an overrun, and none is started while the limit is full.
+        if not recommender.has_user(user_id) and not tier_overruns.full():
+            lookup = asyncio.ensure_future(run_in_threadpool(_user_exists, user_id))
+            done, _ = await asyncio.wait({lookup}, timeout=deadline.remaining())
+            if not done:
+                tier_overruns.track(lookup)
+            elif lookup.exception() is not None:
+                print(f"User lookup failed: {lookup.exception()}")
+            elif not lookup.result():
+                raise HTTPException(status_code=404, detail="User not found")
         
         # Get recommendations
         try:
-            recommendations = recommender.get_user_recommendations(user_id, n_recommendations)
-            print(f"Got {len(recommendations)} recommendations")
+            report = {}
+            outcome = {"hit": False}
+            cache_key = (user_id, n_recommendations, genre, year_min, year_max)
+            result_key = _result_key("recommendations", *cache_key)
+            # Modelde olmayan kullanıcıların (cold start) sonuçları veritabanındaki puanlarına
+            # dayanır; model parmak izi bunları kapsamadığı için önbelleğe alınmaz
+            cacheable = recommender.has_user(user_id)
+            
+            # Güncel model için L1'de hazır sonuç varsa doğrudan döner
+            if cacheable:
+                body, _ = _cached_rows(result_key, None, local_only=True)
+                if body is not None:
+                    return RawJSONResponse(body, headers={"X-Serving-Tier": "cached", "X-Cache": "hit"})
+            
+            def rows():
+                return recommender.user_recommendation_rows(
+                    user_id, n_recommendations, report=report, genre=genre, year_min=year_min, year_max=year_max
+                )
+            
+            def full():
+                if cacheable:
+                    body, outcome["hit"] = _cached_rows(result_key, rows)
+                else:
+                    body = recommender.render_json(rows())
+                stale_results.put(cache_key, body)
+                return body
+            
+            def approximate(use_neighbors):
+                return lambda: recommender.render_json(recommender.fallback_recommendation_rows(
+                    user_id, n_recommendations, use_neighbors=use_neighbors,
+                    genre=genre, year_min=year_min, year_max=year_max
+                ))
             
-            # The recommendations are already MovieRecommendation objects
-            return recommendations
+            tier, body = await serve_within_deadline([
+                # Geç biten tam hesaplama sonucu önbelleğe yazmaya devam eder
+                Tier("full", full),
+                Tier("cached", lambda: stale_results.get(cache_key), inline=True),
+                Tier("approximate", approximate(True)),
+                Tier("popular", approximate(False)),
+            ], deadline, latency_tracker, tier_overruns)
+            
+            if tier == "full" and outcome["hit"]:
+                # Güncel modelin sonucu L2'den geldi
+                return RawJSONResponse(body, headers={"X-Serving-Tier": "cached", "X-Cache": "hit"})
+            headers = {"X-Serving-Tier": tier}
+            if tier == "full":
+                headers["X-Cache"] = "miss"
+                print(f"Got recommendations from {report.get('candidates')} candidates")
+                header, value = server_timing_header(report)
+                headers.update({"X-Candidate-Count": str(report.get("candidates", 0)), header: value})
+                if report.get("cold_start"):
+                    headers["X-Cold-Start"] = report["cold_start"]
+            
+            # Trusted internal rows are serialised directly, skipping response_model validation
+            return RawJSONResponse(body, headers=headers)
             
         except Exception as e:
             print(f"Error getting recommendations: {str(e)}")
@@ -152,24 +678,43 @@ async def get_recommendations(user_id: int, n_recommendations: int = 5, db: Sess
         print(f"Unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
-@app.get("/movies/{movie_id}/similar", response_model=List[MovieRecommendation])
-def get_similar_movies(
+@app.get("/movies/{movie_id}/similar", response_model=List[MovieRecommendation], dependencies=[Depends(require_model)])
+async def get_similar_movies(
     movie_id: int,
     n_similar: int = Query(5, ge=1, le=20),
-    db: Session = Depends(get_db)
+    genre: Optional[str] = None,
+    year_min: Optional[int] = None,
+    year_max: Optional[int] = None,
+    method: str = Query("collaborative", pattern="^(collaborative|content|hybrid)$")
 ):
+    """
+    Benzer filmleri döndürür
+    
+    method=collaborative ortak puanlamalara, content süre/yıl/tür özelliklerine,
+    hybrid ikisinin ağırlıklı karışımına göre sıralar. Henüz puanlanmamış filmler
+    (ör. yeni eklenenler) her durumda içerik özellikleriyle eşleştirilir.
+    """
     try:
-        similar_movies = recommender.get_similar_movies(movie_id, n_similar)
-        return similar_movies
+        result_key = _result_key("similar", movie_id, n_similar, genre, year_min, year_max, method)
+        body, _ = _cached_rows(result_key, None, local_only=True)
+        if body is None:
+            # Aynı film için eşzamanlı istekler tek hesaplamayı (ve L2 okumasını) paylaşır
+            body, _ = await coalescer.do_async(
+                "similar",
+                (movie_id, n_similar, genre, year_min, year_max, method, recommender.model_version),
+                lambda: _cached_rows(result_key, lambda: recommender.similar_movie_rows(
+                    movie_id, n_similar, genre=genre, year_min=year_min, year_max=year_max, method=method
+                ))
+            )
+        return RawJSONResponse(body)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Öneri sistemi hatası")
 
 # Küme endpoint'leri
-@app.get("/clusters/", response_model=List[ClusterInfo])
-def get_clusters(db: Session = Depends(get_db)):
-    """Tüm kümelerin bilgilerini döndürür"""
+def _cluster_infos(db: Session) -> List[ClusterInfo]:
+    """Tüm kümelerin istatistiklerini hesaplar"""
     clusters = []
     for cluster_id in range(recommender.n_clusters):
         movies = recommender.get_movies_by_cluster(cluster_id)
@@ -200,38 +745,75 @@ def get_clusters(db: Session = Depends(get_db)):
     
     return clusters
 
-@app.get("/clusters/{cluster_id}/movies", response_model=List[MovieResponse])
+@app.get("/clusters/", response_model=List[ClusterInfo], dependencies=[Depends(require_model)])
+def get_clusters(db: Session = Depends(get_db)):
+    """Tüm kümelerin bilgilerini döndürür"""
+    # Eşzamanlı istekler ilk isteğin sonucunu bekler (threadpool yolu)
+    return coalescer.do("clusters", recommender.model_version, lambda: _cluster_infos(db))
+
+@app.get("/clusters/{cluster_id}/movies", response_model=List[MovieResponse], dependencies=[Depends(require_model)])
 def get_cluster_movies(
     cluster_id: int,
-    db: Session = Depends(get_db)
+    cursor: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    format: str = Query("json", pattern="^(json|ndjson)$")
 ):
-    """Belirli bir kümedeki tüm filmleri döndürür"""
+    """Belirli bir kümedeki filmleri id sırasıyla, imleç tabanlı sayfalama ile döndürür"""
     try:
-        movies = recommender.get_movies_by_cluster(cluster_id)
-        return movies
+        catalog, ids = recommender.listing(cluster_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    return _listing_response(catalog, ids, cursor, limit, format)
 
-@app.get("/popular-movies", response_model=List[MovieRecommendation])
-def get_popular_movies(
+@app.get("/popular-movies", response_model=List[MovieRecommendation], dependencies=[Depends(require_model)])
+async def get_popular_movies(
     n_movies: int = Query(5, ge=1, le=20),
-    db: Session = Depends(get_db)
+    genre: Optional[str] = None,
+    year_min: Optional[int] = None,
+    year_max: Optional[int] = None
 ):
-    """En popüler filmleri döndürür"""
+    """En popüler filmleri döndürür (isteğe bağlı tür ve yıl filtreleriyle)"""
     try:
-        popular_movies = recommender.get_popular_movies(n_movies)
-        return popular_movies
+        body = await coalescer.do_async(
+            "popular",
+            (n_movies, genre, year_min, year_max, recommender.model_version),
+            lambda: recommender.render_json(recommender.popular_movie_rows(
+                n_movies, genre=genre, year_min=year_min, year_max=year_max
+            ))
+        )
+        return RawJSONResponse(body)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Öneri sistemi hatası: {str(e)}")
 
-@app.get("/cluster-recommendations/{user_id}", response_model=List[MovieRecommendation])
-async def get_cluster_recommendations(
+@app.get("/trending", response_model=List[TrendingMovie], dependencies=[Depends(require_model)])
+def get_trending(
+    window: str = Query("day", pattern="^(hour|day)$"),
+    k: int = Query(10, ge=1, le=100)
+):
+    """
+    Son bir saatte ya da günde en çok izlenen filmleri zamanla azalan ağırlıkla döndürür
+    
+    Sayaçlar bellekte tutulur; puanlama tablosu taranmaz.
+    """
+    items = [
+        (movie_id, {"trending_score": score, "watches": watches, "average_rating": average})
+        for movie_id, score, watches, average in trending.top(window, k)
+    ]
+    return RawJSONResponse(recommender.catalog.render_extended(items))
+
+@app.get("/cluster-recommendations/{user_id}", response_model=List[MovieRecommendation], dependencies=[Depends(require_model)])
+def get_cluster_recommendations(
     user_id: int, 
     n_recommendations: int = 5,
+    genre: Optional[str] = None,
+    year_min: Optional[int] = None,
+    year_max: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
     """
     Get movie recommendations for a user using cluster-based collaborative filtering
+    
+    A plain function, so the user lookup and scoring run in the threadpool, not on the event loop.
     """
     try:
         # Check if user exists
@@ -241,8 +823,10 @@ async def get_cluster_recommendations(
         
         # Get recommendations
         try:
-            recommendations = recommender.get_cluster_recommendations(user_id, n_recommendations)
-            return recommendations
+            rows = recommender.cluster_recommendation_rows(
+                user_id, n_recommendations, genre=genre, year_min=year_min, year_max=year_max
+            )
+            return RawJSONResponse(recommender.render_json(rows))
         except Exception as e:
             print(f"Error getting cluster recommendations: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Error getting cluster recommendations: {str(e)}")
@@ -262,16 +846,7 @@ if __name__ == "__main__":
     logger = logging.getLogger("uvicorn")
     
     try:
-        # Veritabanı tablolarını oluştur
-        logger.info("Veritabanı tabloları oluşturuluyor...")
-        create_tables()
-        logger.info("Veritabanı tabloları başarıyla oluşturuldu.")
-        
-        # Öneri sistemini başlat
-        logger.info("Öneri sistemi başlatılıyor...")
-        recommender = MovieRecommender(n_clusters=5)
-        logger.info("Öneri sistemi başarıyla başlatıldı.")
-        
+        # Tablolar ve öneri modeli uygulama başladıktan sonra arka planda hazırlanır (bkz. /readyz)
         # Uygulamayı başlat
         logger.info("FastAPI uygulaması başlatılıyor...")
         uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import NamedTuple, Optional
 
 class MovieBase(BaseModel):
     title: str = Field(..., min_length=1, max_length=200)
@@ -17,4 +17,16 @@ class MovieResponse(MovieBase):
 class MovieRecommendation(MovieResponse):
     predicted_rating: Optional[float] = None
     similarity_score: Optional[float] = None
-    cluster_id: Optional[int] = None 
\ No newline at end of file
+    cluster_id: Optional[int] = None
+
+class TrendingMovie(MovieResponse):
+    trending_score: float
+    watches: int
+    average_rating: Optional[float] = None
+
+class RecommendationRow(NamedTuple):
+    """Lightweight recommendation result: a movie id plus the MovieRecommendation score fields"""
+    movie_id: int
+    predicted_rating: Optional[float] = None
+    similarity_score: Optional[float] = None
+    cluster_id: Optional[int] = None
@@ -1,87 +1,693 @@
 from database import SessionLocal, User, Movie, UserMovieWatch
+import os
 import numpy as np
 import pandas as pd
 from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
-from typing import List, Tuple
+from typing import List, Tuple, Optional
 import json
-from models import MovieRecommendation  # MovieRecommendation sınıfını models.py dosyasından import et
+from models import MovieRecommendation, RecommendationRow  # MovieRecommendation sınıfını models.py dosyasından import et
+from similarity import blocked_top_k_similarity, top_k_similarity_rows, neighbors_to_sparse, PatchedSimilarity
+from retrieval import CandidatePipeline, ClusterCandidates
+from catalog import MovieCatalog, MOVIE_FIELDS, encode_fragment, render_rows
+from clustering import ClusterSearch
+from content import ContentIndex
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import copy
+import functools
+import hashlib
+import threading
+import time
 
-class MovieRecommender:
-    def __init__(self, n_clusters=5):
-        self.db = SessionLocal()
+# Ways to find similar movies: co-rating, content features, or a blend of both
+SIMILARITY_METHODS = ("collaborative", "content", "hybrid")
+
+def ratings_digest(user_ids, movie_ids, ratings) -> int:
+    """
+    Order-independent 64-bit digest of (user id, movie id, rating) cells
+    
+    The digest is the sum (mod 2**64) of a per-cell hash, so a rating change
+    updates it with one subtraction and one addition instead of a rehash of
+    the whole matrix.
+    """
+    cells = (np.asarray(user_ids, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+             ^ np.asarray(movie_ids, dtype=np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F)
+             ^ np.asarray(ratings, dtype=np.float64).view(np.uint64))
+    # splitmix64 finaliser
+    cells ^= cells >> np.uint64(30)
+    cells *= np.uint64(0xBF58476D1CE4E5B9)
+    cells ^= cells >> np.uint64(27)
+    cells *= np.uint64(0x94D049BB133111EB)
+    cells ^= cells >> np.uint64(31)
+    return int(cells.sum(dtype=np.uint64))
+
+
+class ModelState:
+    """
+    One consistent version of the model's data
+    
+    Writers build a new state, copying whatever they change, and publish it by
+    swapping a single reference, so readers never see a half-written matrix or
+    mix a matrix of one version with neighbours of another. A published state
+    is not modified again (the content index is append-only and shared).
+    """
+    
+    def __init__(self, **fields):
+        self.version = 0
         self.user_movie_matrix = None
+        self.ratings = None
+        self.column_sums = None
+        self.n_ratings = 0
+        self.ratings_digest = 0
+        self.update_digest = 0
         self.user_similarity_matrix = None
+        self.user_neighbors = None
+        self.movie_neighbors = None
+        self.catalog = None
         self.movie_features = None
+        self.movie_features_scaled = None
+        self.feature_scaler = None
+        self.content_index = None
         self.kmeans = None
-        self.n_clusters = n_clusters
-        self._build_user_movie_matrix()
-        self._build_movie_features()
-        self._fit_kmeans()
+        self.movie_clusters = None
+        self.n_clusters = None
+        self.high_water_mark = None
+        self.recent_ratings = {}
+        self.__dict__.update(fields)
+        # Values derived from this state, memoised by _derived()
+        self.derived = {}
+    
+    def replace(self, **changes) -> "ModelState":
+        """Shallow copy with some fields changed (derived values are not carried over)"""
+        state = copy.copy(self)
+        state.__dict__.update(changes)
+        state.derived = {}
+        return state
+
+
+def _state_field(name: str):
+    """Read-only recommender attribute served from the pinned (or current) model state"""
+    return property(lambda self: getattr(self._snapshot(), name))
+
+
+def consistent(method):
+    """
+    Pin the current model state for the duration of a read
+    
+    Every model attribute read inside the call, including nested calls, comes
+    from the same state even if a writer publishes a new one meanwhile.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if getattr(self._pinned, 'state', None) is not None:
+            return method(self, *args, **kwargs)
+        self._pinned.state = self._state
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._pinned.state = None
+    return wrapper
+
+
+class MovieRecommender:
+    # Model data, read from the current ModelState
+    user_movie_matrix = _state_field('user_movie_matrix')
+    user_similarity_matrix = _state_field('user_similarity_matrix')
+    user_neighbors = _state_field('user_neighbors')
+    movie_neighbors = _state_field('movie_neighbors')
+    catalog = _state_field('catalog')
+    movie_features = _state_field('movie_features')
+    movie_features_scaled = _state_field('movie_features_scaled')
+    feature_scaler = _state_field('feature_scaler')
+    content_index = _state_field('content_index')
+    kmeans = _state_field('kmeans')
+    movie_clusters = _state_field('movie_clusters')
+    n_clusters = _state_field('n_clusters')
+    high_water_mark = _state_field('high_water_mark')
+    model_version = _state_field('version')
+    _ratings = _state_field('ratings')
+    _column_sums = _state_field('column_sums')
+    _n_ratings = _state_field('n_ratings')
+    _ratings_digest = _state_field('ratings_digest')
+    _update_digest = _state_field('update_digest')
+    
+    def __init__(self, n_clusters=5, similarity_top_k: Optional[int] = None, movie_neighbors_k: int = 50,
+                 similarity_memory_mb: float = 256, similarity_n_jobs: Optional[int] = None,
+                 similarity_backend: str = "thread", similarity_spill_dir: Optional[str] = None,
+                 candidate_pipeline: Optional[CandidatePipeline] = None,
+                 cluster_pipeline: Optional[CandidatePipeline] = None,
+                 refresh_max_churn: float = 0.2, cluster_search: Optional[ClusterSearch] = None,
+                 hybrid_content_weight: float = 0.5, refresh_overlap_seconds: float = 300,
+                 max_patched_fraction: float = 0.1, db=None):
+        """
+        Args:
+            n_clusters: Number of KMeans clusters for movies
+            similarity_top_k: Keep only the k nearest users per user (None keeps the full dense matrix)
+            movie_neighbors_k: Number of precomputed similar movies per movie
+            similarity_memory_mb: Memory budget for one similarity tile, in megabytes
+            similarity_n_jobs: Workers for the blocked similarity build (defaults to the CPU count)
+            similarity_backend: "thread" or "process" pool for the blocked similarity build
+            similarity_spill_dir: Directory to spill neighbour arrays to (memory-mapped), if any
+            candidate_pipeline: Candidate generation for user recommendations (defaults to
+                neighbour, cluster and popular candidates)
+            cluster_pipeline: Candidate generation for cluster recommendations (defaults to
+                the user's favourite cluster)
+            refresh_max_churn: Fraction of changed ratings above which refresh() does a full rebuild
+            cluster_search: Pick n_clusters at every full build with this search (n_clusters is
+                kept when no count finishes within its time budget)
+            hybrid_content_weight: Weight of content similarity in hybrid similar-movie scores
+                (the rest goes to rating similarity)
+            refresh_overlap_seconds: How far before the high-water mark refresh() re-reads ratings,
+                to catch rows stamped before the mark that committed after it was read
+            max_patched_fraction: Fraction of users changed since the last full build above which
+                an incremental update rebuilds instead (dense similarity mode; each read of the
+                dense similarity recomputes every changed user)
+            db: Database session to build from (defaults to a new session on the application database)
+        """
+        self.db = db if db is not None else SessionLocal()
+        self._state = ModelState(n_clusters=n_clusters)
+        self._pinned = threading.local()
+        self.similarity_top_k = similarity_top_k
+        self.movie_neighbors_k = movie_neighbors_k
+        self.similarity_options = {
+            'memory_budget_mb': similarity_memory_mb,
+            'n_jobs': similarity_n_jobs,
+            'backend': similarity_backend,
+        }
+        self.similarity_spill_dir = similarity_spill_dir
+        self.candidate_pipeline = candidate_pipeline if candidate_pipeline is not None else CandidatePipeline.default()
+        self.cluster_pipeline = cluster_pipeline if cluster_pipeline is not None else CandidatePipeline(
+            [ClusterCandidates(limit=10000, top_clusters=1)], max_candidates=10000
+        )
+        self.refresh_max_churn = refresh_max_churn
+        self.refresh_overlap = timedelta(seconds=refresh_overlap_seconds)
+        self.max_patched_fraction = max_patched_fraction
+        self.cluster_search = cluster_search
+        self.hybrid_content_weight = hybrid_content_weight
+        self.build_report = None
+        self._cluster_search_report = None
+        self._lock = threading.RLock()
+        self._queued_ratings: List[Tuple[int, int, float]] = []
+        self._queue_lock = threading.Lock()
+        self._build()
+    
+    def _build(self):
+        """
+        Run all model build stages
+        
+        Ratings and movies are loaded first (the session is not shared between
+        threads), then the rating-matrix/similarity stage and the feature/clustering
+        stages run concurrently. The stages fill in a new ModelState, which is
+        published in one step once all of them are done. Stage timings are kept in
+        build_report.
+        """
+        start = time.perf_counter()
+        stages = {}
+        # The cluster count found by the last search is kept when no count finishes this time
+        state = ModelState(n_clusters=self._state.n_clusters)
+        self._cluster_search_report = None
+        
+        def timed(name, fn, *args):
+            stage_start = time.perf_counter()
+            result = fn(*args)
+            stages[name] = {
+                'start': stage_start - start,
+                'seconds': time.perf_counter() - stage_start,
+            }
+            return result
+        
+        def build_clusters(movies):
+            timed('movie_features', self._build_movie_features, state, movies)
+            timed('content_index', self._build_content_index, state)
+            if self.cluster_search is not None:
+                timed('cluster_search', self._search_n_clusters, state)
+            timed('kmeans', self._fit_kmeans, state)
+        
+        ratings = timed('load_ratings', self._load_ratings)
+        movies = timed('load_movies', self._load_movies)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [
+                executor.submit(timed, 'user_movie_matrix', self._build_user_movie_matrix, state, ratings),
+                executor.submit(build_clusters, movies),
+            ]
+            for future in futures:
+                future.result()
+        with self._lock:
+            self._publish(state)
+        
+        self.build_report = {
+            'model_version': state.version,
+            'n_clusters': state.n_clusters,
+            'stages': stages,
+            'cluster_search': self._cluster_search_report,
+            'seconds': time.perf_counter() - start,
+        }
+    
+    def _snapshot(self) -> ModelState:
+        """The state pinned by the running read (see consistent), or else the current one"""
+        state = getattr(self._pinned, 'state', None)
+        return state if state is not None else self._state
     
-    def _build_user_movie_matrix(self):
+    def _publish(self, state: ModelState):
+        """Make a fully built state the current one (call with _lock held)"""
+        state.version = self._state.version + 1
+        self._state = state
+    
+    def _load_ratings(self):
+        """Load all ratings as plain (user_id, movie_id, rating, watched_at) rows"""
+        return self.db.query(
+            UserMovieWatch.user_id, UserMovieWatch.movie_id, UserMovieWatch.rating, UserMovieWatch.watched_at
+        ).all()
+    
+    def _read_session(self):
+        """
+        New short-lived session for reads on request threads
+        
+        self.db is used by builds, refreshes and the rating apply loop, and
+        sessions are not thread-safe, so request-path reads open their own
+        session on the same database and close it when done.
+        """
+        return SessionLocal(bind=self.db.get_bind())
+    
+    def _load_movies(self) -> List[Movie]:
+        """Load all movies ordered by id"""
+        return self.db.query(Movie).order_by(Movie.id).all()
+    
+    def _build_user_movie_matrix(self, state: ModelState, ratings=None):
         """Build user-movie rating matrix"""
-        # Get all ratings
-        ratings = self.db.query(UserMovieWatch).all()
+        # Get all ratings (plain columns, no ORM objects)
+        if ratings is None:
+            ratings = self._load_ratings()
         
         # Create a dictionary to store user-movie ratings
         ratings_dict = {}
-        for rating in ratings:
-            if rating.user_id not in ratings_dict:
-                ratings_dict[rating.user_id] = {}
-            ratings_dict[rating.user_id][rating.movie_id] = rating.rating
+        for user_id, movie_id, rating, _ in ratings:
+            if user_id not in ratings_dict:
+                ratings_dict[user_id] = {}
+            ratings_dict[user_id][movie_id] = rating
         
-        # Convert to DataFrame
-        self.user_movie_matrix = pd.DataFrame(ratings_dict).T
+        # Convert to DataFrame and fill NaN values with 0
+        matrix = pd.DataFrame(ratings_dict).T.fillna(0)
         
-        # Fill NaN values with 0
-        self.user_movie_matrix = self.user_movie_matrix.fillna(0)
+        # Keep a handle on the values for the incremental updates of apply_ratings()
+        values = matrix.to_numpy(dtype=float, copy=True)
+        state.user_similarity_matrix, state.user_neighbors, state.movie_neighbors = self._build_similarities(values)
+        state.user_movie_matrix = pd.DataFrame(values, index=matrix.index, columns=matrix.columns, copy=False)
+        state.ratings = values
+        state.column_sums = values.sum(axis=0)
+        state.n_ratings = int(np.count_nonzero(values))
+        rows, columns = np.nonzero(values)
+        state.ratings_digest = ratings_digest(matrix.index.to_numpy()[rows], matrix.columns.to_numpy()[columns],
+                                              values[rows, columns])
         
+        # High-water mark for delta refreshes
+        state.high_water_mark, state.recent_ratings = self._watermark(ratings)
+    
+    def _spill_dir(self, name: str) -> Optional[str]:
+        """Return the spill subdirectory for a similarity build, if spilling is enabled"""
+        if self.similarity_spill_dir is None:
+            return None
+        return os.path.join(self.similarity_spill_dir, name)
+    
+    def _build_similarities(self, ratings: np.ndarray):
+        """
+        Build user similarities and precomputed movie neighbours
+        
+        Returns:
+            Tuple of (user_similarity_matrix, user_neighbors, movie_neighbors)
+        """
         # Calculate user similarity matrix
-        self.user_similarity_matrix = cosine_similarity(self.user_movie_matrix)
-    
-    def _build_movie_features(self):
-        """Build movie features matrix for clustering"""
-        movies = self.db.query(Movie).all()
-        
-        # Create features dictionary
-        features_dict = {}
-        for movie in movies:
-            # Convert genre string to one-hot encoding
-            genres = [g.strip() for g in movie.genre.split(',')]
-            genre_dict = {genre: 1 for genre in genres}
+        if self.similarity_top_k is None:
+            user_neighbors = None
+            user_similarity = PatchedSimilarity(cosine_similarity(ratings), ratings)
+        else:
+            # Blocked top-k build: memory is bounded by the tile budget, not n_users^2
+            user_neighbors = blocked_top_k_similarity(
+                ratings,
+                k=self.similarity_top_k,
+                spill_dir=self._spill_dir('users'),
+                **self.similarity_options
+            )
+            user_similarity = neighbors_to_sparse(*user_neighbors)
+        
+        # Precompute movie neighbours (item-based collaborative filtering)
+        movie_neighbors = blocked_top_k_similarity(
+            ratings.T,
+            k=self.movie_neighbors_k,
+            spill_dir=self._spill_dir('movies'),
+            **self.similarity_options
+        )
+        return user_similarity, user_neighbors, movie_neighbors
+    
+    def queue_ratings(self, ratings: List[Tuple[int, int, float]]):
+        """
+        Queue ratings for the next apply_queued() call
+        
+        Cheap enough for the request path: the model work happens later, once
+        per batch, off the request.
+        """
+        with self._queue_lock:
+            self._queued_ratings.extend(ratings)
+    
+    def apply_queued(self) -> dict:
+        """Apply every queued rating as one batch (see apply_ratings)"""
+        with self._queue_lock:
+            ratings, self._queued_ratings = self._queued_ratings, []
+        return self.apply_ratings(ratings)
+    
+    def apply_ratings(self, ratings: List[Tuple[int, int, float]]) -> dict:
+        """
+        Apply a batch of ratings to the live model without a full rebuild
+        
+        The rating matrix and neighbour arrays are copied (and grown when new
+        users or movies appear) into a new state that replaces the current one in
+        a single step, so readers keep a consistent view. Neighbour lists and the
+        popularity aggregates are recomputed only for the affected users and
+        movies; the dense user similarity matrix is not copied, its changed users
+        are recomputed on read (see PatchedSimilarity). In top-k mode, the
+        neighbour lists of unaffected users and movies are left as they are until
+        the next full build.
+        
+        Copying the rating matrix makes every batch O(users x movies) in time and
+        memory, whatever its size, so batches should be large rather than
+        frequent. Once more than max_patched_fraction of the users have changed
+        since the last full build, the model is rebuilt from the database instead
+        (the ratings are stored there before they are queued).
+        
+        Args:
+            ratings: List of (user_id, movie_id, rating) tuples; later entries win
             
-            # Combine all features
-            features = {
-                'duration': movie.duration,
-                'release_year': movie.release_year,
-                **genre_dict
-            }
-            features_dict[movie.id] = features
+        Returns:
+            Dict with the number of affected users and movies
+        """
+        if not ratings:
+            return {'users': 0, 'movies': 0}
         
-        # Convert to DataFrame
-        self.movie_features = pd.DataFrame(features_dict).T
+        with self._lock:
+            state, counts = self._with_ratings(self._state, ratings)
+            if self._too_patched(state):
+                self.rebuild()
+            else:
+                self._publish(state)
+        return counts
+    
+    def _too_patched(self, state: ModelState) -> bool:
+        """Whether so many users changed since the last full build that a rebuild is cheaper"""
+        similarity = state.user_similarity_matrix
+        if not isinstance(similarity, PatchedSimilarity):
+            return False
+        return len(similarity.changed) > self.max_patched_fraction * similarity.shape[0]
+    
+    def _with_ratings(self, state: ModelState, ratings: List[Tuple[int, int, float]]) -> Tuple[ModelState, dict]:
+        """
+        New state with a batch of ratings applied (the given state is left untouched)
+        
+        Returns:
+            Tuple of (new state, dict with the number of affected users and movies)
+        """
+        latest = {(int(user_id), int(movie_id)): float(rating) for user_id, movie_id, rating in ratings}
+        user_ids = list(dict.fromkeys(user_id for user_id, _ in latest))
+        movie_ids = list(dict.fromkeys(movie_id for _, movie_id in latest))
+        
+        # Copy the matrix, growing it for users and movies it has not seen yet
+        matrix, values = state.user_movie_matrix, state.ratings
+        new_users = [user_id for user_id in user_ids if user_id not in matrix.index]
+        new_movies = [movie_id for movie_id in movie_ids if movie_id not in matrix.columns]
+        grown = np.zeros((values.shape[0] + len(new_users), values.shape[1] + len(new_movies)))
+        grown[:values.shape[0], :values.shape[1]] = values
+        values = grown
+        matrix = pd.DataFrame(
+            values,
+            index=matrix.index.append(pd.Index(new_users)) if new_users else matrix.index,
+            columns=matrix.columns.append(pd.Index(new_movies)) if new_movies else matrix.columns,
+            copy=False
+        )
+        column_sums = np.concatenate([state.column_sums, np.zeros(len(new_movies))])
+        
+        row_positions = matrix.index.get_indexer([user_id for user_id, _ in latest])
+        col_positions = matrix.columns.get_indexer([movie_id for _, movie_id in latest])
+        new_values = np.fromiter(latest.values(), dtype=float, count=len(latest))
+        old_values = values[row_positions, col_positions]
+        values[row_positions, col_positions] = new_values
+        
+        # Aggregates: column sums drive popularity, the rating count drives refresh churn,
+        # the digest identifies the ratings in the model fingerprint
+        np.add.at(column_sums, col_positions, new_values - old_values)
+        n_ratings = state.n_ratings + int(np.count_nonzero(new_values) - np.count_nonzero(old_values))
+        pair_users = np.fromiter((user_id for user_id, _ in latest), dtype=np.int64, count=len(latest))
+        pair_movies = np.fromiter((movie_id for _, movie_id in latest), dtype=np.int64, count=len(latest))
+        added, removed = new_values != 0, old_values != 0
+        digest = (state.ratings_digest
+                  + ratings_digest(pair_users[added], pair_movies[added], new_values[added])
+                  - ratings_digest(pair_users[removed], pair_movies[removed], old_values[removed])) % 2 ** 64
+        # Neighbour lists of unaffected rows are left stale, so the model also depends on
+        # which updates were applied since the last full build: chain them into a digest
+        history = hashlib.blake2b(digest_size=8)
+        history.update(repr((state.update_digest, digest, sorted(user_ids), sorted(movie_ids))).encode())
+        update_digest = int.from_bytes(history.digest(), 'little')
+        
+        user_similarity, user_neighbors, movie_neighbors = self._update_similarities(
+            state,
+            values,
+            matrix.index.get_indexer(user_ids),
+            matrix.columns.get_indexer(movie_ids),
+            len(new_users),
+            len(new_movies)
+        )
+        
+        new_state = state.replace(
+            user_movie_matrix=matrix, ratings=values, column_sums=column_sums, n_ratings=n_ratings, ratings_digest=digest,
+            update_digest=update_digest,
+            user_similarity_matrix=user_similarity, user_neighbors=user_neighbors, movie_neighbors=movie_neighbors
+        )
+        return new_state, {'users': len(user_ids), 'movies': len(movie_ids)}
+    
+    def _update_similarities(self, state: ModelState, ratings: np.ndarray, user_positions: np.ndarray,
+                             movie_positions: np.ndarray, n_new_users: int, n_new_movies: int):
+        """
+        Recompute similarity rows for changed users and movies without touching the state's arrays
+        
+        Returns:
+            Tuple of (user_similarity_matrix, user_neighbors, movie_neighbors)
+        """
+        # User similarities
+        if self.similarity_top_k is None:
+            # The dense matrix is shared, not copied: changed users are recomputed on read
+            user_neighbors = None
+            user_similarity = state.user_similarity_matrix.updated(ratings, user_positions)
+        else:
+            user_neighbors = self._update_neighbors(
+                state.user_neighbors, ratings, user_positions, n_new_users, self.similarity_top_k
+            )
+            user_similarity = neighbors_to_sparse(*user_neighbors)
+        
+        # Movie neighbours
+        movie_neighbors = self._update_neighbors(
+            state.movie_neighbors, ratings.T, movie_positions, n_new_movies, self.movie_neighbors_k
+        )
+        return user_similarity, user_neighbors, movie_neighbors
+    
+    def _update_neighbors(self, neighbors, matrix: np.ndarray, positions: np.ndarray, n_new: int, k: int):
+        """Recompute top-k neighbour rows at the given positions on grown copies of the arrays"""
+        indices, scores = neighbors
+        row_indices, row_scores = top_k_similarity_rows(matrix, positions, k)
+        if row_indices.shape[1] != indices.shape[1]:
+            # k was capped by a tiny matrix and the matrix has grown: rebuild everything
+            return blocked_top_k_similarity(matrix, k=k, **self.similarity_options)
+        
+        # Spilled (memory-mapped) arrays are copied into memory until the next full build
+        indices = np.concatenate([indices, np.zeros((n_new, indices.shape[1]), dtype=indices.dtype)])
+        scores = np.concatenate([scores, np.zeros((n_new, scores.shape[1]), dtype=scores.dtype)])
+        indices[positions] = row_indices
+        scores[positions] = row_scores
+        return indices, scores
+    
+    def _watermark(self, rows, previous=None):
+        """
+        High-water mark after reading rows, and the rows inside its overlap window
+        
+        Args:
+            rows: (user_id, movie_id, rating, watched_at) rows just read
+            previous: High-water mark before these rows
+            
+        Returns:
+            Tuple of (mark, dict of (user_id, movie_id) -> (rating, watched_at) for the rows
+            stamped within refresh_overlap before the mark)
+        """
+        marks = [watched_at for *_, watched_at in rows if watched_at is not None]
+        if previous is not None:
+            marks.append(previous)
+        if not marks:
+            return previous, {}
+        mark = max(marks)
+        since = mark - self.refresh_overlap
+        recent = {
+            (user_id, movie_id): (rating, watched_at)
+            for user_id, movie_id, rating, watched_at in rows
+            if watched_at is not None and watched_at >= since
+        }
+        return mark, recent
+    
+    def refresh(self, max_churn: Optional[float] = None) -> dict:
+        """
+        Pull ratings changed since the last build or refresh and apply them to the model
+        
+        watched_at is stamped by the writer before its transaction commits, so a
+        row can become visible after a later-stamped row has already moved the
+        high-water mark. Each refresh therefore re-reads refresh_overlap before the
+        mark and skips rows it has already applied unchanged. Rows that commit more
+        than refresh_overlap after their stamp are only picked up by the next full
+        rebuild. If the changed rows exceed max_churn as a fraction of all ratings,
+        a full rebuild is done instead. Deleted rows are not detected; they
+        disappear at the next full rebuild.
         
-        # Fill NaN values with 0 (for genres that don't exist for some movies)
-        self.movie_features = self.movie_features.fillna(0)
+        Args:
+            max_churn: Changed-row fraction above which to rebuild (defaults to refresh_max_churn)
+            
+        Returns:
+            Dict with the refresh mode ("none", "delta" or "full"), row count and duration
+        """
+        max_churn = self.refresh_max_churn if max_churn is None else max_churn
+        start = time.perf_counter()
+        
+        with self._lock:
+            # End the previous read transaction so rows committed since are visible
+            self.db.rollback()
+            state = self._state
+            query = self.db.query(
+                UserMovieWatch.user_id, UserMovieWatch.movie_id, UserMovieWatch.rating, UserMovieWatch.watched_at
+            )
+            if state.high_water_mark is not None:
+                query = query.filter(UserMovieWatch.watched_at >= state.high_water_mark - self.refresh_overlap)
+            window = query.all()
+            rows = [
+                row for row in window
+                if state.recent_ratings.get((row[0], row[1])) != (row[2], row[3])
+            ]
+            
+            if not rows:
+                mode = 'none'
+            elif len(rows) > max_churn * max(state.n_ratings, 1):
+                self.rebuild()
+                mode = 'full'
+            else:
+                new_state, _ = self._with_ratings(
+                    state, [(user_id, movie_id, rating) for user_id, movie_id, rating, _ in rows]
+                )
+                if self._too_patched(new_state):
+                    self.rebuild()
+                    mode = 'full'
+                else:
+                    new_state.high_water_mark, new_state.recent_ratings = self._watermark(window, state.high_water_mark)
+                    self._publish(new_state)
+                    mode = 'delta'
+        
+        return {'mode': mode, 'rows': len(rows), 'seconds': time.perf_counter() - start}
+    
+    def rebuild(self):
+        """Rebuild the whole model from the database"""
+        with self._lock:
+            self.db.rollback()
+            self._build()
+    
+    def _build_movie_features(self, state: ModelState, movies=None):
+        """Build the movie catalog and the features matrix for clustering"""
+        if movies is None:
+            movies = self._load_movies()
+        state.catalog = catalog = MovieCatalog(movies)
+        
+        # Duration, year and one-hot genres straight from the catalog's attribute index
+        features = {
+            'duration': catalog.durations,
+            'release_year': catalog.years,
+        }
+        for genre in catalog.genres:
+            features[genre] = catalog.genre_masks[genre].astype(float)
+        state.movie_features = pd.DataFrame(features, index=catalog.ids, dtype=float)
         
         # Scale the features
-        scaler = StandardScaler()
-        self.movie_features_scaled = pd.DataFrame(
-            scaler.fit_transform(self.movie_features),
-            columns=self.movie_features.columns,
-            index=self.movie_features.index
+        state.feature_scaler = StandardScaler()
+        state.movie_features_scaled = pd.DataFrame(
+            state.feature_scaler.fit_transform(state.movie_features),
+            columns=state.movie_features.columns,
+            index=state.movie_features.index
+        )
+    
+    def _build_content_index(self, state: ModelState):
+        """Index the movie features for content-based similar movies (scaled like movie_features_scaled)"""
+        index = ContentIndex(
+            state.movie_features.columns, state.feature_scaler.mean_, state.feature_scaler.scale_,
+            capacity=max(2 * len(state.movie_features), 1024)
         )
+        index.add(state.movie_features.index.to_numpy(), state.movie_features.to_numpy())
+        state.content_index = index
+    
+    def add_movie(self, movie: Movie):
+        """
+        Add a new movie to the catalog and the content index
+        
+        The movie is listed and gets content-based similar movies right away. It
+        joins the rating matrix with its first rating, and the clusters at the
+        next full build.
+        """
+        with self._lock:
+            state = self._state
+            index = state.content_index
+            index.add([movie.id], index.encode(movie.genre, movie.release_year, movie.duration))
+            self._publish(state.replace(catalog=state.catalog.extended([movie])))
+    
+    def _search_n_clusters(self, state: ModelState):
+        """Choose n_clusters with the configured cluster search (on the scaled features)"""
+        best, self._cluster_search_report = self.cluster_search.search(state.movie_features_scaled.to_numpy())
+        if best is not None:
+            state.n_clusters = best
     
-    def _fit_kmeans(self):
+    def _fit_kmeans(self, state: ModelState):
         """Fit KMeans clustering on movie features"""
-        self.kmeans = KMeans(n_clusters=self.n_clusters, random_state=42)
-        self.movie_clusters = self.kmeans.fit_predict(self.movie_features_scaled)
+        state.kmeans = KMeans(n_clusters=state.n_clusters, random_state=42)
+        state.movie_clusters = state.kmeans.fit_predict(state.movie_features_scaled)
         
         # Add cluster labels to movie features
-        self.movie_features['cluster'] = self.movie_clusters
+        state.movie_features['cluster'] = state.movie_clusters
+    
+    @consistent
+    def listing_ids(self, cluster_id: Optional[int] = None) -> np.ndarray:
+        """
+        Sorted movie ids of the catalog, or of one cluster, for keyset-paginated listings
+        
+        Args:
+            cluster_id: Only list movies in this cluster
+            
+        Returns:
+            Sorted array of movie ids (kept in memory per model version)
+            
+        Raises:
+            ValueError: If the cluster does not exist
+        """
+        if cluster_id is None:
+            return self._derived('catalog_ids', lambda matrix: np.sort(self.catalog.ids))
+        if cluster_id < 0 or cluster_id >= self.n_clusters:
+            raise ValueError(f"Cluster {cluster_id} does not exist")
+        # Clusters cover the movies of the last full build (movies added since have none yet)
+        return self._derived('cluster_ids', lambda matrix: {
+            cluster: np.sort(self.movie_features.index.to_numpy(dtype=np.int64)[self.movie_clusters == cluster])
+            for cluster in range(self.n_clusters)
+        })[cluster_id]
     
+    @consistent
+    def listing(self, cluster_id: Optional[int] = None) -> Tuple[MovieCatalog, np.ndarray]:
+        """
+        The catalog together with its listing_ids(), from the same model state
+        
+        Raises:
+            ValueError: If the cluster does not exist
+        """
+        return self.catalog, self.listing_ids(cluster_id)
+    
+    @consistent
     def get_movies_by_cluster(self, cluster_id: int) -> List[Movie]:
         """
         Get all movies in a specific cluster
@@ -96,214 +702,633 @@ class MovieRecommender:
             raise ValueError(f"Cluster {cluster_id} does not exist")
         
         # Get movie IDs in the cluster
-        cluster_movie_ids = self.movie_features[self.movie_features['cluster'] == cluster_id].index
+        cluster_movie_ids = self.listing_ids(cluster_id).tolist()
         
-        # Get Movie objects
-        movies = self.db.query(Movie).filter(Movie.id.in_(cluster_movie_ids)).all()
+        # Get Movie objects, keeping each IN list bounded
+        movies = []
+        db = self._read_session()
+        try:
+            for start in range(0, len(cluster_movie_ids), 500):
+                chunk = cluster_movie_ids[start:start + 500]
+                movies.extend(db.query(Movie).filter(Movie.id.in_(chunk)).order_by(Movie.id).all())
+        finally:
+            db.close()
         return movies
     
-    def get_cluster_recommendations(self, user_id: int, n_recommendations: int = 5) -> List[MovieRecommendation]:
+    @consistent
+    def _derived(self, name: str, compute):
+        """Memoise a value derived from the model state (each state keeps its own values)"""
+        derived = self._snapshot().derived
+        if name not in derived:
+            derived[name] = compute(self.user_movie_matrix)
+        return derived[name]
+    
+    @consistent
+    def model_fingerprint(self, shared: bool = False) -> str:
+        """
+        Content hash of the current model, for cache keys shared across processes and restarts
+        
+        Unlike model_version, which counts updates within one process, the
+        fingerprint is the same for every process that built or updated its model
+        from the same ratings with the same options. The ratings are identified by
+        a digest of every (user, movie, rating) cell, kept up to date incrementally.
+        Incremental updates leave some neighbour lists stale, so the batches applied
+        since the last full build are chained into the fingerprint as well: an
+        updated model only shares it with models built and updated the same way.
+        
+        Args:
+            shared: Leave the applied batches out, so that any process holding the
+                same ratings (e.g. one built since) gets the same fingerprint. Results
+                under it may come from a model with stale neighbour lists, until the
+                next full build of the process that wrote them.
+        """
+        def compute(matrix):
+            digest = hashlib.blake2b(digest_size=8)
+            digest.update(repr((
+                matrix.shape, self._n_ratings, self._ratings_digest, None if shared else self._update_digest,
+                self.n_clusters, len(self.catalog), len(self.content_index), self.similarity_top_k,
+                self.movie_neighbors_k, self.hybrid_content_weight
+            )).encode())
+            digest.update(np.ascontiguousarray(matrix.columns.to_numpy(dtype=np.int64)).tobytes())
+            return digest.hexdigest()
+        return self._derived('shared_fingerprint' if shared else 'fingerprint', compute)
+    
+    @consistent
+    def column_clusters(self) -> np.ndarray:
+        """Cluster id for every column of the user-movie matrix (-1 for movies without features)"""
+        return self._derived('column_clusters', lambda matrix: (
+            self.movie_features['cluster'].reindex(matrix.columns).fillna(-1).to_numpy(dtype=np.int64)
+        ))
+    
+    @consistent
+    def popular_columns(self) -> np.ndarray:
+        """Column positions of the user-movie matrix ordered by average rating, best first"""
+        # Column sums order movies exactly like column means and are kept up to date incrementally
+        return self._derived('popular_columns', lambda matrix: np.argsort(-self._column_sums, kind='stable'))
+    
+    @consistent
+    def cluster_popular_columns(self) -> dict:
+        """Column positions ordered by average rating for each cluster (cold-start fallback lists)"""
+        def compute(matrix):
+            popular = self.popular_columns()
+            clusters = self.column_clusters()[popular]
+            return {cluster_id: popular[clusters == cluster_id] for cluster_id in range(self.n_clusters)}
+        return self._derived('cluster_popular_columns', compute)
+    
+    def _score_candidates(self, user_idx: int, candidates: np.ndarray) -> np.ndarray:
+        """
+        Predict ratings for candidate movies as a similarity-weighted average of other users' ratings
+        
+        Args:
+            user_idx: Row position of the user in the user-movie matrix
+            candidates: Column positions of the movies to score
+            
+        Returns:
+            Array of predicted ratings aligned with candidates
+        """
+        ratings = self.user_movie_matrix.to_numpy()
+        similar_users = self.user_similarity_matrix[user_idx]
+        if sparse.issparse(similar_users):
+            # Top-k mode: only the neighbours contribute
+            neighbors, weights = similar_users.indices, similar_users.data
+            weighted = weights @ ratings[np.ix_(neighbors, candidates)]
+        else:
+            weights = np.asarray(similar_users)
+            weighted = weights @ ratings[:, candidates]
+        return weighted / (weights.sum() + 1e-8)
+    
+    def _column_filter(self, genre: Optional[str] = None, year_min: Optional[int] = None,
+                       year_max: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        Boolean mask over user-movie matrix columns for the given attribute filters
+        
+        Returns:
+            Mask, or None when no filter is given
+        """
+        mask = self.catalog.mask(genre, year_min, year_max)
+        if mask is None:
+            return None
+        positions = self._derived('catalog_positions', lambda matrix: self.catalog.positions(matrix.columns))
+        return MovieCatalog.align(mask, positions)
+    
+    @consistent
+    def rank_movies(self, user_id: int, n_recommendations: int = 5, pipeline=None,
+                    report: Optional[dict] = None, genre: Optional[str] = None,
+                    year_min: Optional[int] = None, year_max: Optional[int] = None,
+                    favourite_cluster_only: bool = False) -> List[Tuple[int, float]]:
+        """
+        Rank unrated movies for a user without loading Movie rows
+        
+        Users that are not in the model yet are served by the cold-start path
+        (see _rank_cold_start) instead of raising.
+        
+        Args:
+            user_id: ID of the user to rank movies for
+            n_recommendations: Number of movies to return
+            pipeline: CandidatePipeline for the first stage (None scores every unrated movie)
+            report: Optional dict filled with candidate sources, sizes and timings
+            genre: Only rank movies of this genre
+            year_min: Only rank movies released in or after this year
+            year_max: Only rank movies released in or before this year
+            favourite_cluster_only: For users not in the model, only rank their favourite cluster
+                (known users get this from the cluster pipeline)
+            
+        Returns:
+            List of (movie_id, predicted_rating) tuples, best first
+            
+        Raises:
+            ValueError: If the user does not exist
+        """
+        matrix = self.user_movie_matrix
+        allowed = self._column_filter(genre, year_min, year_max)
+        if user_id not in matrix.index:
+            return self._rank_cold_start(user_id, n_recommendations, allowed, report, favourite_cluster_only)
+        
+        user_idx = matrix.index.get_loc(user_id)
+        user_ratings = matrix.to_numpy()[user_idx]
+        unrated = user_ratings == 0
+        if allowed is not None:
+            unrated &= allowed
+        
+        if pipeline is not None:
+            candidates = pipeline.retrieve(self, user_idx, user_ratings, report, allowed=allowed)
+        else:
+            candidates = np.flatnonzero(unrated)
+            if report is not None:
+                report['candidates'] = int(len(candidates))
+        if len(candidates) == 0 and pipeline is not None:
+            # Nothing retrieved: fall back to every unrated movie
+            candidates = np.flatnonzero(unrated)
+        
+        start = time.perf_counter()
+        predictions = self._score_candidates(user_idx, candidates)
+        order = np.argsort(-predictions, kind='stable')[:n_recommendations]
+        if report is not None:
+            report['scoring_ms'] = (time.perf_counter() - start) * 1000
+        
+        return [(int(matrix.columns[candidates[i]]), float(predictions[i])) for i in order]
+    
+    def _cold_start_ratings(self, user_id: int) -> dict:
+        """
+        Load the ratings of a user that is not in the model from the database
+        
+        Returns:
+            Dict of movie id to rating
+            
+        Raises:
+            ValueError: If the user does not exist
+        """
+        db = self._read_session()
+        try:
+            rows = db.query(UserMovieWatch.movie_id, UserMovieWatch.rating).filter(
+                UserMovieWatch.user_id == user_id
+            ).all()
+            if not rows and not db.query(User.id).filter(User.id == user_id).first():
+                raise ValueError(f"User {user_id} not found in the database")
+        finally:
+            db.close()
+        return {movie_id: rating for movie_id, rating in rows}
+    
+    def has_user(self, user_id: int) -> bool:
+        """Whether the user has ratings in the model (no database read)"""
+        return user_id in self.user_movie_matrix.index
+    
+    def _user_vector(self, user_id: int) -> Tuple[np.ndarray, Optional[int]]:
+        """
+        Ratings of a user aligned with the user-movie matrix columns, plus their favourite cluster
+        
+        Users that are not in the model are read from the database.
+        
+        Raises:
+            ValueError: If the user does not exist
+        """
+        matrix = self.user_movie_matrix
+        if user_id in matrix.index:
+            user_ratings = matrix.to_numpy()[matrix.index.get_loc(user_id)]
+            rated_clusters = self.column_clusters()[user_ratings > 0]
+            rated_clusters = rated_clusters[rated_clusters >= 0]
+            favourite_cluster = int(np.bincount(rated_clusters).argmax()) if len(rated_clusters) else None
+            return user_ratings, favourite_cluster
+        
+        ratings = self._cold_start_ratings(user_id)
+        positions = matrix.columns.get_indexer(list(ratings))
+        known = positions >= 0
+        user_ratings = np.zeros(len(matrix.columns))
+        user_ratings[positions[known]] = np.fromiter(ratings.values(), dtype=float, count=len(ratings))[known]
+        
+        # Favourite cluster from every rated movie with features, also ones nobody else rated yet
+        clusters = self.movie_features['cluster']
+        rated_clusters = [int(clusters[movie_id]) for movie_id in ratings if movie_id in clusters.index]
+        favourite_cluster = int(np.bincount(rated_clusters).argmax()) if rated_clusters else None
+        return user_ratings, favourite_cluster
+    
+    def _rank_item_based(self, user_ratings: np.ndarray, favourite_cluster: Optional[int], n_recommendations: int,
+                         allowed: Optional[np.ndarray], favourite_cluster_only: bool = False,
+                         use_neighbors: bool = True) -> Tuple[List[Tuple[int, float]], Optional[str]]:
+        """
+        Rank unrated movies from precomputed structures only
+        
+        Rated movies are folded in against the precomputed movie neighbours
+        (item-based: a similarity-weighted average of the user's own ratings), and
+        the list is filled up from the precomputed popularity list of the user's
+        favourite cluster, or the global one.
+        
+        Args:
+            user_ratings: The user's ratings aligned with the matrix columns (0 means unrated)
+            favourite_cluster: Cluster the user rated most, if any
+            n_recommendations: Number of movies to return
+            allowed: Optional boolean mask of columns passing attribute filters
+            favourite_cluster_only: Only rank movies from the favourite cluster
+            use_neighbors: Fold in through movie neighbours (False serves popularity only)
+            
+        Returns:
+            Tuple of (list of (movie_id, predicted_rating) tuples, tier used)
+        """
+        matrix = self.user_movie_matrix
+        rated = np.flatnonzero(user_ratings > 0)
+        eligible = user_ratings == 0
+        if allowed is not None:
+            eligible &= allowed
+        if favourite_cluster_only and favourite_cluster is not None:
+            eligible &= self.column_clusters() == favourite_cluster
+        
+        ranked, tier = [], None
+        if use_neighbors and len(rated) > 0:
+            neighbor_indices, neighbor_scores = self.movie_neighbors
+            neighbors = np.asarray(neighbor_indices[rated])
+            weights = np.clip(np.asarray(neighbor_scores[rated], dtype=float), 0, None)
+            numerator = np.zeros(len(matrix.columns))
+            denominator = np.zeros(len(matrix.columns))
+            np.add.at(numerator, neighbors.ravel(), (weights * user_ratings[rated][:, None]).ravel())
+            np.add.at(denominator, neighbors.ravel(), weights.ravel())
+            
+            candidates = np.flatnonzero(eligible & (denominator > 0))
+            if len(candidates) > 0:
+                predictions = numerator[candidates] / denominator[candidates]
+                order = np.argsort(-predictions, kind='stable')[:n_recommendations]
+                ranked = [(int(matrix.columns[candidates[i]]), float(predictions[i])) for i in order]
+                eligible[candidates[order]] = False
+                tier = 'fold_in'
+        
+        # Precomputed popularity fallbacks, also filling up a short fold-in list
+        if len(ranked) < n_recommendations:
+            if favourite_cluster is not None:
+                popular, fallback_tier = self.cluster_popular_columns()[favourite_cluster], 'cluster_popular'
+            else:
+                popular, fallback_tier = self.popular_columns(), 'popular'
+            popular = popular[eligible[popular]][:n_recommendations - len(ranked)]
+            averages = self._column_sums[popular] / max(len(matrix.index), 1)
+            ranked += [(int(movie_id), float(average)) for movie_id, average in zip(matrix.columns[popular], averages)]
+            tier = tier or fallback_tier
+        return ranked, tier
+    
+    def _rank_cold_start(self, user_id: int, n_recommendations: int, allowed: Optional[np.ndarray],
+                         report: Optional[dict], favourite_cluster_only: bool = False) -> List[Tuple[int, float]]:
+        """
+        Rank movies for a user that is not in the model, without a rebuild
+        
+        The user's stored ratings are folded in through the precomputed movie
+        neighbours, falling back to popular movies (see _rank_item_based).
+        
+        Args:
+            user_id: ID of the user to rank movies for
+            n_recommendations: Number of movies to return
+            allowed: Optional boolean mask of columns passing attribute filters
+            report: Optional dict; its cold_start key is set to the tier used
+            favourite_cluster_only: Only rank movies from the user's favourite cluster
+            
+        Returns:
+            List of (movie_id, predicted_rating) tuples, best first
+        """
+        user_ratings, favourite_cluster = self._user_vector(user_id)
+        ranked, tier = self._rank_item_based(
+            user_ratings, favourite_cluster, n_recommendations, allowed, favourite_cluster_only
+        )
+        if report is not None:
+            report['cold_start'] = tier
+            report['candidates'] = len(ranked)
+        return ranked
+    
+    def _movie_records(self, movie_ids: List[int]) -> dict:
+        """
+        Get movie fields for the given ids from the catalog
+        
+        Movies added after the last build are loaded from the database with a single query.
+        
+        Returns:
+            Dict of movie id to a dict of Movie fields
+        """
+        records = {movie_id: self.catalog.records[movie_id] for movie_id in movie_ids if movie_id in self.catalog.records}
+        missing = [movie_id for movie_id in movie_ids if movie_id not in records]
+        if missing:
+            db = self._read_session()
+            try:
+                for movie in db.query(Movie).filter(Movie.id.in_(missing)).all():
+                    records[movie.id] = {field: getattr(movie, field) for field in MOVIE_FIELDS}
+            finally:
+                db.close()
+        return records
+    
+    def _existing_rows(self, rows: List[RecommendationRow], limit: Optional[int] = None) -> List[RecommendationRow]:
+        """Drop rows whose movie no longer exists, keeping at most limit rows"""
+        records = self._movie_records([row.movie_id for row in rows])
+        return [row for row in rows if row.movie_id in records][:limit]
+    
+    @consistent
+    def to_recommendations(self, rows: List[RecommendationRow]) -> List[MovieRecommendation]:
+        """Build MovieRecommendation objects for result rows"""
+        records = self._movie_records([row.movie_id for row in rows])
+        return [
+            MovieRecommendation(
+                **records[row.movie_id],
+                predicted_rating=row.predicted_rating,
+                similarity_score=row.similarity_score,
+                cluster_id=row.cluster_id
+            )
+            for row in rows if row.movie_id in records
+        ]
+    
+    @consistent
+    def render_json(self, rows: List[RecommendationRow]) -> bytes:
+        """
+        Serialise result rows straight to a JSON array of MovieRecommendation objects
+        
+        Uses the catalog's pre-serialised movie fragments, so no pydantic model is
+        built or validated per movie.
+        """
+        missing = [row.movie_id for row in rows if row.movie_id not in self.catalog.fragments]
+        extra = {movie_id: encode_fragment(record) for movie_id, record in self._movie_records(missing).items()}
+        return render_rows(rows, self.catalog.fragments, extra)
+    
+    @consistent
+    def cluster_recommendation_rows(self, user_id: int, n_recommendations: int = 5, genre: Optional[str] = None,
+                                    year_min: Optional[int] = None,
+                                    year_max: Optional[int] = None) -> List[RecommendationRow]:
+        """Result rows for get_cluster_recommendations"""
+        ranked = self.rank_movies(user_id, n_recommendations, pipeline=self.cluster_pipeline,
+                                  genre=genre, year_min=year_min, year_max=year_max, favourite_cluster_only=True)
+        clusters = self.movie_features['cluster']
+        return self._existing_rows([
+            RecommendationRow(
+                movie_id,
+                predicted_rating=predicted_rating,
+                cluster_id=int(clusters[movie_id]) if movie_id in clusters.index else None
+            )
+            for movie_id, predicted_rating in ranked
+        ])
+    
+    @consistent
+    def get_cluster_recommendations(self, user_id: int, n_recommendations: int = 5, genre: Optional[str] = None,
+                                    year_min: Optional[int] = None,
+                                    year_max: Optional[int] = None) -> List[MovieRecommendation]:
         """
         Get movie recommendations for a user using cluster-based collaborative filtering
         
+        Candidates come from cluster_pipeline (by default the user's favourite cluster).
+        
         Args:
             user_id: ID of the user to get recommendations for
             n_recommendations: Number of recommendations to return
+            genre: Only recommend movies of this genre
+            year_min: Only recommend movies released in or after this year
+            year_max: Only recommend movies released in or before this year
             
         Returns:
             List of MovieRecommendation objects
         """
-        if user_id not in self.user_movie_matrix.index:
-            raise ValueError(f"User {user_id} not found in the database")
+        return self.to_recommendations(self.cluster_recommendation_rows(
+            user_id, n_recommendations, genre=genre, year_min=year_min, year_max=year_max
+        ))
+    
+    @consistent
+    def user_recommendation_rows(self, user_id: int, n_recommendations: int = 5, report: Optional[dict] = None,
+                                 genre: Optional[str] = None, year_min: Optional[int] = None,
+                                 year_max: Optional[int] = None) -> List[RecommendationRow]:
+        """Result rows for get_user_recommendations"""
+        ranked = self.rank_movies(user_id, n_recommendations, pipeline=self.candidate_pipeline, report=report,
+                                  genre=genre, year_min=year_min, year_max=year_max)
+        return self._existing_rows([
+            RecommendationRow(movie_id, predicted_rating=predicted_rating) for movie_id, predicted_rating in ranked
+        ])
+    
+    @consistent
+    def fallback_recommendation_rows(self, user_id: int, n_recommendations: int = 5, use_neighbors: bool = True,
+                                     genre: Optional[str] = None, year_min: Optional[int] = None,
+                                     year_max: Optional[int] = None) -> List[RecommendationRow]:
+        """
+        Cheap approximation of user_recommendation_rows for degraded serving
         
-        # Get user's rated movies
-        user_ratings = self.user_movie_matrix.loc[user_id]
-        unrated_movies = user_ratings[user_ratings == 0].index
+        Skips the user-similarity scorer: movies come from the user's movie
+        neighbours and favourite-cluster popularity (see _rank_item_based), or
+        from popularity alone when use_neighbors is False. Popularity alone
+        never reads the database: users not in the model get the global list.
         
-        # Get user's favorite cluster
-        rated_movies = user_ratings[user_ratings > 0].index
-        if len(rated_movies) > 0:
-            favorite_cluster = self.movie_features.loc[rated_movies, 'cluster'].mode()[0]
+        Raises:
+            ValueError: If the user does not exist (only checked with use_neighbors)
+        """
+        if use_neighbors or self.has_user(user_id):
+            user_ratings, favourite_cluster = self._user_vector(user_id)
         else:
-            # If user hasn't rated any movies, use random cluster
-            favorite_cluster = np.random.randint(0, self.n_clusters)
-        
-        # Get movies from favorite cluster that user hasn't rated
-        cluster_movies = self.movie_features[
-            (self.movie_features['cluster'] == favorite_cluster) & 
-            (self.movie_features.index.isin(unrated_movies))
-        ].index
-        
-        if len(cluster_movies) == 0:
-            # If no movies in favorite cluster, get from all unrated movies
-            cluster_movies = unrated_movies
-        
-        # Calculate predicted ratings for cluster movies
-        predictions = []
-        for movie_id in cluster_movies:
-            # Get ratings for this movie from similar users
-            movie_ratings = self.user_movie_matrix[movie_id]
-            
-            # Calculate weighted average of ratings
-            weighted_ratings = movie_ratings * self.user_similarity_matrix[self.user_movie_matrix.index.get_loc(user_id)]
-            predicted_rating = weighted_ratings.sum() / (self.user_similarity_matrix[self.user_movie_matrix.index.get_loc(user_id)].sum() + 1e-8)
-            
-            predictions.append((movie_id, predicted_rating))
-        
-        # Sort predictions by rating
-        predictions.sort(key=lambda x: x[1], reverse=True)
-        
-        # Get top N recommendations
-        top_recommendations = []
-        for movie_id, predicted_rating in predictions[:n_recommendations]:
-            movie = self.db.query(Movie).filter(Movie.id == movie_id).first()
-            if movie:
-                top_recommendations.append(MovieRecommendation(
-                    id=movie.id,
-                    title=movie.title,
-                    genre=movie.genre,
-                    release_year=movie.release_year,
-                    duration=movie.duration,
-                    description=movie.description,
-                    predicted_rating=predicted_rating,
-                    cluster_id=favorite_cluster
-                ))
-        
-        return top_recommendations
-    
-    def get_user_recommendations(self, user_id: int, n_recommendations: int = 5) -> List[MovieRecommendation]:
+            user_ratings, favourite_cluster = np.zeros(len(self.user_movie_matrix.columns)), None
+        ranked, _ = self._rank_item_based(
+            user_ratings, favourite_cluster, n_recommendations, self._column_filter(genre, year_min, year_max),
+            use_neighbors=use_neighbors
+        )
+        return self._existing_rows([
+            RecommendationRow(movie_id, predicted_rating=predicted_rating) for movie_id, predicted_rating in ranked
+        ])
+    
+    @consistent
+    def get_user_recommendations(self, user_id: int, n_recommendations: int = 5, report: Optional[dict] = None,
+                                 genre: Optional[str] = None, year_min: Optional[int] = None,
+                                 year_max: Optional[int] = None) -> List[MovieRecommendation]:
         """
         Get movie recommendations for a user using collaborative filtering
         
+        Candidates are retrieved by candidate_pipeline and only those are scored.
+        
         Args:
             user_id: ID of the user to get recommendations for
             n_recommendations: Number of recommendations to return
+            report: Optional dict filled with candidate sources, sizes and timings
+            genre: Only recommend movies of this genre
+            year_min: Only recommend movies released in or after this year
+            year_max: Only recommend movies released in or before this year
             
         Returns:
             List of MovieRecommendation objects
         """
-        if user_id not in self.user_movie_matrix.index:
-            raise ValueError(f"User {user_id} not found in the database")
+        return self.to_recommendations(self.user_recommendation_rows(
+            user_id, n_recommendations, report=report, genre=genre, year_min=year_min, year_max=year_max
+        ))
+    
+    @consistent
+    def similar_movie_rows(self, movie_id: int, n_similar: int = 5, genre: Optional[str] = None,
+                           year_min: Optional[int] = None, year_max: Optional[int] = None,
+                           method: str = "collaborative") -> List[RecommendationRow]:
+        """Result rows for get_similar_movies"""
+        if method not in SIMILARITY_METHODS:
+            raise ValueError(f"Unknown similarity method: {method}")
+        if method == "content" or (movie_id not in self.user_movie_matrix.columns and movie_id in self.content_index):
+            # Movies without ratings (e.g. just added) only have content neighbours
+            return self._content_similar_rows(movie_id, n_similar, genre, year_min, year_max)
+        if method == "hybrid":
+            return self._hybrid_similar_rows(movie_id, n_similar, genre, year_min, year_max)
+        return self._collaborative_similar_rows(movie_id, n_similar, genre, year_min, year_max)
+    
+    def _collaborative_similar_rows(self, movie_id: int, n_similar: int, genre: Optional[str],
+                                    year_min: Optional[int], year_max: Optional[int]) -> List[RecommendationRow]:
+        """Similar movies by co-rating (precomputed movie neighbours)"""
+        if movie_id not in self.user_movie_matrix.columns:
+            raise ValueError(f"Movie {movie_id} not found in the database")
         
-        # Get user's rated movies
-        user_ratings = self.user_movie_matrix.loc[user_id]
-        unrated_movies = user_ratings[user_ratings == 0].index
+        matrix = self.user_movie_matrix
+        movie_idx = matrix.columns.get_loc(movie_id)
+        allowed = self._column_filter(genre, year_min, year_max)
         
-        # Get similar users
-        user_idx = self.user_movie_matrix.index.get_loc(user_id)
-        similar_users = self.user_similarity_matrix[user_idx]
+        # Use the precomputed neighbours, filtered before top-k
+        neighbor_indices, neighbor_scores = self.movie_neighbors
+        indices = np.asarray(neighbor_indices[movie_idx])
+        scores = np.asarray(neighbor_scores[movie_idx])
+        if allowed is not None:
+            keep = allowed[indices]
+            indices, scores = indices[keep], scores[keep]
         
-        # Calculate predicted ratings for unrated movies
-        predictions = []
-        for movie_id in unrated_movies:
-            # Get ratings for this movie from similar users
-            movie_ratings = self.user_movie_matrix[movie_id]
-            
-            # Calculate weighted average of ratings
-            weighted_ratings = movie_ratings * similar_users
-            predicted_rating = weighted_ratings.sum() / (similar_users.sum() + 1e-8)
-            
-            predictions.append((movie_id, predicted_rating))
+        if len(indices) < n_similar and neighbor_indices.shape[1] < len(matrix.columns) - 1:
+            # Not enough precomputed neighbours: compute this movie's full similarity row
+            movie_ratings = matrix.to_numpy().T
+            row = cosine_similarity(movie_ratings[movie_idx:movie_idx + 1], movie_ratings)[0]
+            row[movie_idx] = -np.inf  # Skip the movie itself
+            if allowed is not None:
+                row[~allowed] = -np.inf
+            indices = np.argsort(-row, kind='stable')
+            indices = indices[np.isfinite(row[indices])]
+            scores = row[indices]
         
-        # Sort predictions by rating
-        predictions.sort(key=lambda x: x[1], reverse=True)
+        return self._existing_rows([
+            RecommendationRow(int(similar_movie_id), similarity_score=float(similarity_score))  # Convert numpy types
+            for similar_movie_id, similarity_score in zip(matrix.columns[indices], scores)
+        ], limit=n_similar)
+    
+    def _content_similar_rows(self, movie_id: int, n_similar: int, genre: Optional[str],
+                              year_min: Optional[int], year_max: Optional[int]) -> List[RecommendationRow]:
+        """Similar movies by content features (duration, release year and genres)"""
+        index = self.content_index
+        movie_ids, scores = index.neighbors(movie_id, n_similar, allowed=index.mask(genre, year_min, year_max))
+        return self._existing_rows([
+            RecommendationRow(int(similar_movie_id), similarity_score=float(similarity_score))
+            for similar_movie_id, similarity_score in zip(movie_ids, scores)
+        ], limit=n_similar)
+    
+    def _hybrid_similar_rows(self, movie_id: int, n_similar: int, genre: Optional[str],
+                             year_min: Optional[int], year_max: Optional[int]) -> List[RecommendationRow]:
+        """
+        Similar movies by a weighted blend of rating and content similarity
+        
+        Candidates are the movie's rating neighbours and its nearest content
+        neighbours; each is scored as (1 - w) * rating similarity + w * content
+        similarity, with w = hybrid_content_weight and rating similarity 0 for
+        content candidates that are not among the precomputed rating neighbours.
+        """
+        if movie_id not in self.user_movie_matrix.columns:
+            raise ValueError(f"Movie {movie_id} not found in the database")
+        weight = self.hybrid_content_weight
+        matrix = self.user_movie_matrix
+        allowed = self._column_filter(genre, year_min, year_max)
+        
+        neighbor_indices, neighbor_scores = self.movie_neighbors
+        movie_idx = matrix.columns.get_loc(movie_id)
+        indices = np.asarray(neighbor_indices[movie_idx])
+        scores = np.asarray(neighbor_scores[movie_idx])
+        if allowed is not None:
+            keep = allowed[indices]
+            indices, scores = indices[keep], scores[keep]
+        rating_scores = dict(zip(matrix.columns[indices].tolist(), scores.tolist()))
         
-        # Get top N recommendations
-        top_recommendations = []
-        for movie_id, predicted_rating in predictions[:n_recommendations]:
-            movie = self.db.query(Movie).filter(Movie.id == movie_id).first()
-            if movie:
-                top_recommendations.append(MovieRecommendation(
-                    id=movie.id,
-                    title=movie.title,
-                    genre=movie.genre,
-                    release_year=movie.release_year,
-                    duration=movie.duration,
-                    description=movie.description,
-                    predicted_rating=predicted_rating
-                ))
+        index = self.content_index
+        candidates = set(rating_scores)
+        if movie_id in index:
+            content_ids, _ = index.neighbors(
+                movie_id, max(n_similar, neighbor_indices.shape[1]), allowed=index.mask(genre, year_min, year_max)
+            )
+            candidates.update(content_ids.tolist())
+        candidates.discard(movie_id)
+        candidates = np.array(sorted(candidates), dtype=np.int64)
+        if not len(candidates):
+            return []
         
-        return top_recommendations
+        content_scores = index.similarity(movie_id, candidates) if movie_id in index else np.zeros(len(candidates))
+        blended = (1 - weight) * np.array([rating_scores.get(candidate, 0.0) for candidate in candidates.tolist()]) \
+            + weight * content_scores
+        order = np.argsort(-blended, kind='stable')
+        return self._existing_rows([
+            RecommendationRow(int(candidates[position]), similarity_score=float(blended[position]))
+            for position in order
+        ], limit=n_similar)
     
-    def get_similar_movies(self, movie_id: int, n_similar: int = 5) -> List[MovieRecommendation]:
+    @consistent
+    def get_similar_movies(self, movie_id: int, n_similar: int = 5, genre: Optional[str] = None,
+                           year_min: Optional[int] = None, year_max: Optional[int] = None,
+                           method: str = "collaborative") -> List[MovieRecommendation]:
         """
-        Get similar movies based on user ratings
+        Get similar movies based on user ratings, content features or both
+        
+        Movies nobody has rated yet are matched on content whatever the method.
         
         Args:
             movie_id: ID of the movie to find similar movies for
             n_similar: Number of similar movies to return
+            genre: Only return movies of this genre
+            year_min: Only return movies released in or after this year
+            year_max: Only return movies released in or before this year
+            method: "collaborative" (co-rating), "content" (duration, year and genres)
+                or "hybrid" (weighted blend, see hybrid_content_weight)
             
         Returns:
             List of MovieRecommendation objects
+            
+        Raises:
+            ValueError: If the movie does not exist or the method is unknown
         """
-        if movie_id not in self.user_movie_matrix.columns:
-            raise ValueError(f"Movie {movie_id} not found in the database")
-        
-        # Calculate movie similarity using item-based collaborative filtering
-        movie_similarity = cosine_similarity(self.user_movie_matrix.T)
-        movie_idx = self.user_movie_matrix.columns.get_loc(movie_id)
-        
-        # Get similar movies
-        similar_movies = []
-        for idx, similarity in enumerate(movie_similarity[movie_idx]):
-            if idx != movie_idx:  # Skip the movie itself
-                similar_movie_id = int(self.user_movie_matrix.columns[idx])  # Convert numpy.int64 to int
-                movie = self.db.query(Movie).filter(Movie.id == similar_movie_id).first()
-                if movie:
-                    similar_movies.append((movie, float(similarity)))  # Convert numpy.float64 to float
-        
-        # Sort by similarity and return top N
-        similar_movies.sort(key=lambda x: x[1], reverse=True)
-        
-        # Convert to MovieRecommendation objects
-        movie_recommendations = []
-        for movie, similarity_score in similar_movies[:n_similar]:
-            movie_recommendations.append(MovieRecommendation(
-                id=movie.id,
-                title=movie.title,
-                genre=movie.genre,
-                release_year=movie.release_year,
-                duration=movie.duration,
-                description=movie.description,
-                similarity_score=similarity_score
-            ))
-        
-        return movie_recommendations
-    
-    def get_popular_movies(self, n_movies: int = 5) -> List[MovieRecommendation]:
+        return self.to_recommendations(self.similar_movie_rows(
+            movie_id, n_similar, genre=genre, year_min=year_min, year_max=year_max, method=method
+        ))
+    
+    @consistent
+    def popular_movie_rows(self, n_movies: int = 5, genre: Optional[str] = None, year_min: Optional[int] = None,
+                           year_max: Optional[int] = None) -> List[RecommendationRow]:
+        """Result rows for get_popular_movies"""
+        # Average ratings, ordered once per model update and filtered before top-k
+        matrix = self.user_movie_matrix
+        popular = self.popular_columns()
+        allowed = self._column_filter(genre, year_min, year_max)
+        if allowed is not None:
+            popular = popular[allowed[popular]]
+        top_columns = popular[:n_movies]
+        averages = self._column_sums[top_columns] / max(len(matrix.index), 1)
+        return self._existing_rows([
+            RecommendationRow(int(movie_id), predicted_rating=float(avg_rating))
+            for movie_id, avg_rating in zip(matrix.columns[top_columns], averages)
+        ])
+    
+    @consistent
+    def get_popular_movies(self, n_movies: int = 5, genre: Optional[str] = None, year_min: Optional[int] = None,
+                           year_max: Optional[int] = None) -> List[MovieRecommendation]:
         """
         Get most popular movies based on average ratings
         
         Args:
             n_movies: Number of popular movies to return
+            genre: Only return movies of this genre
+            year_min: Only return movies released in or after this year
+            year_max: Only return movies released in or before this year
             
         Returns:
             List of MovieRecommendation objects
         """
-        # Calculate average ratings for each movie
-        movie_ratings = self.user_movie_matrix.mean()
-        
-        # Get top N movies
-        top_movies = []
-        for movie_id, avg_rating in movie_ratings.nlargest(n_movies).items():
-            movie = self.db.query(Movie).filter(Movie.id == movie_id).first()
-            if movie:
-                top_movies.append((movie, avg_rating))
-        
-        # Convert to MovieRecommendation objects
-        movie_recommendations = []
-        for movie, avg_rating in top_movies:
-            movie_recommendations.append(MovieRecommendation(
-                id=movie.id,
-                title=movie.title,
-                genre=movie.genre,
-                release_year=movie.release_year,
-                duration=movie.duration,
-                description=movie.description,
-                predicted_rating=avg_rating
-            ))
-        
-        return movie_recommendations
+        return self.to_recommendations(self.popular_movie_rows(
+            n_movies, genre=genre, year_min=year_min, year_max=year_max
+        ))
     
     def close(self):
         """Close database connection"""
@@ -0,0 +1,153 @@
+import time
+from abc import ABC, abstractmethod
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class CandidateGenerator(ABC):
+    """
+    Base class for cheap candidate sources
+
+    Generators work on column positions of the recommender's user-movie matrix
+    and return at most `limit` positions, best first.
+    """
+    name = "base"
+
+    def __init__(self, limit: int = 200):
+        self.limit = limit
+
+    @abstractmethod
+    def generate(self, recommender, user_idx: int, user_ratings: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            recommender: MovieRecommender to read model structures from
+            user_idx: Row position of the user in the user-movie matrix
+            user_ratings: The user's rating row (0 means unrated)
+
+        Returns:
+            Array of candidate column positions
+        """
+
+
+class NeighbourItemCandidates(CandidateGenerator):
+    """Movies similar to the user's highest rated movies (precomputed movie neighbours)"""
+    name = "neighbours"
+
+    def __init__(self, limit: int = 200, seed_items: int = 20):
+        super().__init__(limit)
+        self.seed_items = seed_items
+
+    def generate(self, recommender, user_idx, user_ratings):
+        rated = np.flatnonzero(user_ratings > 0)
+        if len(rated) == 0:
+            return np.empty(0, dtype=np.int64)
+        seeds = rated[np.argsort(-user_ratings[rated], kind='stable')[:self.seed_items]]
+        neighbor_indices, _ = recommender.movie_neighbors
+        seeds = seeds[seeds < len(neighbor_indices)]
+        # Column-major flatten: every seed's best neighbour first, then every seed's second, ...
+        candidates = np.asarray(neighbor_indices[seeds]).ravel(order='F')
+        _, first = np.unique(candidates, return_index=True)
+        return candidates[np.sort(first)][:self.limit]
+
+
+class ClusterCandidates(CandidateGenerator):
+    """Movies from the clusters the user rated most, instead of a single favourite cluster"""
+    name = "clusters"
+
+    def __init__(self, limit: int = 200, top_clusters: int = 2):
+        super().__init__(limit)
+        self.top_clusters = top_clusters
+
+    def generate(self, recommender, user_idx, user_ratings):
+        column_clusters = recommender.column_clusters()
+        rated_clusters = column_clusters[(user_ratings > 0) & (column_clusters >= 0)]
+        if len(rated_clusters) == 0:
+            return np.empty(0, dtype=np.int64)
+        counts = np.bincount(rated_clusters)
+        # Ties go to the lower cluster id, as with the previous mode()-based choice
+        clusters = np.argsort(-counts, kind='stable')[:self.top_clusters]
+        clusters = clusters[counts[clusters] > 0]
+        return np.flatnonzero(np.isin(column_clusters, clusters))[:self.limit]
+
+
+class PopularCandidates(CandidateGenerator):
+    """Movies with the highest average rating"""
+    name = "popular"
+
+    def generate(self, recommender, user_idx, user_ratings):
+        return recommender.popular_columns()[:self.limit]
+
+
+class CandidatePipeline:
+    """
+    First stage of recommendation: merge candidate generators into a bounded candidate set
+
+    Candidates are deduplicated, already rated movies are dropped and the set is
+    capped at max_candidates, so the expensive scorer's cost depends on the
+    candidate count rather than the catalog size.
+    """
+
+    def __init__(self, generators: List[CandidateGenerator], max_candidates: int = 500):
+        self.generators = generators
+        self.max_candidates = max_candidates
+
+    @classmethod
+    def default(cls) -> "CandidatePipeline":
+        return cls([NeighbourItemCandidates(), ClusterCandidates(), PopularCandidates()])
+
+    def retrieve(self, recommender, user_idx: int, user_ratings: np.ndarray,
+                 report: Optional[dict] = None, allowed: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Run all generators and merge their output
+
+        Args:
+            recommender: MovieRecommender to read model structures from
+            user_idx: Row position of the user in the user-movie matrix
+            user_ratings: The user's rating row (0 means unrated)
+            report: Optional dict filled with per-source timings and sizes
+            allowed: Optional boolean mask of columns passing attribute filters
+
+        Returns:
+            Sorted array of unique, unrated candidate column positions
+        """
+        seen = user_ratings > 0
+        if allowed is not None:
+            # Filtered-out movies are dropped before the candidate cap
+            seen |= ~allowed
+        merged = []
+        n_merged = 0
+        sources = {}
+        for generator in self.generators:
+            start = time.perf_counter()
+            candidates = np.asarray(generator.generate(recommender, user_idx, user_ratings), dtype=np.int64)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            candidates = candidates[~seen[candidates]]
+            candidates = candidates[:max(self.max_candidates - n_merged, 0)]
+            seen[candidates] = True
+            merged.append(candidates)
+            n_merged += len(candidates)
+            sources[generator.name] = {'count': int(len(candidates)), 'ms': elapsed_ms}
+
+        candidates = np.sort(np.concatenate(merged)) if merged else np.empty(0, dtype=np.int64)
+        if report is not None:
+            report['sources'] = sources
+            report['candidates'] = int(len(candidates))
+        return candidates
+
+
+def server_timing_header(report: dict) -> Tuple[str, str]:
+    """
+    Format a retrieval report as a Server-Timing header
+
+    Returns:
+        Tuple of (header name, header value)
+    """
+    metrics = [
+        f"{name};desc=\"{source['count']} candidates\";dur={source['ms']:.3f}"
+        for name, source in report.get('sources', {}).items()
+    ]
+    if 'scoring_ms' in report:
+        metrics.append(f"scoring;dur={report['scoring_ms']:.3f}")
+    return "Server-Timing", ", ".join(metrics)
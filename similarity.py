@@ -0,0 +1,322 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import weakref
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+# Worker state for the process backend (loaded once per worker process)
+_worker_matrix = None
+_worker_transposed = None
+
+
+def _init_worker(matrix_path: str, is_sparse: bool):
+    """Load the normalised matrix once per worker process"""
+    global _worker_matrix, _worker_transposed
+    if is_sparse:
+        _worker_matrix = sparse.load_npz(matrix_path).tocsr()
+        _worker_transposed = _worker_matrix.T.tocsr()
+    else:
+        _worker_matrix = np.load(matrix_path, mmap_mode='r')
+
+
+def _normalize_rows(matrix):
+    """L2-normalise the rows of a dense or sparse matrix as float32"""
+    if sparse.issparse(matrix):
+        return normalize(matrix.tocsr().astype(np.float32), norm='l2', axis=1)
+    return normalize(np.asarray(matrix, dtype=np.float32), norm='l2', axis=1)
+
+
+def _tile_top_k(matrix, rows, k: int, exclude_self: bool, transposed=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the top-k neighbours of a tile of rows against every row
+
+    The tile is negated and partitioned in place, so apart from the float32 tile
+    the only per-cell temporary is the argpartition index array (see TILE_BYTES_PER_CELL).
+
+    Args:
+        matrix: L2-normalised matrix (dense or CSR), one row per entity
+        rows: Slice or index array selecting the rows of the tile
+        k: Number of neighbours to keep per row
+        exclude_self: Whether a row may be its own neighbour
+        transposed: matrix.T in CSR form, for sparse matrices (converted per call when omitted)
+
+    Returns:
+        Tuple of (indices, scores) arrays of shape (n_tile_rows, k)
+    """
+    if sparse.issparse(matrix):
+        product = matrix[rows] @ (transposed if transposed is not None else matrix.T.tocsr())
+        tile = product.toarray()
+        del product
+    else:
+        tile = matrix[rows] @ matrix.T
+    tile = np.asarray(tile, dtype=np.float32)
+
+    # Negate in place so the partition puts the best scores first without a negated copy
+    np.negative(tile, out=tile)
+    if exclude_self:
+        row_ids = np.arange(*rows.indices(matrix.shape[0])) if isinstance(rows, slice) else np.asarray(rows)
+        tile[np.arange(len(row_ids)), row_ids] = np.inf
+
+    # Partial sort: only the k best columns of each row are ordered
+    top = np.argpartition(tile, k - 1, axis=1)[:, :k].copy()
+    top_scores = np.take_along_axis(tile, top, axis=1)
+    del tile
+    order = np.argsort(top_scores, axis=1, kind='stable')
+    indices = np.take_along_axis(top, order, axis=1).astype(np.int32)
+    scores = -np.take_along_axis(top_scores, order, axis=1)
+    return indices, scores
+
+
+def _process_tile(start: int, stop: int, k: int, exclude_self: bool, out_paths: Optional[Tuple[str, str]]):
+    """Process-pool entry point: reduce one tile, writing into the spill files if given"""
+    indices, scores = _tile_top_k(_worker_matrix, slice(start, stop), k, exclude_self, _worker_transposed)
+    if out_paths is None:
+        return start, indices, scores
+    out_indices = np.load(out_paths[0], mmap_mode='r+')
+    out_scores = np.load(out_paths[1], mmap_mode='r+')
+    out_indices[start:stop] = indices
+    out_scores[start:stop] = scores
+    out_indices.flush()
+    out_scores.flush()
+    return start, None, None
+
+
+# Peak bytes per cell of a similarity tile: the float32 tile plus the int64 argpartition
+# indices; a sparse product also holds its float32 data and (up to int64) column
+# indices while it is densified into the tile
+TILE_BYTES_PER_CELL = {'dense': 4 + 8, 'sparse': 4 + 8 + 4}
+
+
+def block_size_for_budget(n_rows: int, memory_budget_mb: float, is_sparse: bool = False) -> int:
+    """
+    Pick the number of rows per tile so that one similarity tile fits the budget
+
+    Args:
+        n_rows: Number of rows the tile is multiplied against
+        memory_budget_mb: Memory allowed for a single tile, in megabytes
+        is_sparse: Whether the matrix is sparse (its product needs extra room)
+
+    Returns:
+        Rows per tile (at least 1)
+    """
+    bytes_per_row = max(n_rows, 1) * TILE_BYTES_PER_CELL['sparse' if is_sparse else 'dense']
+    return max(1, int(memory_budget_mb * 1024 * 1024) // bytes_per_row)
+
+
+def blocked_top_k_similarity(
+    matrix,
+    k: int,
+    block_size: Optional[int] = None,
+    memory_budget_mb: float = 256,
+    n_jobs: Optional[int] = None,
+    backend: str = "thread",
+    spill_dir: Optional[str] = None,
+    exclude_self: bool = True
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute cosine top-k neighbours of every row without materialising the full similarity matrix
+
+    Rows are L2-normalised once, then row tiles are multiplied against the whole
+    matrix and each tile is reduced straight to its k best neighbours. Peak memory
+    is one tile per worker (at most memory_budget_mb each) plus the normalised
+    matrix and the (n_rows, k) result.
+
+    Args:
+        matrix: Dense array or scipy sparse matrix, one row per entity
+        k: Number of neighbours to keep per row
+        block_size: Rows per tile; derived from memory_budget_mb when None
+        memory_budget_mb: Memory budget for a single tile, in megabytes
+        n_jobs: Number of workers (defaults to the CPU count)
+        backend: "thread" (BLAS releases the GIL) or "process"
+        spill_dir: If given, results are written to memory-mapped .npy files in a new
+            subdirectory of this directory, deleted once the returned arrays are released
+        exclude_self: Whether to drop each row from its own neighbour list
+
+    Returns:
+        Tuple of (indices, scores) arrays of shape (n_rows, k), sorted by descending score
+    """
+    if backend not in ("thread", "process"):
+        raise ValueError(f"Unknown backend: {backend}")
+
+    normalized = _normalize_rows(matrix)
+
+    n_rows = normalized.shape[0]
+    k = min(k, n_rows - 1 if exclude_self else n_rows)
+    if k <= 0:
+        return np.empty((n_rows, 0), dtype=np.int32), np.empty((n_rows, 0), dtype=np.float32)
+
+    is_sparse = sparse.issparse(normalized)
+    if block_size is None:
+        block_size = block_size_for_budget(n_rows, memory_budget_mb, is_sparse)
+    # Transpose a sparse matrix once rather than per tile
+    transposed = normalized.T.tocsr() if is_sparse else None
+    n_jobs = n_jobs or os.cpu_count() or 1
+    tiles = [(start, min(start + block_size, n_rows)) for start in range(0, n_rows, block_size)]
+
+    # Output arrays: in memory, or memory-mapped files when spilling to disk
+    out_paths = None
+    if spill_dir is not None:
+        # Every build gets its own files: arrays of an earlier build may still be served
+        os.makedirs(spill_dir, exist_ok=True)
+        spill_dir = tempfile.mkdtemp(prefix='neighbors-', dir=spill_dir)
+        out_paths = (os.path.join(spill_dir, 'neighbor_indices.npy'), os.path.join(spill_dir, 'neighbor_scores.npy'))
+        indices = np.lib.format.open_memmap(out_paths[0], mode='w+', dtype=np.int32, shape=(n_rows, k))
+        scores = np.lib.format.open_memmap(out_paths[1], mode='w+', dtype=np.float32, shape=(n_rows, k))
+    else:
+        indices = np.empty((n_rows, k), dtype=np.int32)
+        scores = np.empty((n_rows, k), dtype=np.float32)
+
+    if backend == "thread" or n_jobs == 1 or len(tiles) == 1:
+        def run(tile):
+            start, stop = tile
+            indices[start:stop], scores[start:stop] = _tile_top_k(
+                normalized, slice(start, stop), k, exclude_self, transposed
+            )
+
+        if n_jobs == 1 or len(tiles) == 1:
+            for tile in tiles:
+                run(tile)
+        else:
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                list(executor.map(run, tiles))
+    else:
+        # Share the normalised matrix with worker processes through a file
+        with tempfile.TemporaryDirectory(dir=spill_dir) as tmp_dir:
+            if is_sparse:
+                matrix_path = os.path.join(tmp_dir, 'normalized.npz')
+                sparse.save_npz(matrix_path, normalized)
+            else:
+                matrix_path = os.path.join(tmp_dir, 'normalized.npy')
+                np.save(matrix_path, normalized)
+
+            if out_paths is not None:
+                indices.flush()
+                scores.flush()
+
+            # Spawned, not forked: builds run inside the threaded server process
+            with ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_worker, initargs=(matrix_path, is_sparse)) as executor:
+                futures = [
+                    executor.submit(_process_tile, start, stop, k, exclude_self, out_paths)
+                    for start, stop in tiles
+                ]
+                for future in futures:
+                    start, tile_indices, tile_scores = future.result()
+                    if tile_indices is not None:
+                        indices[start:start + len(tile_indices)] = tile_indices
+                        scores[start:start + len(tile_scores)] = tile_scores
+
+        if out_paths is not None:
+            # Reopen so the caller sees what the workers wrote
+            indices = np.load(out_paths[0], mmap_mode='r+')
+            scores = np.load(out_paths[1], mmap_mode='r+')
+
+    if out_paths is not None:
+        _remove_when_released(spill_dir, indices, scores)
+    return indices, scores
+
+
+def _remove_when_released(directory: str, *arrays):
+    """Delete a spill directory once every array mapped from it has been garbage collected"""
+    remaining = [len(arrays)]
+
+    def release():
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    for array in arrays:
+        weakref.finalize(array, release)
+
+
+def top_k_similarity_rows(matrix, rows, k: int, exclude_self: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute cosine top-k neighbours for selected rows only
+
+    Used for incremental updates, where only a few rows changed.
+
+    Args:
+        matrix: Dense array or scipy sparse matrix, one row per entity
+        rows: Index array of the rows to recompute
+        k: Number of neighbours to keep per row
+        exclude_self: Whether to drop each row from its own neighbour list
+
+    Returns:
+        Tuple of (indices, scores) arrays of shape (len(rows), k)
+    """
+    normalized = _normalize_rows(matrix)
+    k = min(k, normalized.shape[0] - 1 if exclude_self else normalized.shape[0])
+    rows = np.asarray(rows)
+    if k <= 0 or len(rows) == 0:
+        return np.empty((len(rows), max(k, 0)), dtype=np.int32), np.empty((len(rows), max(k, 0)), dtype=np.float32)
+    return _tile_top_k(normalized, rows, k, exclude_self)
+
+
+def neighbors_to_sparse(indices: np.ndarray, scores: np.ndarray, n_cols: Optional[int] = None) -> sparse.csr_matrix:
+    """
+    Convert top-k neighbour arrays to a CSR similarity matrix
+
+    Args:
+        indices: (n_rows, k) neighbour indices
+        scores: (n_rows, k) neighbour scores
+        n_cols: Number of columns (defaults to n_rows)
+
+    Returns:
+        CSR matrix with scores[i, j] at (i, indices[i, j])
+    """
+    n_rows, k = indices.shape
+    n_cols = n_rows if n_cols is None else n_cols
+    indptr = np.arange(0, n_rows * k + 1, k)
+    return sparse.csr_matrix(
+        (np.asarray(scores).ravel(), np.asarray(indices).ravel(), indptr),
+        shape=(n_rows, n_cols)
+    )
+
+
+class PatchedSimilarity:
+    """
+    Dense cosine similarity matrix of a full build, kept current by recomputing changed entries on read
+
+    Incremental updates only record which rows changed; the dense base matrix is
+    shared between versions and never copied or grown. A row read recomputes
+    the entries of the changed rows against the current matrix (the whole row
+    when the row itself changed), so an update costs nothing up front and a read
+    costs O(changed rows x features) on top of the base row.
+
+    Args:
+        base: (n, n) similarity matrix of the full build
+        matrix: Current data matrix, one row per entity (n or more rows)
+        changed: Positions of rows changed since the full build (rows past n always count as changed)
+    """
+
+    def __init__(self, base: np.ndarray, matrix: np.ndarray, changed: Optional[np.ndarray] = None):
+        self.base = base
+        self.matrix = matrix
+        changed = np.empty(0, dtype=np.int64) if changed is None else np.asarray(changed, dtype=np.int64)
+        self.changed = np.union1d(changed, np.arange(base.shape[0], matrix.shape[0]))
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.matrix.shape[0], self.matrix.shape[0]
+
+    def updated(self, matrix: np.ndarray, positions) -> "PatchedSimilarity":
+        """New version for an updated data matrix whose rows at positions changed"""
+        return PatchedSimilarity(self.base, matrix, np.union1d(self.changed, np.asarray(positions, dtype=np.int64)))
+
+    def __getitem__(self, row: int) -> np.ndarray:
+        """Similarities of one row to every row of the current matrix"""
+        current = self.matrix[row:row + 1]
+        if row >= self.base.shape[0] or np.any(self.changed == row):
+            return cosine_similarity(current, self.matrix)[0]
+        similarities = np.zeros(self.matrix.shape[0], dtype=self.base.dtype)
+        similarities[:self.base.shape[0]] = self.base[row]
+        if len(self.changed):
+            similarities[self.changed] = cosine_similarity(self.matrix[self.changed], current)[:, 0]
+        return similarities
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from cache import CacheBackend, MemoryCache, SQLiteCache, TwoTierCache, encode_rows, decode_rows
+from models import RecommendationRow
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "results.sqlite3")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_row_encoding(self):
+        """Test rows survive the compact binary encoding, including missing fields"""
+        rows = [RecommendationRow(7, predicted_rating=4.25), RecommendationRow(9, similarity_score=0.5, cluster_id=0)]
+        value = encode_rows(rows)
+        self.assertEqual(len(value), 48)
+        self.assertEqual(decode_rows(value), rows)
+
+    def test_backend_is_abstract(self):
+        """Test a backend must implement get and set"""
+        with self.assertRaises(TypeError):
+            CacheBackend()
+
+    def test_l2_shared_between_caches(self):
+        """Test a value written by one process-local cache is served to another from L2 and promoted"""
+        writer = TwoTierCache(MemoryCache(), SQLiteCache(self.path))
+        writer.set("v1:similar:1", b"value")
+
+        reader = TwoTierCache(MemoryCache(), SQLiteCache(self.path))
+        self.assertEqual(reader.get("v1:similar:1", local_only=True), None)
+        self.assertEqual(reader.get("v1:similar:1"), b"value")
+        self.assertEqual(reader.get("v1:similar:1"), b"value")
+        self.assertEqual(reader.get("v2:similar:1"), None)
+        stats = reader.stats()
+        self.assertEqual((stats['l2_hits'], stats['l1_hits'], stats['misses']), (1, 1, 1))
+
+    def test_shared_key_for_l2(self):
+        """Test L2 is read and written under the shared key while L1 keeps the process-local key"""
+        writer = TwoTierCache(MemoryCache(), SQLiteCache(self.path))
+        writer.set("updated:similar:1", b"value", shared_key="ratings:similar:1")
+
+        rebuilt = TwoTierCache(MemoryCache(), SQLiteCache(self.path))
+        self.assertEqual(rebuilt.get("rebuilt:similar:1", shared_key="ratings:similar:1"), b"value")
+        self.assertEqual(rebuilt.get("rebuilt:similar:1", local_only=True), b"value")
+        self.assertIsNone(rebuilt.get("updated:similar:1", local_only=True))
+
+    def test_pruning(self):
+        """Test the L2 store keeps at most max_entries"""
+        store = SQLiteCache(self.path, max_entries=3, prune_every=1)
+        for i in range(5):
+            store.set(f"key{i}", b"x")
+        self.assertIsNone(store.get("key0"))
+        self.assertEqual(store.get("key4"), b"x")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+from types import SimpleNamespace
+import json
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from catalog import MovieCatalog, keyset_page
+from models import MovieRecommendation, RecommendationRow
+
+class TestMovieCatalog(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Build a catalog from plain objects with the Movie fields"""
+        movies = [
+            SimpleNamespace(id=7, title="A", genre="Comedy", release_year=2012, duration=90, description="A test description"),
+            SimpleNamespace(id=3, title="B", genre="Drama, Comedy", release_year=2005, duration=120, description="A test description"),
+            SimpleNamespace(id=9, title="C", genre="Action", release_year=2015, duration=110, description="A test description"),
+            SimpleNamespace(id=4, title="D", genre="comedy", release_year=2010, duration=95, description="A test description"),
+        ]
+        cls.catalog = MovieCatalog(movies)
+
+    def test_genre_mask(self):
+        """Test genre masks are parsed once and matched case-insensitively"""
+        self.assertEqual(self.catalog.genres, ["Comedy", "Drama", "Action"])
+        np.testing.assert_array_equal(self.catalog.genre_mask("COMEDY"), [True, True, False, True])
+        np.testing.assert_array_equal(self.catalog.genre_mask("Horror"), [False, False, False, False])
+
+    def test_combined_filters(self):
+        """Test genre and year filters combine into one mask"""
+        np.testing.assert_array_equal(self.catalog.mask(genre="Comedy", year_min=2010), [True, False, False, True])
+        np.testing.assert_array_equal(self.catalog.mask(year_max=2010), [False, True, False, True])
+        self.assertIsNone(self.catalog.mask())
+
+    def test_align_to_other_ids(self):
+        """Test aligning a mask to ids in another order, including unknown ids"""
+        positions = self.catalog.positions([9, 4, 100, 7])
+        np.testing.assert_array_equal(positions, [2, 3, -1, 0])
+        aligned = MovieCatalog.align(self.catalog.mask(genre="Comedy"), positions)
+        np.testing.assert_array_equal(aligned, [False, True, False, True])
+
+    def test_render_matches_pydantic(self):
+        """Test pre-serialised responses match MovieRecommendation serialisation"""
+        rows = [RecommendationRow(7, predicted_rating=4.25), RecommendationRow(9, similarity_score=0.5, cluster_id=2)]
+        expected = [
+            MovieRecommendation(**self.catalog.records[row.movie_id], predicted_rating=row.predicted_rating,
+                                similarity_score=row.similarity_score, cluster_id=row.cluster_id)
+            for row in rows
+        ]
+        rendered = self.catalog.render(rows + [RecommendationRow(100)])
+        self.assertEqual(json.loads(rendered), jsonable_encoder(expected))
+
+    def test_keyset_pages(self):
+        """Test walking a sorted id listing page by page with a cursor"""
+        ids = np.sort(self.catalog.ids)
+        page, cursor = keyset_page(ids, None, 3)
+        np.testing.assert_array_equal(page, [3, 4, 7])
+        self.assertEqual(cursor, 7)
+        page, cursor = keyset_page(ids, cursor, 3)
+        np.testing.assert_array_equal(page, [9])
+        self.assertIsNone(cursor)
+        self.assertEqual(json.loads(self.catalog.render_movies(np.array([9])))[0]["title"], "C")
+        self.assertEqual(self.catalog.render_ndjson(np.array([3, 4])).count(b"\n"), 2)
+
+    def test_extended(self):
+        """Test appending movies builds a new catalog and leaves this one unchanged"""
+        extended = self.catalog.extended([
+            SimpleNamespace(id=5, title="E", genre="Horror, Comedy", release_year=2020, duration=80, description="A test description"),
+            SimpleNamespace(id=7, title="A", genre="Comedy", release_year=2012, duration=90, description="A test description"),
+        ])
+        self.assertEqual(len(self.catalog), 4)
+        self.assertEqual(len(extended), 5)
+        np.testing.assert_array_equal(extended.positions([5, 3]), [4, 1])
+        np.testing.assert_array_equal(extended.mask(genre="comedy", year_min=2012), [True, False, False, False, True])
+        np.testing.assert_array_equal(extended.genre_mask("Horror"), [False, False, False, False, True])
+        self.assertEqual(json.loads(extended.render_movies(np.array([5])))[0]["title"], "E")
+        self.assertNotIn(5, self.catalog.fragments)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import multiprocessing
+import time
+import unittest
+import numpy as np
+from clustering import ClusterSearch, elbow
+
+class TestClusterSearch(unittest.TestCase):
+    def test_finds_separated_clusters(self):
+        """Test the silhouette search picks the number of well-separated blobs"""
+        rng = np.random.default_rng(0)
+        centers = np.array([[0, 0], [10, 0], [0, 10], [10, 10]])
+        features = np.vstack([center + rng.normal(scale=0.3, size=(40, 2)) for center in centers])
+        best, report = ClusterSearch(k_min=2, k_max=7, n_jobs=2, time_budget=60).search(features)
+        self.assertEqual(best, 4)
+        self.assertEqual(sorted(report['scores']), [2, 3, 4, 5, 6, 7])
+
+    def test_budget_terminates_workers(self):
+        """Test fits still running when the budget expires are stopped, not left in the background"""
+        features = np.random.default_rng(0).normal(size=(3000, 8))
+        start = time.perf_counter()
+        best, report = ClusterSearch(k_min=2, k_max=12, n_jobs=2, time_budget=0.5).search(features)
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertLess(len(report['scores']), len(report['candidates']))
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_elbow(self):
+        """Test the elbow of an inertia curve"""
+        self.assertEqual(elbow(np.array([1, 2, 3, 4, 5]), np.array([100.0, 60.0, 20.0, 15.0, 12.0])), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import time
+import unittest
+from coalescing import SingleFlight
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_threads_share_one_call(self):
+        """Test concurrent sync callers with the same key run the computation once"""
+        flight = SingleFlight()
+        calls = []
+        barrier = threading.Barrier(8)
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return "result"
+
+        results = []
+        def worker():
+            barrier.wait()
+            results.append(flight.do("similar", 1, compute))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ["result"] * 8)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats()["similar"], {"executed": 1, "coalesced": 7, "in_flight": 0})
+
+    def test_async_callers_and_errors(self):
+        """Test async callers share results and exceptions, and finished calls are not cached"""
+        flight = SingleFlight()
+        calls = []
+
+        def fail():
+            calls.append(1)
+            time.sleep(0.05)
+            raise ValueError("missing")
+
+        async def run():
+            return await asyncio.gather(*(flight.do_async("popular", "k", fail) for _ in range(4)),
+                                        return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(len(calls), 1)
+
+        self.assertEqual(flight.do("popular", "k", lambda: 2), 2)
+        self.assertEqual(flight.stats()["popular"]["executed"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import numpy as np
+from content import ContentIndex
+
+class TestContentIndex(unittest.TestCase):
+    def setUp(self):
+        columns = ['duration', 'release_year', 'Action', 'Drama']
+        self.raw = np.array([
+            [120, 2000, 1, 0],
+            [125, 2001, 1, 0],
+            [90, 2015, 0, 1],
+            [95, 2016, 0, 1],
+        ], dtype=float)
+        self.index = ContentIndex(columns, self.raw.mean(axis=0), self.raw.std(axis=0), capacity=2)
+        self.index.add([1, 2, 3, 4], self.raw)
+
+    def test_neighbors(self):
+        """Test neighbours come back most similar first, without the movie itself"""
+        movie_ids, scores = self.index.neighbors(1, 2)
+        self.assertEqual(movie_ids[0], 2)
+        self.assertNotIn(1, movie_ids.tolist())
+        self.assertTrue(scores[0] > scores[1])
+        self.assertAlmostEqual(self.index.similarity(1, [2, 99])[1], 0.0)
+
+    def test_matches_brute_force(self):
+        """Test the index ranks like cosine similarity of the scaled features"""
+        scaled = (self.raw - self.raw.mean(axis=0)) / self.raw.std(axis=0)
+        scaled /= np.linalg.norm(scaled, axis=1, keepdims=True)
+        expected = scaled[2] @ scaled.T
+        movie_ids, scores = self.index.neighbors(3, 3)
+        np.testing.assert_allclose(scores, expected[movie_ids - 1])
+        self.assertEqual(movie_ids.tolist(), (np.argsort(-expected)[1:] + 1).tolist())
+
+    def test_add_and_filter(self):
+        """Test new movies are found right away and filters apply to them"""
+        self.index.add([5], self.index.encode("Drama, Comedy", 2017, 92))
+        self.assertEqual(len(self.index), 5)
+        movie_ids, _ = self.index.neighbors(5, 1)
+        self.assertIn(movie_ids[0], (3, 4))
+        movie_ids, _ = self.index.neighbors(1, 4, allowed=self.index.mask(genre="drama", year_min=2016))
+        self.assertEqual(sorted(movie_ids.tolist()), [4, 5])
+        self.assertEqual(self.index.mask(genre="Western").sum(), 0)
+
+    def test_unknown_movie(self):
+        """Test movies not in the index raise ValueError"""
+        with self.assertRaises(ValueError):
+            self.index.neighbors(99, 3)
+
+    def test_publish_after_count(self):
+        """Test a movie becomes visible only once its row is filled in and counted (readers do not lock)"""
+        index, test = self.index, self
+        class CheckedPositions(dict):
+            def __setitem__(self, movie_id, position):
+                test.assertLess(position, len(index))
+                test.assertTrue(np.any(index._vectors[position]))
+                super().__setitem__(movie_id, position)
+        index._positions = CheckedPositions(index._positions)
+        index.add([5, 6], [index.encode("Drama", 2017, 92), index.encode("Action", 2001, 118)])
+        self.assertEqual(len(index), 6)
+        self.assertEqual(index.neighbors(6, 1)[0].tolist(), [1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import asyncio
+import time
+import unittest
+from deadline import Deadline, LatencyTracker, OverrunLimit, StaleResultCache, Tier, serve_within_deadline
+
+class TestDeadline(unittest.TestCase):
+    def test_slow_tier_degrades_and_fills_cache(self):
+        """Test a tier over budget is abandoned and its late result still reaches on_late"""
+        cache = StaleResultCache()
+
+        def slow():
+            time.sleep(0.2)
+            return "full"
+
+        async def run():
+            tiers = [
+                Tier("full", slow, on_late=lambda result: cache.put("key", result)),
+                Tier("cached", lambda: cache.get("key"), inline=True),
+                Tier("popular", lambda: "popular"),
+            ]
+            first = await serve_within_deadline(tiers, Deadline(50))
+            await asyncio.sleep(0.3)
+            second = await serve_within_deadline(tiers, Deadline(50))
+            return first, second
+
+        first, second = asyncio.run(run())
+        self.assertEqual(first, ("popular", "popular"))
+        self.assertEqual(second, ("cached", "full"))
+
+    def test_overrun_observed_once(self):
+        """Test a timed-out tier's latency is recorded once, when it completes"""
+        tracker = LatencyTracker()
+
+        def slow():
+            time.sleep(0.2)
+            return "full"
+
+        async def run():
+            tiers = [Tier("full", slow), Tier("popular", lambda: "popular")]
+            await serve_within_deadline(tiers, Deadline(50), tracker)
+            during = tracker.estimate("full")
+            await asyncio.sleep(0.3)
+            return during
+
+        self.assertIsNone(asyncio.run(run()))
+        self.assertGreaterEqual(tracker.estimate("full"), 0.2)
+
+    def test_tiers_skipped_by_estimate(self):
+        """Test tiers expected to exceed the budget are not started, and failures fall through"""
+        tracker = LatencyTracker()
+        tracker.observe("full", 1.0)
+        calls = []
+
+        def full():
+            calls.append("full")
+            return "full"
+
+        def broken():
+            raise RuntimeError("database unavailable")
+
+        tiers = [Tier("full", full), Tier("approximate", broken), Tier("popular", lambda: "popular")]
+        self.assertEqual(asyncio.run(serve_within_deadline(tiers, Deadline(100), tracker)), ("popular", "popular"))
+        self.assertEqual(calls, [])
+        self.assertLess(tracker.estimate("full"), 1.0)
+
+        # Without a budget the first tier always serves
+        self.assertEqual(asyncio.run(serve_within_deadline(tiers, Deadline(None), tracker)), ("full", "full"))
+
+    def test_overrun_limit(self):
+        """Test tiers are not started while the limit of overrunning calls is reached"""
+        overruns = OverrunLimit(limit=1)
+        calls = []
+
+        def slow():
+            calls.append("full")
+            time.sleep(0.2)
+            return "full"
+
+        async def run():
+            tiers = [Tier("full", slow), Tier("popular", lambda: "popular")]
+            first = await serve_within_deadline(tiers, Deadline(50), overruns=overruns)
+            running = overruns.running
+            second = await serve_within_deadline(tiers, Deadline(50), overruns=overruns)
+            await asyncio.sleep(0.3)
+            return first, second, running
+
+        first, second, running = asyncio.run(run())
+        self.assertEqual((first, second), (("popular", "popular"), ("popular", "popular")))
+        self.assertEqual(running, 1)
+        self.assertEqual(calls, ["full"])
+        self.assertEqual(overruns.running, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+from datetime import datetime
+from evaluate import leave_last_out, ranking_metrics
+
+class TestEvaluate(unittest.TestCase):
+    def test_leave_last_out(self):
+        """Test the most recently watched ratings are held out per user"""
+        ratings = [
+            (1, 1, 10, 4.0, datetime(2024, 1, 3)),
+            (2, 1, 11, 3.0, datetime(2024, 1, 1)),
+            (3, 1, 12, 5.0, datetime(2024, 1, 2)),
+            (4, 2, 10, 2.0, datetime(2024, 1, 1)),
+        ]
+        train, test = leave_last_out(ratings, holdout=1)
+        self.assertEqual(test, {1: {10}})
+        self.assertEqual(sorted(row[0] for row in train), [2, 3, 4])
+
+    def test_ranking_metrics(self):
+        """Test precision, recall, NDCG and coverage on a hand-computed example"""
+        results = [(1, [10, 20], 0.001), (2, [30, 40], 0.003)]
+        metrics = ranking_metrics(results, {1: {20}, 2: {50}}, k=2, n_movies=8)
+        self.assertAlmostEqual(metrics['precision'], 0.25)
+        self.assertAlmostEqual(metrics['recall'], 0.5)
+        self.assertAlmostEqual(metrics['ndcg'], (1 / 1.584962500721156) / 2)
+        self.assertAlmostEqual(metrics['coverage'], 0.5)
+        self.assertAlmostEqual(metrics['latency_mean_ms'], 2.0)
+
+if __name__ == '__main__':
+    unittest.main()
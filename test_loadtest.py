@@ -0,0 +1,23 @@
+import unittest
+from loadtest import parse_mix, parse_range, summarise
+
+class TestLoadTest(unittest.TestCase):
+    def test_parse_options(self):
+        """Test traffic mix and id range parsing"""
+        self.assertEqual(parse_mix("recommendations=3,rate=1"), {'recommendations': 3.0, 'rate': 1.0})
+        with self.assertRaises(ValueError):
+            parse_mix("unknown=1")
+        self.assertEqual(parse_range("2-4"), [2, 3, 4])
+        self.assertEqual(parse_range("1,5"), [1, 5])
+
+    def test_summary(self):
+        """Test throughput, error rates and percentiles per kind"""
+        results = {'similar': [(200, 0.001), (200, 0.003), (404, 0.002), (None, 0.004)]}
+        summary = summarise(results, wall_seconds=2.0)
+        self.assertEqual(summary['similar']['throughput'], 2.0)
+        self.assertEqual(summary['similar']['error_rate'], 0.25)
+        self.assertEqual(summary['similar']['client_error_rate'], 0.25)
+        self.assertAlmostEqual(summary['total']['max_ms'], 4.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from fastapi.testclient import TestClient
+from database import SessionLocal, User, Movie, UserMovieWatch, create_tables
+from trending import TrendingEngine
+from deadline import OverrunLimit
+import main
+
+class TestBulkRatings(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Create a user and two movies; the client runs without startup, so no model is loaded"""
+        create_tables()
+        cls.db = SessionLocal()
+        cls.user = User(username="bulk_user", email="bulk_user@example.com")
+        cls.movies = [
+            Movie(title=f"Bulk Movie {i}", genre="Drama", release_year=2000 + i, duration=100,
+                  description=f"Bulk test movie {i}")
+            for i in range(2)
+        ]
+        cls.db.add_all([cls.user] + cls.movies)
+        cls.db.commit()
+        cls.client = TestClient(main.app)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the test rows so other test modules see the database as before"""
+        cls.db.rollback()
+        movie_ids = [movie.id for movie in cls.movies]
+        cls.db.query(UserMovieWatch).filter(UserMovieWatch.movie_id.in_(movie_ids)).delete(synchronize_session=False)
+        cls.db.query(Movie).filter(Movie.id.in_(movie_ids)).delete(synchronize_session=False)
+        cls.db.query(User).filter(User.id == cls.user.id).delete(synchronize_session=False)
+        cls.db.commit()
+        cls.db.close()
+
+    def stored_rating(self, movie):
+        self.db.rollback()
+        row = self.db.query(UserMovieWatch.rating).filter(
+            UserMovieWatch.user_id == self.user.id, UserMovieWatch.movie_id == movie.id
+        ).first()
+        return None if row is None else row[0]
+
+    def test_ndjson(self):
+        """Test NDJSON rows are stored in batches and the last duplicate wins"""
+        body = "\n".join([
+            f'{{"user_id": {self.user.id}, "movie_id": {self.movies[0].id}, "rating": 2.0}}',
+            f'{{"user_id": {self.user.id}, "movie_id": {self.movies[1].id}, "rating": 3.5}}',
+            "",
+            f'{{"user_id": {self.user.id}, "movie_id": {self.movies[0].id}, "rating": 4.0}}',
+        ])
+        response = self.client.post("/ratings/bulk?batch_size=2", content=body)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual((result["accepted"], result["rejected"]), (3, 0))
+        self.assertEqual([batch["received"] for batch in result["batches"]], [2, 1])
+        self.assertEqual(self.stored_rating(self.movies[0]), 4.0)
+        self.assertEqual(self.stored_rating(self.movies[1]), 3.5)
+
+    def test_csv(self):
+        """Test CSV input with a header row"""
+        body = f"user_id,movie_id,rating\n{self.user.id},{self.movies[1].id},1.5\n"
+        response = self.client.post("/ratings/bulk", content=body, headers={"Content-Type": "text/csv"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["accepted"], 1)
+        self.assertEqual(self.stored_rating(self.movies[1]), 1.5)
+
+    def test_rejected_rows(self):
+        """Test malformed rows and unknown users or movies are reported by line"""
+        body = "\n".join([
+            "not json",
+            "[1, 2, 3]",
+            f'{{"user_id": {self.user.id}, "movie_id": {self.movies[0].id}, "rating": 9}}',
+            f'{{"user_id": 999999, "movie_id": {self.movies[0].id}, "rating": 3}}',
+            f'{{"user_id": {self.user.id}, "movie_id": 999999, "rating": 3}}',
+            f'{{"user_id": {self.user.id}, "movie_id": {self.movies[0].id}, "rating": 5}}',
+        ])
+        result = self.client.post("/ratings/bulk", content=body).json()
+        self.assertEqual((result["accepted"], result["rejected"]), (1, 5))
+        self.assertEqual([error["line"] for error in result["errors"]], [1, 2, 3, 4, 5])
+        self.assertEqual(result["errors"][3]["error"], "Kullanıcı bulunamadı")
+        self.assertEqual(result["errors"][4]["error"], "Film bulunamadı")
+
+    def test_invalid_utf8(self):
+        """Test a line that is not valid UTF-8 is reported as a row error"""
+        body = b"\xff\xfe\n" + f'{{"user_id": {self.user.id}, "movie_id": {self.movies[0].id}, "rating": 2}}'.encode()
+        response = self.client.post("/ratings/bulk", content=body)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual((result["accepted"], result["rejected"]), (1, 1))
+        self.assertEqual(result["errors"][0]["line"], 1)
+
+    def test_long_line_across_chunks(self):
+        """Test a line split over many body chunks is reassembled"""
+        line = f'{{"user_id": {self.user.id}, "movie_id": {self.movies[1].id}, "rating": 2.5}}'.encode()
+        chunks = [line[i:i + 3] for i in range(0, len(line), 3)] + [b"\n"]
+        result = self.client.post("/ratings/bulk", content=iter(chunks)).json()
+        self.assertEqual(result["accepted"], 1)
+
+class TestModelLoading(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Create a user and a movie; the client runs without startup, so the model stays loading"""
+        create_tables()
+        cls.db = SessionLocal()
+        cls.user = User(username="loading_user", email="loading_user@example.com")
+        cls.movie = Movie(title="Loading Movie", genre="Drama", release_year=2001, duration=100,
+                          description="Rated while the model loads")
+        cls.db.add_all([cls.user, cls.movie])
+        cls.db.commit()
+        cls.client = TestClient(main.app)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the test rows so other test modules see the database as before"""
+        cls.db.rollback()
+        cls.db.query(UserMovieWatch).filter(UserMovieWatch.movie_id == cls.movie.id).delete(synchronize_session=False)
+        cls.db.query(Movie).filter(Movie.id == cls.movie.id).delete(synchronize_session=False)
+        cls.db.query(User).filter(User.id == cls.user.id).delete(synchronize_session=False)
+        cls.db.commit()
+        cls.db.close()
+
+    def test_probes_while_loading(self):
+        """Test liveness is up, readiness is not, and model endpoints ask to retry"""
+        self.assertIsNone(main.recommender)
+        response = self.client.get("/healthz")
+        self.assertEqual((response.status_code, response.json()), (200, {"status": "ok"}))
+
+        response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["status"], "loading")
+
+        for path in ("/popular-movies", f"/recommendations/{self.user.id}", f"/movies/{self.movie.id}/similar"):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 503, path)
+            self.assertEqual(response.headers["Retry-After"], "5")
+
+    def test_rating_while_loading(self):
+        """Test ratings are stored and counted once in trending while the model loads"""
+        with mock.patch.object(main, "trending", TrendingEngine.default()) as engine:
+            seed_until = datetime.utcnow()
+            response = self.client.post(f"/users/{self.user.id}/rate-movie",
+                                        json={"movie_id": self.movie.id, "rating": 4.0})
+            self.assertEqual(response.status_code, 201)
+            self.db.rollback()
+            stored = self.db.query(UserMovieWatch.rating).filter(UserMovieWatch.user_id == self.user.id).all()
+            self.assertEqual(stored, [(4.0,)])
+
+            def watches():
+                return {movie_id: count for movie_id, _, count, _ in engine.top("day", 100)}
+            self.assertEqual(watches()[self.movie.id], 1)
+            # Seeding up to the start of serving skips ratings already counted on write
+            main._seed_trending(seed_until)
+            self.assertEqual(watches()[self.movie.id], 1)
+            main._seed_trending(datetime.utcnow() + timedelta(seconds=1))
+            self.assertEqual(watches()[self.movie.id], 2)
+
+    def test_load_survives_failed_refresh(self):
+        """Test a failing post-load refresh still marks the model ready and starts the background loops"""
+        model = mock.Mock()
+        model.refresh.side_effect = RuntimeError("database went away")
+        started = []
+
+        def loop(name):
+            return lambda: (started.append(name), asyncio.sleep(0))[1]
+
+        with mock.patch.object(main, "_prepare_database"), \
+                mock.patch.object(main, "_build_model", return_value=model), \
+                mock.patch.object(main, "_warm_up", return_value=0), \
+                mock.patch.object(main, "_apply_queued_ratings", loop("apply")), \
+                mock.patch.object(main, "_periodic_refresh", loop("refresh")), \
+                mock.patch.object(main, "RATING_APPLY_INTERVAL", 1.0), \
+                mock.patch.object(main, "MODEL_REFRESH_INTERVAL", 1.0), \
+                mock.patch.object(main, "model_state", dict(main.model_state)) as state, \
+                mock.patch.object(main, "recommender", None):
+            asyncio.run(main._load_model(datetime.utcnow()))
+            self.assertEqual(state["status"], "ready")
+            self.assertIs(main.recommender, model)
+        self.assertEqual(started, ["apply", "refresh"])
+
+class TestUserLookup(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Serve from a stub model that does not know the user, so the database lookup runs"""
+        cls.model = mock.Mock()
+        cls.model.has_user.return_value = False
+        cls.model.model_fingerprint.return_value = "stub"
+        cls.model.render_json.return_value = b"[]"
+        cls.client = TestClient(main.app)
+
+    def get(self, lookup, overruns):
+        with mock.patch.object(main, "recommender", self.model), \
+                mock.patch.object(main, "_user_exists", lookup), \
+                mock.patch.object(main, "tier_overruns", overruns):
+            return self.client.get("/recommendations/1", headers={"X-Latency-Budget-Ms": "1000"})
+
+    def test_failed_lookup_falls_through(self):
+        """Test a database error in the user lookup degrades to the tiers instead of failing"""
+        lookup = mock.Mock(side_effect=RuntimeError("database unavailable"))
+        response = self.get(lookup, OverrunLimit(8))
+        self.assertEqual(response.status_code, 200)
+        lookup.assert_called_once()
+
+    def test_lookup_skipped_when_overruns_full(self):
+        """Test no lookup is started while the overrun limit is reached"""
+        lookup = mock.Mock(return_value=False)
+        response = self.get(lookup, OverrunLimit(0))
+        self.assertEqual(response.status_code, 200)
+        lookup.assert_not_called()
+        self.assertEqual(self.get(lookup, OverrunLimit(8)).status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
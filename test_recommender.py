@@ -1,5 +1,7 @@
+import tempfile
 import unittest
-from database import SessionLocal, User, Movie, UserMovieWatch, create_tables
+from datetime import timedelta
+from database import SessionLocal, User, Movie, UserMovieWatch, create_tables, upsert_rating, upsert_ratings
 from recommender import MovieRecommender
 import numpy as np
 
@@ -48,7 +50,7 @@ class TestMovieRecommender(unittest.TestCase):
         cls.db.commit()
         
         # Initialize recommender
-        cls.recommender = MovieRecommender(n_clusters=3)
+        cls.recommender = MovieRecommender(n_clusters=3, max_patched_fraction=1.0)
     
     @classmethod
     def tearDownClass(cls):
@@ -102,6 +104,232 @@ class TestMovieRecommender(unittest.TestCase):
             for movie in movies:
                 self.assertIsInstance(movie, Movie)
     
+    def test_candidate_pipeline_report(self):
+        """Test that the candidate pipeline reports per-source sizes and timings"""
+        user_id = self.users[0].id
+        report = {}
+        ranked = self.recommender.rank_movies(user_id, 3, pipeline=self.recommender.candidate_pipeline, report=report)
+        
+        self.assertLessEqual(len(ranked), 3)
+        self.assertEqual(set(report['sources']), {'neighbours', 'clusters', 'popular'})
+        self.assertEqual(report['candidates'], sum(source['count'] for source in report['sources'].values()))
+        self.assertIn('scoring_ms', report)
+    
+    def test_apply_ratings(self):
+        """Test applying a batch of ratings to the live model"""
+        user_id = self.users[1].id
+        movie_id = self.movies[2].id
+        result = self.recommender.apply_ratings([(user_id, movie_id, 1.0), (user_id, movie_id, 4.0), (500, movie_id, 3.0)])
+        
+        self.assertEqual(result, {'users': 2, 'movies': 1})
+        self.assertEqual(self.recommender.user_movie_matrix.loc[user_id, movie_id], 4.0)
+        self.assertIn(500, self.recommender.user_movie_matrix.index)
+        n_users = len(self.recommender.user_movie_matrix.index)
+        self.assertEqual(self.recommender.user_similarity_matrix.shape, (n_users, n_users))
+    
+    def test_delta_refresh(self):
+        """Test that refresh applies only ratings changed since the last load"""
+        recommender = MovieRecommender(n_clusters=3, max_patched_fraction=1.0)
+        self.assertEqual(recommender.refresh()['mode'], 'none')
+        
+        user_id = self.users[3].id
+        movie_id = self.movies[7].id
+        upsert_rating(self.db, user_id, movie_id, 2.5)
+        self.db.commit()
+        
+        result = recommender.refresh(max_churn=1.0)
+        self.assertEqual(result['mode'], 'delta')
+        self.assertEqual(result['rows'], 1)
+        self.assertEqual(recommender.user_movie_matrix.loc[user_id, movie_id], 2.5)
+        self.assertEqual(recommender.refresh()['mode'], 'none')
+        recommender.close()
+    
+    def test_refresh_late_commit(self):
+        """Test that refresh picks up a row stamped before the high-water mark but committed after it"""
+        recommender = MovieRecommender(n_clusters=3, max_patched_fraction=1.0)
+        user_id = self.users[2].id
+        movie_id = self.movies[8].id
+        late = recommender.high_water_mark - timedelta(seconds=30)
+        upsert_ratings(self.db, [{"user_id": user_id, "movie_id": movie_id, "rating": 3.5, "watched_at": late}])
+        self.db.commit()
+        
+        result = recommender.refresh(max_churn=1.0)
+        self.assertEqual((result['mode'], result['rows']), ('delta', 1))
+        self.assertEqual(recommender.user_movie_matrix.loc[user_id, movie_id], 3.5)
+        self.assertEqual(recommender.refresh()['mode'], 'none')
+        recommender.close()
+    
+    def test_apply_ratings_copy_on_write(self):
+        """Test that applying ratings publishes a new state and leaves the old one untouched"""
+        recommender = MovieRecommender(n_clusters=3, max_patched_fraction=1.0)
+        matrix, version = recommender.user_movie_matrix, recommender.model_version
+        user_id = self.users[4].id
+        movie_id = self.movies[0].id
+        before = matrix.loc[user_id, movie_id]
+        
+        recommender.apply_ratings([(user_id, movie_id, 0.5)])
+        self.assertEqual(matrix.loc[user_id, movie_id], before)
+        self.assertEqual(recommender.user_movie_matrix.loc[user_id, movie_id], 0.5)
+        self.assertEqual(recommender.model_version, version + 1)
+        recommender.close()
+    
+    def test_apply_ratings_rebuilds_when_too_patched(self):
+        """Test an apply that leaves too many users changed since the build rebuilds instead"""
+        recommender = MovieRecommender(n_clusters=3, max_patched_fraction=0.0)
+        user_id = self.users[2].id
+        movie_id = self.movies[4].id
+        upsert_rating(self.db, user_id, movie_id, 2.0)
+        self.db.commit()
+        
+        recommender.apply_ratings([(user_id, movie_id, 2.0)])
+        self.assertEqual(len(recommender.user_similarity_matrix.changed), 0)
+        self.assertEqual(recommender.build_report['model_version'], recommender.model_version)
+        self.assertEqual(recommender.user_movie_matrix.loc[user_id, movie_id], 2.0)
+        recommender.close()
+    
+    def test_spilled_rebuild_keeps_old_state(self):
+        """Test a spilled rebuild writes new files and leaves the arrays of the previous state unchanged"""
+        with tempfile.TemporaryDirectory() as spill_dir:
+            recommender = MovieRecommender(n_clusters=3, similarity_top_k=2, similarity_spill_dir=spill_dir)
+            state = recommender._state
+            indices, scores = state.movie_neighbors
+            self.assertIsInstance(scores, np.memmap)
+            before = np.array(indices), np.array(scores)
+            
+            upsert_rating(self.db, self.users[0].id, self.movies[3].id, 0.5)
+            self.db.commit()
+            recommender.rebuild()
+            self.assertIsNot(recommender._state, state)
+            self.assertNotEqual(recommender.movie_neighbors[1].filename, scores.filename)
+            np.testing.assert_array_equal(indices, before[0])
+            np.testing.assert_array_equal(scores, before[1])
+            recommender.close()
+    
+    def test_fingerprint_tracks_ratings(self):
+        """Test the fingerprint changes with any rating change and with the updates behind the neighbour lists"""
+        first = MovieRecommender(n_clusters=3, max_patched_fraction=1.0)
+        second = MovieRecommender(n_clusters=3, max_patched_fraction=1.0)
+        same_updates = MovieRecommender(n_clusters=3, max_patched_fraction=1.0)
+        users = [self.users[0].id, self.users[1].id]
+        movie_id = self.movies[1].id
+        
+        # Swapping two ratings of a movie leaves its column sum unchanged
+        first.apply_ratings([(users[0], movie_id, 1.5), (users[1], movie_id, 4.5)])
+        second.apply_ratings([(users[0], movie_id, 4.5), (users[1], movie_id, 1.5)])
+        same_updates.apply_ratings([(users[0], movie_id, 1.5), (users[1], movie_id, 4.5)])
+        self.assertNotEqual(first.model_fingerprint(), second.model_fingerprint())
+        self.assertEqual(first.model_fingerprint(), same_updates.model_fingerprint())
+        
+        # A full build of the same ratings has fresh neighbour lists for every movie
+        upsert_ratings(self.db, [{"user_id": users[0], "movie_id": movie_id, "rating": 1.5},
+                                 {"user_id": users[1], "movie_id": movie_id, "rating": 4.5}])
+        self.db.commit()
+        rebuilt = MovieRecommender(n_clusters=3)
+        rebuilt_again = MovieRecommender(n_clusters=3)
+        self.assertNotEqual(first.model_fingerprint(), rebuilt.model_fingerprint())
+        self.assertEqual(rebuilt.model_fingerprint(), rebuilt_again.model_fingerprint())
+        # The shared fingerprint (L2 cache scope) only depends on the ratings
+        self.assertEqual(first.model_fingerprint(shared=True), rebuilt.model_fingerprint(shared=True))
+        self.assertNotEqual(first.model_fingerprint(shared=True), second.model_fingerprint(shared=True))
+        for recommender in (first, second, same_updates, rebuilt, rebuilt_again):
+            recommender.close()
+    
+    def test_content_similar_movies(self):
+        """Test content similarity ranks by the content index, without the movie itself"""
+        movie_id = self.movies[0].id
+        rows = self.recommender.similar_movie_rows(movie_id, 3, method="content")
+        expected_ids, expected_scores = self.recommender.content_index.neighbors(movie_id, 3)
+        self.assertEqual([row.movie_id for row in rows], expected_ids.tolist())
+        np.testing.assert_allclose([row.similarity_score for row in rows], expected_scores)
+        self.assertNotIn(movie_id, [row.movie_id for row in rows])
+    
+    def test_hybrid_similar_movies(self):
+        """Test hybrid scores blend rating and content similarity by hybrid_content_weight"""
+        movie_id = self.movies[0].id
+        rows = self.recommender.similar_movie_rows(movie_id, 3, method="hybrid")
+        scores = [row.similarity_score for row in rows]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertNotIn(movie_id, [row.movie_id for row in rows])
+        
+        # With all weight on content, hybrid scores are the content similarities
+        recommender = MovieRecommender(n_clusters=3, hybrid_content_weight=1.0)
+        rows = recommender.similar_movie_rows(movie_id, 3, method="hybrid")
+        np.testing.assert_allclose(
+            [row.similarity_score for row in rows],
+            recommender.content_index.similarity(movie_id, [row.movie_id for row in rows])
+        )
+        recommender.close()
+    
+    def test_unrated_movie_uses_content(self):
+        """Test movies nobody rated get content neighbours whatever the method"""
+        movie_id = self.movies[6].id
+        self.assertNotIn(movie_id, self.recommender.user_movie_matrix.columns)
+        expected = self.recommender.similar_movie_rows(movie_id, 3, method="content")
+        self.assertTrue(expected)
+        for method in ("collaborative", "hybrid"):
+            self.assertEqual(self.recommender.similar_movie_rows(movie_id, 3, method=method), expected)
+        with self.assertRaises(ValueError):
+            self.recommender.similar_movie_rows(movie_id, 3, method="euclidean")
+    
+    def test_add_movie_similar(self):
+        """Test a movie added after the build gets content neighbours and changes the fingerprint"""
+        recommender = MovieRecommender(n_clusters=3)
+        fingerprint = recommender.model_fingerprint()
+        movie = Movie(id=10 ** 6 + 1, title="Added Action Movie", genre=self.movies[0].genre,
+                      release_year=self.movies[0].release_year, duration=self.movies[0].duration,
+                      description="Added after the build")
+        with self.assertRaises(ValueError):
+            recommender.similar_movie_rows(movie.id, 3)
+        
+        recommender.add_movie(movie)
+        self.assertNotEqual(recommender.model_fingerprint(), fingerprint)
+        rows = recommender.similar_movie_rows(movie.id, 3)
+        self.assertEqual(rows[0].movie_id, self.movies[0].id)
+        self.assertAlmostEqual(rows[0].similarity_score, 1.0)
+        # Existing movies find the new one by content too
+        self.assertIn(movie.id, [row.movie_id for row in recommender.similar_movie_rows(self.movies[0].id, 3,
+                                                                                         method="content")])
+        recommender.close()
+    
+    def test_add_movie_listed(self):
+        """Test that a movie added after the build is listed right away, but not in any cluster"""
+        recommender = MovieRecommender(n_clusters=3)
+        movie = Movie(id=10 ** 6, title="Added Movie", genre="Drama", release_year=2020, duration=100,
+                      description="Added after the build")
+        recommender.add_movie(movie)
+        
+        catalog, ids = recommender.listing()
+        self.assertEqual(ids[-1], movie.id)
+        self.assertEqual(catalog.records[movie.id]['title'], "Added Movie")
+        for cluster_id in range(recommender.n_clusters):
+            self.assertNotIn(movie.id, recommender.listing_ids(cluster_id))
+        recommender.close()
+    
+    def test_cold_start_user(self):
+        """Test recommendations for a user added after the model was built"""
+        user = User(username="cold_start_user", email="cold_start_user@example.com")
+        self.db.add(user)
+        self.db.commit()
+        
+        report = {}
+        ranked = self.recommender.rank_movies(user.id, 3, report=report)
+        self.assertEqual(report['cold_start'], 'popular')
+        self.assertEqual(len(ranked), 3)
+        
+        upsert_rating(self.db, user.id, self.movies[0].id, 5.0)
+        self.db.commit()
+        report = {}
+        ranked = self.recommender.rank_movies(user.id, 3, report=report)
+        self.assertEqual(report['cold_start'], 'fold_in')
+        self.assertNotIn(self.movies[0].id, [movie_id for movie_id, _ in ranked])
+    
+    def test_popular_fallback_without_database(self):
+        """Test the popularity fallback serves users outside the model without a database read"""
+        rows = self.recommender.fallback_recommendation_rows(999999, 3, use_neighbors=False)
+        self.assertEqual(len(rows), 3)
+        with self.assertRaises(ValueError):
+            self.recommender.fallback_recommendation_rows(999999, 3)
+    
     def test_invalid_user_id(self):
         """Test handling of invalid user ID"""
         with self.assertRaises(ValueError):
@@ -0,0 +1,86 @@
+import unittest
+import tempfile
+import tracemalloc
+import numpy as np
+from scipy import sparse
+from sklearn.metrics.pairwise import cosine_similarity
+from similarity import (blocked_top_k_similarity, neighbors_to_sparse, block_size_for_budget, _normalize_rows, _tile_top_k,
+                        PatchedSimilarity)
+
+class TestBlockedSimilarity(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Create a random ratings matrix and its exact top-k neighbours"""
+        rng = np.random.default_rng(42)
+        cls.ratings = rng.uniform(0, 5, size=(37, 12)) * (rng.random((37, 12)) > 0.5)
+        cls.k = 5
+
+        similarity = cosine_similarity(cls.ratings)
+        np.fill_diagonal(similarity, -np.inf)
+        cls.expected_scores = -np.sort(-similarity, axis=1)[:, :cls.k]
+
+    def assert_matches_exact(self, indices, scores):
+        self.assertEqual(indices.shape, (37, self.k))
+        np.testing.assert_allclose(scores, self.expected_scores, rtol=1e-5, atol=1e-5)
+        for row in range(indices.shape[0]):
+            self.assertNotIn(row, indices[row])
+
+    def test_thread_backend(self):
+        """Test tiled top-k matches the full similarity matrix"""
+        indices, scores = blocked_top_k_similarity(self.ratings, k=self.k, block_size=4, n_jobs=3)
+        self.assert_matches_exact(indices, scores)
+
+    def test_process_backend_with_spill(self):
+        """Test process pool with results spilled to memory-mapped files"""
+        with tempfile.TemporaryDirectory() as spill_dir:
+            indices, scores = blocked_top_k_similarity(
+                self.ratings, k=self.k, block_size=8, n_jobs=2, backend="process", spill_dir=spill_dir
+            )
+            self.assertIsInstance(indices, np.memmap)
+            self.assert_matches_exact(np.array(indices), np.array(scores))
+            del indices, scores
+
+    def test_sparse_input(self):
+        """Test sparse matrices give the same neighbours"""
+        indices, scores = blocked_top_k_similarity(sparse.csr_matrix(self.ratings), k=self.k, block_size=10)
+        self.assert_matches_exact(indices, scores)
+
+        matrix = neighbors_to_sparse(indices, scores)
+        self.assertEqual(matrix.shape, (37, 37))
+        self.assertEqual(matrix.nnz, 37 * self.k)
+
+    def test_tile_within_memory_budget(self):
+        """Test one tile's peak allocation, temporaries included, stays within the budget"""
+        rng = np.random.default_rng(0)
+        ratings = rng.random((3000, 40)) * (rng.random((3000, 40)) > 0.3)
+        budget_mb = 0.5
+        for matrix in (ratings, sparse.csr_matrix(ratings)):
+            normalized = _normalize_rows(matrix)
+            transposed = normalized.T.tocsr() if sparse.issparse(normalized) else None
+            block_size = block_size_for_budget(3000, budget_mb, sparse.issparse(normalized))
+            tracemalloc.start()
+            try:
+                start = tracemalloc.get_traced_memory()[0]
+                _tile_top_k(normalized, slice(0, block_size), 10, True, transposed)
+                peak = tracemalloc.get_traced_memory()[1] - start
+            finally:
+                tracemalloc.stop()
+            self.assertLessEqual(peak, budget_mb * 1024 * 1024)
+
+    def test_patched_similarity(self):
+        """Test changed and added rows read like a full recompute without copying the base matrix"""
+        similarity = PatchedSimilarity(cosine_similarity(self.ratings), self.ratings)
+        rng = np.random.default_rng(1)
+        updated = np.vstack([self.ratings, rng.uniform(0, 5, size=(3, 12))])
+        updated[[2, 30]] = rng.uniform(0, 5, size=(2, 12))
+        patched = similarity.updated(updated, [2, 30, 37, 38, 39])
+
+        self.assertIs(patched.base, similarity.base)
+        self.assertEqual(patched.shape, (40, 40))
+        expected = cosine_similarity(updated)
+        for row in (0, 2, 30, 39):
+            np.testing.assert_allclose(patched[row], expected[row])
+        np.testing.assert_allclose(similarity[2], cosine_similarity(self.ratings)[2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+from datetime import datetime, timezone
+import numpy as np
+from trending import TrendingEngine, TrendingWindow
+
+class TestTrending(unittest.TestCase):
+    def setUp(self):
+        self.engine = TrendingEngine([TrendingWindow("hour", bucket_seconds=60, n_buckets=60, half_life_seconds=600, top_size=3)])
+        self.now = 1_700_000_000 // 60 * 60
+
+    def test_decay_and_expiry(self):
+        """Test older watches weigh less and leave the window"""
+        self.engine.record(1, 4.0, self.now - 600)
+        self.engine.record(1, 2.0, self.now - 600)
+        self.engine.record(2, 5.0, self.now)
+        top = self.engine.top("hour", 2, timestamp=self.now)
+        self.assertEqual([movie_id for movie_id, *_ in top], [2, 1])
+        self.assertAlmostEqual(top[1][1], 1.0)  # two watches, one half-life old
+        self.assertEqual(top[1][2], 2)
+        self.assertAlmostEqual(top[1][3], 3.0)
+
+        top = self.engine.top("hour", 2, timestamp=self.now + 3300)
+        self.assertEqual([movie_id for movie_id, *_ in top], [2])
+
+    def test_incremental_top_matches_full_ranking(self):
+        """Test the incrementally kept top list matches ranking every movie"""
+        rng = np.random.default_rng(0)
+        for movie_id, offset in zip(rng.integers(1, 20, 500), rng.integers(0, 1800, 500)):
+            self.engine.record(int(movie_id), 3.0, self.now - 1800 + int(offset))
+        window = self.engine.windows["hour"]
+        top = self.engine.top("hour", 3, timestamp=self.now)
+        expected = np.sort(window.scores)[::-1][:3]
+        np.testing.assert_allclose([score for _, score, *_ in top], expected)
+
+    def test_seed_from_watched_at(self):
+        """Test seeding from naive UTC watched_at values"""
+        watched_at = datetime.fromtimestamp(self.now, tz=timezone.utc).replace(tzinfo=None)
+        self.engine.seed([(5, 4.0, watched_at), (6, None, None)])
+        self.assertEqual(self.engine.top("hour", 5, timestamp=self.now), [(5, 1.0, 1, 4.0)])
+        with self.assertRaises(ValueError):
+            self.engine.top("week")
+
+if __name__ == '__main__':
+    unittest.main()
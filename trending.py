@@ -0,0 +1,203 @@
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+def to_timestamp(value: datetime) -> float:
+    """Epoch seconds of a naive UTC datetime (as stored in watched_at)"""
+    return value.replace(tzinfo=timezone.utc).timestamp() if value.tzinfo is None else value.timestamp()
+
+
+class TrendingWindow:
+    """
+    Decayed per-movie watch counts over a sliding window of time buckets
+
+    Counts live in a ring buffer of n_buckets buckets of bucket_seconds each.
+    A movie's score is its watch count per bucket weighted by
+    0.5 ** (bucket age / half-life), so the current bucket weighs 1. Scores are
+    updated in place per event and recomputed only when the window moves to a
+    new bucket, and the best top_size movies are kept sorted, so reading the
+    top-k never scans all movies.
+    """
+
+    def __init__(self, name: str, bucket_seconds: int, n_buckets: int, half_life_seconds: float,
+                 top_size: int = 100, capacity: int = 1024):
+        self.name = name
+        self.bucket_seconds = bucket_seconds
+        self.n_buckets = n_buckets
+        self.top_size = top_size
+        self.decay = 0.5 ** (bucket_seconds / half_life_seconds)
+        self.current = None
+        self.watches = np.zeros((n_buckets, capacity))
+        self.rating_sums = np.zeros((n_buckets, capacity))
+        self.scores = np.zeros(capacity)
+        self.rating_scores = np.zeros(capacity)
+        self.totals = np.zeros(capacity)
+        self._top: List[int] = []
+
+    def _grow(self, capacity: int):
+        """Make room for more movie positions"""
+        grow = capacity - len(self.scores)
+        if grow <= 0:
+            return
+        self.watches = np.pad(self.watches, ((0, 0), (0, grow)))
+        self.rating_sums = np.pad(self.rating_sums, ((0, 0), (0, grow)))
+        self.scores = np.pad(self.scores, (0, grow))
+        self.rating_scores = np.pad(self.rating_scores, (0, grow))
+        self.totals = np.pad(self.totals, (0, grow))
+
+    def _weights(self) -> np.ndarray:
+        """
+        Decay weight of each ring slot relative to the current bucket
+
+        Every slot gets a weight: the ring holds exactly the window, and slots of
+        expired buckets are cleared by advance() before they are reused.
+        """
+        ages = (self.current - np.arange(self.n_buckets)) % self.n_buckets
+        return self.decay ** ages
+
+    def advance(self, bucket: int):
+        """Move the window forward to the given absolute bucket number"""
+        if self.current is None:
+            self.current = bucket
+            return
+        if bucket <= self.current:
+            return
+        steps = min(bucket - self.current, self.n_buckets)
+        for step in range(1, steps + 1):
+            slot = (self.current + step) % self.n_buckets
+            self.totals -= self.watches[slot]
+            self.watches[slot] = 0
+            self.rating_sums[slot] = 0
+        self.current = bucket
+        # Rescore from the buckets once per move, so float drift never accumulates
+        weights = self._weights()
+        self.scores = weights @ self.watches
+        self.rating_scores = weights @ self.rating_sums
+        np.clip(self.totals, 0, None, out=self.totals)
+        self._rebuild_top()
+
+    def _rebuild_top(self):
+        active = np.flatnonzero(self.scores > 0)
+        if len(active) > self.top_size:
+            active = active[np.argpartition(-self.scores[active], self.top_size - 1)[:self.top_size]]
+        self._top = [int(position) for position in active[np.argsort(-self.scores[active], kind='stable')]]
+
+    def add(self, position: int, rating: Optional[float], timestamp: float):
+        """Count one watch (and rating) of the movie at the given position"""
+        bucket = int(timestamp // self.bucket_seconds)
+        self.advance(bucket)
+        age = self.current - bucket
+        if age >= self.n_buckets:
+            return
+        if position >= len(self.scores):
+            self._grow(max(position + 1, 2 * len(self.scores)))
+        slot = bucket % self.n_buckets
+        weight = self.decay ** age
+        self.watches[slot, position] += 1
+        self.totals[position] += 1
+        self.scores[position] += weight
+        if rating is not None:
+            self.rating_sums[slot, position] += rating
+            self.rating_scores[position] += weight * rating
+
+        # Scores only grow between window moves, so only this movie can change places
+        if position in self._top:
+            self._top.remove(position)
+        elif len(self._top) >= self.top_size and self.scores[position] <= self.scores[self._top[-1]]:
+            return
+        index = len(self._top)
+        while index > 0 and self.scores[self._top[index - 1]] < self.scores[position]:
+            index -= 1
+        self._top.insert(index, position)
+        del self._top[self.top_size:]
+
+    def top(self, k: int, timestamp: float) -> List[Tuple[int, float, int, Optional[float]]]:
+        """
+        Best k movie positions by decayed watch count
+
+        Returns:
+            List of (position, score, watches in window, decayed average rating)
+        """
+        self.advance(int(timestamp // self.bucket_seconds))
+        return [
+            (
+                position,
+                float(self.scores[position]),
+                int(self.totals[position]),
+                float(self.rating_scores[position] / self.scores[position]) if self.rating_scores[position] else None
+            )
+            for position in self._top[:k]
+        ]
+
+
+class TrendingEngine:
+    """Trending movies over several windows, fed by watch events"""
+
+    def __init__(self, windows: List[TrendingWindow]):
+        self.windows: Dict[str, TrendingWindow] = {window.name: window for window in windows}
+        self._positions: Dict[int, int] = {}
+        self._movie_ids: List[int] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def default(cls) -> "TrendingEngine":
+        """Last hour in one-minute buckets and last day in one-hour buckets"""
+        return cls([
+            TrendingWindow("hour", bucket_seconds=60, n_buckets=60, half_life_seconds=15 * 60),
+            TrendingWindow("day", bucket_seconds=3600, n_buckets=24, half_life_seconds=6 * 3600),
+        ])
+
+    @property
+    def span_seconds(self) -> int:
+        """Length of the longest window"""
+        return max(window.bucket_seconds * window.n_buckets for window in self.windows.values())
+
+    def _position(self, movie_id: int) -> int:
+        position = self._positions.get(movie_id)
+        if position is None:
+            position = self._positions[movie_id] = len(self._movie_ids)
+            self._movie_ids.append(movie_id)
+        return position
+
+    def record(self, movie_id: int, rating: Optional[float] = None, timestamp: Optional[float] = None):
+        """Count one watch of a movie in every window (timestamp defaults to now)"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            position = self._position(movie_id)
+            for window in self.windows.values():
+                window.add(position, rating, timestamp)
+
+    def seed(self, rows: Iterable[Tuple[int, Optional[float], datetime]]):
+        """
+        Load past watches, e.g. user_movie_watches rows inside the longest window
+
+        Args:
+            rows: (movie_id, rating, watched_at) tuples with naive UTC datetimes
+        """
+        for movie_id, rating, watched_at in sorted(
+            (row for row in rows if row[2] is not None), key=lambda row: row[2]
+        ):
+            self.record(movie_id, rating, to_timestamp(watched_at))
+
+    def top(self, window: str, k: int = 10, timestamp: Optional[float] = None) -> List[Tuple[int, float, int, Optional[float]]]:
+        """
+        Trending movies of a window
+
+        Returns:
+            List of (movie_id, score, watches in window, decayed average rating), best first
+
+        Raises:
+            ValueError: If the window does not exist
+        """
+        if window not in self.windows:
+            raise ValueError(f"Unknown window: {window}")
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            return [
+                (self._movie_ids[position], score, watches, average)
+                for position, score, watches, average in self.windows[window].top(k, timestamp)
+            ]